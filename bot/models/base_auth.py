@@ -4,6 +4,10 @@ from .handlers_input import Person, Context
 
 
 class BasePermission(ABC):
+    # Set on permissions that read Context.is_group_admin, so that platforms
+    # only resolve the (remote) admin state when a handler needs it
+    requires_group_admin: bool = False
+
     @abstractmethod
     async def check(self, person: Person, context: Context) -> bool:
         raise NotImplementedError(
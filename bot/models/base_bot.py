@@ -5,6 +5,14 @@ from .base_handlers import BaseCommandHandler, BaseMessageHandler, BaseCallbackH
 
 
 class BaseBot(ABC):
+    async def startup(self) -> None:
+        """Hook awaited once by the platform bot before handling updates"""
+        pass
+
+    async def shutdown(self) -> None:
+        """Hook awaited once by the platform bot after it stopped handling updates"""
+        pass
+
     @property
     @abstractmethod
     def commands(self) -> List[BaseCommandHandler]:
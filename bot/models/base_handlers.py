@@ -47,6 +47,10 @@ class BaseHandler(ABC):
     def permissions(self) -> List[BasePermission]:
         return self._initialized_permissions
 
+    @property
+    def requires_group_admin(self) -> bool:
+        return any(permission.requires_group_admin for permission in self.permissions)
+
     async def _get_terms_keyboard(
         self, context: Optional[Context] = None
     ) -> KeyboardResponse:
@@ -1,6 +1,11 @@
+from .bot_config import AgentConfig as AgentConfig
+from .bot_config import AutofactConfig as AutofactConfig
 from .bot_config import BotConfig as BotConfig
+from .bot_config import CacheConfig as CacheConfig
+from .bot_config import EngageConfig as EngageConfig
 from .bot_config import MessageStorageConfig as MessageStorageConfig
 from .bot_config import MemoryConfig as MemoryConfig
 from .default_chat_modes import DefaultChatModes as DefaultChatModes
 from .localizer_translations import LocalizerTranslations as LocalizerTranslations
 from .tg_config import TGConfig as TGConfig
+from .tg_config import WebhookConfig as WebhookConfig
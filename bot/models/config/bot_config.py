@@ -1,4 +1,4 @@
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
 from pydantic import Field
 from .base_config import BaseYAMLConfigModel
@@ -8,6 +8,7 @@ class MessageStorageConfig(BaseYAMLConfigModel):
     mode: Literal["off", "ephemeral", "persistent_recent", "persistent_full"] = (
         "persistent_recent"
     )
+    layout: Literal["documents", "buckets"] = "documents"
     ttl_seconds: int = 21600
     max_messages: int = 50
 
@@ -28,12 +29,51 @@ class MemoryConfig(BaseYAMLConfigModel):
     ] = "disabled"
     provider_state_ttl_hours: int = 24
     fallback_last_n_messages: int = 6
+    fact_search_limit: int = 10
+    prompt_token_budget: int = 6000
     summary_enabled: bool = False
     summary_token_target: int = 800
     shadow_mode: bool = False
     agent_model: Optional[str] = None
 
 
+class CacheConfig(BaseYAMLConfigModel):
+    max_chats: int = 10000
+    language_ttl_seconds: int = 300
+    max_bootstrapped_pairs: int = 50000
+    bootstrap_ttl_seconds: int = 3600
+    max_users: int = 50000
+    access_state_ttl_seconds: int = 60
+    facts_ttl_seconds: int = 300
+    history_ttl_seconds: int = 300
+    max_media_transcriptions: int = 1000
+    media_transcription_ttl_seconds: int = 86400
+
+
+class EngageConfig(BaseYAMLConfigModel):
+    min_message_chars: int = 3
+    bot_names: List[str] = Field(default_factory=list)
+    # Only questions of 27+ words that start with a question word and
+    # address "you" reach it, everything between the thresholds asks the LLM
+    scorer_engage_threshold: float = 0.98
+    scorer_skip_threshold: float = 0.2
+    debounce_seconds: float = 3.0
+    max_debounce_seconds: float = 15.0
+    # Per-stage decision counts are logged every that many decisions
+    stats_log_interval: int = 100
+
+
+class AutofactConfig(BaseYAMLConfigModel):
+    poll_interval_seconds: float = 30
+    batch_size: int = 10
+    lease_seconds: float = 300
+    max_attempts: int = 3
+
+
+class AgentConfig(BaseYAMLConfigModel):
+    speculative_text_stream: bool = True
+
+
 class BotConfig(BaseYAMLConfigModel):
     default_language: str
     last_n_messages_to_remember: int
@@ -41,3 +81,7 @@ class BotConfig(BaseYAMLConfigModel):
     default_usage_limit: int
     message_storage: MessageStorageConfig = Field(default_factory=MessageStorageConfig)
     memory: MemoryConfig = Field(default_factory=MemoryConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    engage: EngageConfig = Field(default_factory=EngageConfig)
+    autofact: AutofactConfig = Field(default_factory=AutofactConfig)
+    agent: AgentConfig = Field(default_factory=AgentConfig)
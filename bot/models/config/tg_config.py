@@ -1,9 +1,35 @@
+from typing import Optional
+
+from pydantic import Field
+
 from .base_config import BaseYAMLConfigModel
 
 
+class WebhookConfig(BaseYAMLConfigModel):
+    # Single replica only, several bot caches are kept per process
+    enabled: bool = False
+    listen: str = "0.0.0.0"
+    port: int = 8443
+    url_path: str = "telegram"
+    # Public base url registered with Telegram, e.g. https://bot.example.com
+    public_url: Optional[str] = None
+    # The secret token is read from the TELEGRAM_WEBHOOK_SECRET variable only
+    max_connections: int = 40
+
+
 class TGConfig(BaseYAMLConfigModel):
     new_dialog_timeout: int
     enable_message_streaming: bool
     n_chat_modes_per_page: int
-    stream_buffer_sleep_time: float
     rate_limiter_max_retries: int
+    admin_cache_ttl_seconds: int = 300
+    admin_cache_max_chats: int = 10000
+    private_chat_edit_interval: float = 1.0
+    group_chat_edit_interval: float = 3.0
+    global_edits_per_second: float = 25.0
+    webhook: WebhookConfig = Field(default_factory=WebhookConfig)
+    # Telegram's 800px size (about 0.5 MP) meets it, the 1280px one is skipped
+    photo_pixel_budget: Optional[int] = 512 * 512
+    # Needs Pillow from the images extra
+    downscale_photos: bool = False
+    photo_jpeg_quality: int = 85
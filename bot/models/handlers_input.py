@@ -1,8 +1,8 @@
 import io
 from datetime import datetime
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 
 
 class Person(BaseModel):
@@ -23,13 +23,33 @@ class Context(BaseModel):
     replied_to_user_handle: Optional[str] = None
 
 
+class MediaHandle(BaseModel):
+    """Media attached to a message, downloaded only when its content is needed"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    file_id: str
+    # Platform id that stays the same for the same media content
+    file_unique_id: Optional[str] = None
+    file_size: Optional[int] = None
+    duration: Optional[int] = None
+    loader: Callable[[], Awaitable[io.BytesIO]] = Field(exclude=True, repr=False)
+    _content: Optional[io.BytesIO] = PrivateAttr(default=None)
+
+    async def load(self) -> io.BytesIO:
+        if self._content is None:
+            self._content = await self.loader()
+        self._content.seek(0)
+        return self._content
+
+
 class Message(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     message_text: str
     timestamp: datetime
-    in_file_image: Optional[io.BytesIO] = None
-    in_file_audio: Optional[io.BytesIO] = None
+    in_file_image: Optional[MediaHandle] = None
+    in_file_audio: Optional[MediaHandle] = None
 
 
 class BotInput(BaseModel):
@@ -1,33 +1,49 @@
 import io
 import asyncio
+import hashlib
 from datetime import datetime
+from functools import lru_cache
 from typing import (
     Optional,
-    Union,
     AsyncGenerator,
+    Awaitable,
+    Callable,
+    Collection,
     List,
     Protocol,
+    Tuple,
     Type,
     Literal,
 )
 from logging import Logger
+from bson import ObjectId
 from pydantic import BaseModel, Field, ConfigDict, create_model
 from omnimodkit.models_toolkit import ModelsToolkit, AvailableModelType
 from omnimodkit.base_toolkit_model import OpenAIMessage
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from .agent_toolkit import AIAgentToolkit
+from .speculative_stream import SpeculativeStream
 from ...prompt_manager import PromptManager
 from ...memory_manager import MemoryManager
 from ...agent_runtime import AgentInput, MemoryState
 from ...openai_agents_runtime import OpenAIAgentsRuntime
+from ...storage import ChatSettings
 from ...memory_utils import get_participant_key
-from ....models.handlers_input import Person, Context, Message, TranscribedMessage
+from ....models.cache import TTLCache
+from ....models.config import AgentConfig
+from ....models.handlers_input import (
+    Person,
+    Context,
+    Message,
+    MediaHandle,
+    TranscribedMessage,
+)
 
 
 class AIAgentResponseOutputTypeModel(Protocol):
     """Protocol for dynamically created models with output_type field."""
 
-    output_type: Union[type, object]
+    output_type: str
 
 
 class TextStreamingResponse(BaseModel):
@@ -83,33 +99,55 @@ class TextWithImageStreamingResponse(BaseModel):
     )
 
 
-class ChatFact(BaseModel):
-    user_fact: str = Field(description="a fact about the user")
-    user_handle: str = Field(
-        description="the user's handle (e.g., '@username'), NOT their display name or first name"
+OUTPUT_TYPES = {
+    output_type.__name__: output_type
+    for output_type in (
+        TextStreamingResponse,
+        AudioResponse,
+        TextWithImageStreamingResponse,
     )
+}
 
 
-class ResponseFactsGeneration(BaseModel):
-    facts_generation_needed: bool = Field(
-        default=False,
-        description=(
-            "Indicates if the response requires facts generation. "
-            "Note that the fact extraction is called on each user message, "
-            "so you need to be very sure that the facts generation is needed. "
-            "Only when a very important fact that is clearly truthful and cannot be easily inferred from the context, "
-            "should you set this to True and generate the facts."
-        ),
+@lru_cache(maxsize=None)
+def build_output_type_model(
+    output_types: Tuple[type, ...],
+) -> Type[AIAgentResponseOutputTypeModel]:
+    """
+    Create the output type model for a set of allowed output types once.
+    The model only names the output type, its content is generated separately.
+    """
+    type_descriptions = "\n".join(
+        f"{output_type.__name__}: {' '.join((output_type.__doc__ or '').split())}"
+        for output_type in output_types
     )
-    user_facts: Optional[List[ChatFact]] = Field(
-        default=None,
-        description=(
-            "List of facts about the user. Be resourceful and generate facts only when necessary. "
-            "If facts are not needed, set this field to null."
+    return create_model(
+        "DynamicAIAgentStreamingResponseType",
+        output_type=(
+            Literal[tuple(output_type.__name__ for output_type in output_types)],
+            Field(
+                description=(
+                    "Type of output expected from the model:\n" + type_descriptions
+                )
+            ),
         ),
     )
 
 
+def get_media_cache_key(
+    kind: str, media_id: Optional[str] = None, content: Optional[io.BytesIO] = None
+) -> Optional[str]:
+    """
+    Key media by its platform id, or by a hash of its content without one.
+    """
+    if media_id:
+        return f"{kind}:id:{media_id}"
+    if content is None:
+        return None
+    with content.getbuffer() as buffer:
+        return f"{kind}:sha256:{hashlib.sha256(buffer).hexdigest()}"
+
+
 class AIAgentStreamingResponse(BaseModel):
     model_config = ConfigDict(
         arbitrary_types_allowed=True,
@@ -148,9 +186,6 @@ class AIAgentStreamingResponse(BaseModel):
         description="Total price of the model response based on input and output.",
     )
     transcribed_user_message: TranscribedMessage = Field(default=None)
-    generated_facts: List[ChatFact] = Field(
-        default_factory=list, description="Generated facts about the users in the chat."
-    )
 
 
 class AIAgent:
@@ -163,8 +198,11 @@ class AIAgent:
         models_toolkit: ModelsToolkit,
         prompt_manager: PromptManager,
         memory_manager: MemoryManager,
-        autofact_enabled: bool,
         logger: Logger,
+        chat_settings: Optional[ChatSettings] = None,
+        agent_config: Optional[AgentConfig] = None,
+        media_transcriptions: Optional[TTLCache[str, str]] = None,
+        exclude_message_ids: Collection[ObjectId] = (),
     ):
         self.person = person
         self.context = context
@@ -177,29 +215,31 @@ class AIAgent:
             person, context, message, db, models_toolkit, prompt_manager
         )
         self.models_toolkit = models_toolkit
-        self.autofact_enabled = autofact_enabled
         self.logger = logger
+        self.chat_settings = chat_settings
+        self.agent_config = agent_config or AgentConfig()
+        self.media_transcriptions = media_transcriptions
+        # The user message may already be persisted, it is not history then
+        self.exclude_message_ids = exclude_message_ids
 
     async def _get_transcribed_message(self) -> TranscribedMessage:
         # Note that here the responsibility to pass NULL images and Audio is on the
         # outer level bot processing (TG bot or other bot)
-        image_description = (
-            str(
-                await self.models_toolkit.vision_model.arun_default(
-                    in_memory_image_stream=self.message.in_file_image
-                )
-            )
-            if self.message.in_file_image
-            else None
-        )
-        voice_description = (
-            str(
-                await self.models_toolkit.audio_recognition_model.arun_default(
-                    in_memory_audio_stream=self.message.in_file_audio
-                )
-            )
-            if self.message.in_file_audio
-            else None
+        image_description, voice_description = await asyncio.gather(
+            self._describe_media(
+                "image",
+                self.message.in_file_image,
+                lambda content: self.models_toolkit.vision_model.arun_default(
+                    in_memory_image_stream=content
+                ),
+            ),
+            self._describe_media(
+                "audio",
+                self.message.in_file_audio,
+                lambda content: self.models_toolkit.audio_recognition_model.arun_default(
+                    in_memory_audio_stream=content
+                ),
+            ),
         )
         return TranscribedMessage(
             message_text=self.message.message_text,
@@ -208,6 +248,34 @@ class AIAgent:
             voice_description=voice_description,
         )
 
+    async def _describe_media(
+        self,
+        kind: str,
+        media: Optional[MediaHandle],
+        describe: Callable[[io.BytesIO], Awaitable[object]],
+    ) -> Optional[str]:
+        """
+        Describe the media once per distinct content, reusing cached descriptions.
+        Media known by its platform id is not even downloaded on a cache hit.
+        """
+        if media is None:
+            return None
+        if self.media_transcriptions is None:
+            return str(await describe(await media.load()))
+        cache_key = get_media_cache_key(kind, media_id=media.file_unique_id)
+        description = (
+            self.media_transcriptions.get(cache_key) if cache_key is not None else None
+        )
+        if description is not None:
+            return description
+        content = await media.load()
+        cache_key = cache_key or get_media_cache_key(kind, content=content)
+        description = self.media_transcriptions.get(cache_key)
+        if description is None:
+            description = str(await describe(content))
+            self.media_transcriptions.set(cache_key, description)
+        return description
+
     def _compose_user_input(
         self,
         user_input: Optional[str] = None,
@@ -251,33 +319,31 @@ class AIAgent:
         Create a dynamic output type model based on allowed models.
         """
         allowed_types = self._get_allowed_output_types()
-
-        union_types = allowed_types or [TextStreamingResponse]
-
-        if len(union_types) == 1:
-            union_type = union_types[0]
-        else:
-            union_type = Union[tuple(union_types)]
-
-        DynamicAIAgentStreamingResponseType = create_model(
-            "DynamicAIAgentStreamingResponseType",
-            output_type=(
-                union_type,
-                Field(description="Type of output expected from the model."),
-            ),
-        )
-
-        return DynamicAIAgentStreamingResponseType
+        return build_output_type_model(tuple(allowed_types or [TextStreamingResponse]))
 
     async def astream(self) -> AsyncGenerator[AIAgentStreamingResponse, None]:
         """
         Asynchronously run the OmniModel with the provided inputs and return the output.
         """
         transcribed_user_message = await self._get_transcribed_message()
-        prepared_memory_context = await self.memory_manager.prepare_context(
-            initiator=self.person,
+        # One set of reads backs every prompt of this turn; the user prompt
+        # and the system prompt do not depend on each other
+        reads = self.prompt_manager.new_turn_reads(
             context=self.context,
-            user_transcribed_message=transcribed_user_message,
+            person=self.person,
+            chat_language=self.chat_settings.language if self.chat_settings else None,
+            exclude_message_ids=self.exclude_message_ids,
+        )
+        prepared_memory_context, system_prompt = await asyncio.gather(
+            self.memory_manager.prepare_context(
+                initiator=self.person,
+                context=self.context,
+                user_transcribed_message=transcribed_user_message,
+                reads=reads,
+            ),
+            self.prompt_manager.get_reply_system_prompt(
+                context=self.context, reads=reads
+            ),
         )
         for shadow_result in prepared_memory_context.shadow_tool_results:
             self.logger.info(
@@ -286,9 +352,6 @@ class AIAgent:
                 shadow_result.result_count,
             )
         user_input = prepared_memory_context.user_input
-        system_prompt = await self.prompt_manager.get_reply_system_prompt(
-            context=self.context
-        )
         if self.memory_manager.should_use_live_agent():
             try:
                 async for response in self._astream_openai_agent(
@@ -308,22 +371,77 @@ class AIAgent:
                     initiator=self.person,
                     context=self.context,
                     user_transcribed_message=transcribed_user_message,
+                    reads=reads,
                 )
 
         # Explicit communication history confuses the structured output generation
         communication_history = None
 
-        # Determine the output type based on the input data
+        # Text is chosen almost every time, so its stream starts together with
+        # the output type routing and is only shown once the router agrees
+        speculative_text_stream: Optional[SpeculativeStream] = None
+        if self.agent_config.speculative_text_stream and self._can_use_model("text"):
+            speculative_text_stream = SpeculativeStream(
+                self.models_toolkit.text_model.astream_default(
+                    system_prompt=system_prompt,
+                    user_input=user_input,
+                    communication_history=communication_history,
+                )
+            )
+
+        # Determine the output type from the current message only, the
+        # history and facts are not needed to pick it
         dynamic_output_type_model = self._create_dynamic_output_type_model()
-        output_type_model: AIAgentResponseOutputTypeModel = (
-            await self.models_toolkit.text_model.arun(
-                system_prompt=system_prompt,
-                pydantic_model=dynamic_output_type_model,
-                user_input=user_input,
-                communication_history=communication_history,
+        router_system_prompt = (
+            self.prompt_manager.compose_output_type_router_system_prompt()
+        )
+        router_prompt = self.prompt_manager.compose_output_type_router_prompt(
+            transcribed_message=transcribed_user_message,
+            allowed_output_types=[
+                output_type.__name__
+                for output_type in self._get_allowed_output_types()
+                or [TextStreamingResponse]
+            ],
+        )
+        try:
+            output_type_model: AIAgentResponseOutputTypeModel = (
+                await self.models_toolkit.text_model.arun(
+                    system_prompt=router_system_prompt,
+                    pydantic_model=dynamic_output_type_model,
+                    user_input=router_prompt,
+                )
+            )
+        except BaseException:
+            if speculative_text_stream is not None:
+                await speculative_text_stream.cancel()
+            raise
+        output_type_name = output_type_model.output_type
+        # Calls that never reach the user are billed as well
+        overhead_input_texts = [router_system_prompt, router_prompt]
+        overhead_output_texts = [output_type_name]
+        if (
+            speculative_text_stream is not None
+            and output_type_name != TextStreamingResponse.__name__
+        ):
+            await speculative_text_stream.cancel()
+            overhead_input_texts += [system_prompt, user_input]
+            overhead_output_texts += [
+                chunk.text_chunk or "" for chunk in speculative_text_stream.produced
+            ]
+            self.logger.info(
+                "Discarded the speculative text stream for %s output",
+                output_type_name,
             )
+            speculative_text_stream = None
+        output_type = await self._generate_output_type(
+            output_type_name=output_type_name,
+            system_prompt=system_prompt,
+            user_input=user_input,
+            communication_history=communication_history,
         )
-        output_type = output_type_model.output_type
+        if not isinstance(output_type, TextStreamingResponse):
+            overhead_input_texts += [system_prompt, user_input]
+            overhead_output_texts.append(output_type.model_dump_json())
 
         # Process the input data based on the output type
         if isinstance(output_type, AudioResponse):
@@ -382,18 +500,26 @@ class AIAgent:
                 image_description=output_type.image_description_to_generate,
             )
         elif isinstance(output_type, TextStreamingResponse):
-            total_text = ""
-            async for chunk in self.models_toolkit.text_model.astream_default(
-                system_prompt=system_prompt,
-                user_input=user_input,
-                communication_history=communication_history,
-            ):
-                total_text += chunk.text_chunk
-                yield AIAgentStreamingResponse(
-                    is_final_response=False,
-                    total_text=total_text,
-                    text_new_chunk=chunk.text_chunk,
+            text_chunks = speculative_text_stream or (
+                self.models_toolkit.text_model.astream_default(
+                    system_prompt=system_prompt,
+                    user_input=user_input,
+                    communication_history=communication_history,
                 )
+            )
+            total_text = ""
+            try:
+                async for chunk in text_chunks:
+                    total_text += chunk.text_chunk
+                    yield AIAgentStreamingResponse(
+                        is_final_response=False,
+                        total_text=total_text,
+                        text_new_chunk=chunk.text_chunk,
+                    )
+            finally:
+                # The consumer may stop reading the reply midway
+                if speculative_text_stream is not None:
+                    await speculative_text_stream.cancel()
             final_response = AIAgentStreamingResponse(
                 total_text=total_text, text_new_chunk=""
             )
@@ -404,15 +530,40 @@ class AIAgent:
             transcribed_user_message=transcribed_user_message,
             system_prompt=system_prompt,
             communication_history=communication_history,
+            overhead_input_text="\n".join(overhead_input_texts),
+            overhead_output_text="".join(overhead_output_texts),
         )
-        final_response = await self.inject_autofact(
-            output=final_response,
-            transcribed_user_message=transcribed_user_message,
+        final_response.transcribed_user_message = transcribed_user_message
+        yield final_response
+
+    async def _generate_output_type(
+        self,
+        output_type_name: str,
+        system_prompt: str,
+        user_input: str,
+        communication_history: Optional[List[OpenAIMessage]] = None,
+    ) -> BaseModel:
+        """
+        Generate the content of the output type picked by the router.
+
+        Audio and image replies cost a second structured call on top of the
+        router. The router sees only the current message, so a spoken text or
+        an image description written by it would lack the persona and the
+        conversation; those replies are rare, and the extra call is billed.
+        """
+        output_type_class = OUTPUT_TYPES.get(output_type_name)
+        if output_type_class is None:
+            raise ValueError("Unexpected output type received from the model.")
+        if output_type_class is TextStreamingResponse:
+            return TextStreamingResponse(text_response=True)
+        # The spoken text and the image description reach the user, so they
+        # are written with the full persona and conversation context
+        return await self.models_toolkit.text_model.arun(
             system_prompt=system_prompt,
+            pydantic_model=output_type_class,
+            user_input=user_input,
             communication_history=communication_history,
         )
-        final_response.transcribed_user_message = transcribed_user_message
-        yield final_response
 
     async def _astream_openai_agent(
         self,
@@ -462,17 +613,11 @@ class AIAgent:
             system_prompt=system_prompt,
             communication_history=None,
         )
-        final_response = await self.inject_autofact(
-            output=final_response,
-            transcribed_user_message=transcribed_user_message,
-            system_prompt=system_prompt,
-            communication_history=None,
-        )
         if scope_key:
-            await self.db.chats.set_memory_scope(
+            await self.db.chats.update_memory_scope(
                 context=self.context,
                 scope_key=scope_key,
-                memory_scope={
+                fields={
                     "scope_key": scope_key,
                     "participants": [get_participant_key(self.person)],
                     "updated_at": datetime.utcnow(),
@@ -488,9 +633,13 @@ class AIAgent:
         transcribed_user_message: TranscribedMessage,
         system_prompt: Optional[str] = None,
         communication_history: Optional[List[OpenAIMessage]] = None,
+        overhead_input_text: Optional[str] = None,
+        overhead_output_text: Optional[str] = None,
     ) -> AIAgentStreamingResponse:
         """
         Inject the price into the AIAgentStreamingResponse based on the input and output.
+        The overhead texts belong to text model calls whose output never reached
+        the user, such as the output type router or a discarded speculative stream.
         """
         total_input_text = (
             (transcribed_user_message.message_text or "")
@@ -524,56 +673,10 @@ class AIAgent:
             input_audio=input_audio,
             output_audio=output_audio,
         )
+        if overhead_input_text or overhead_output_text:
+            price += self.models_toolkit.text_model.get_price(
+                input_text=overhead_input_text, output_text=overhead_output_text
+            )
         modified_response = output
         modified_response.total_price = price
         return modified_response
-
-    async def inject_autofact(
-        self,
-        output: AIAgentStreamingResponse,
-        transcribed_user_message: TranscribedMessage,
-        system_prompt: Optional[str] = None,
-        communication_history: Optional[List[OpenAIMessage]] = None,
-    ) -> AIAgentStreamingResponse:
-        """
-        Inject the autofact into the AIAgentStreamingResponse based on the input and output.
-        """
-        if not self.autofact_enabled:
-            return output
-
-        existing_facts = await self.prompt_manager.compose_chat_facts_prompt(
-            self.context
-        )
-        existing_user_facts = await self.prompt_manager.compose_user_facts_prompt(
-            self.person, self.context
-        )
-
-        prompt = (
-            "We got the following response from the agent:"
-            f"{output.total_text}\n\n"
-            "Which was a response based on the following message from the user "
-            f"with handle {self.person.user_handle}:"
-            f"{transcribed_user_message.message_text}\n\n"
-            "Which was a response based on the following system prompt:"
-            f"{system_prompt}\n\n"
-            "Which was a response based on the following communication history:"
-            f"{communication_history}\n\n"
-            f"{existing_facts}\n"
-            f"{existing_user_facts}\n"
-            "Generate facts based on the above context. Avoid generating facts that are "
-            "already saved in our database (see existing facts above).\n"
-            "IMPORTANT: For the user_handle field, use the user's handle (e.g., '@username'), "
-            "NOT their display name or first name."
-        )
-        facts: ResponseFactsGeneration = await self.models_toolkit.text_model.arun(
-            system_prompt=system_prompt,
-            pydantic_model=ResponseFactsGeneration,
-            user_input=prompt,
-        )
-        if facts.facts_generation_needed:
-            self.logger.info(f"Generated new facts: {facts.user_facts}")
-            output.generated_facts = facts.user_facts
-        else:
-            self.logger.info("No new facts generated for the message")
-            output.generated_facts = []
-        return output
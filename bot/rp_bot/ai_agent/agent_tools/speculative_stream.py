@@ -0,0 +1,51 @@
+import asyncio
+from typing import AsyncIterator, Generic, List, TypeVar
+
+
+T = TypeVar("T")
+
+_STREAM_END = object()
+
+
+class SpeculativeStream(Generic[T]):
+    """Consumes an async stream in the background before it is known to be needed.
+
+    Items are buffered until the stream is iterated, so a stream that turns out
+    to be needed replays everything it produced in the meantime, and a stream
+    that is not needed is cancelled without anything reaching the user.
+    Everything produced is kept in ``produced`` so a discarded stream can
+    still be billed.
+    """
+
+    def __init__(self, source: AsyncIterator[T]) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.produced: List[T] = []
+        self._task = asyncio.create_task(self._consume(source))
+
+    async def _consume(self, source: AsyncIterator[T]) -> None:
+        try:
+            async for item in source:
+                self.produced.append(item)
+                self._queue.put_nowait(item)
+        except Exception as exc:
+            self._queue.put_nowait(exc)
+        finally:
+            self._queue.put_nowait(_STREAM_END)
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        while True:
+            item = await self._queue.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def cancel(self) -> None:
+        if self._task.done():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
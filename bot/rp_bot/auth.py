@@ -1,5 +1,5 @@
-from abc import ABC
 from typing import List, Optional
+from ..models.base_auth import BasePermission
 from ..models.handlers_input import Person, Context
 from .db import DB
 
@@ -37,12 +37,14 @@ class Auth:
         return await self.db.users.decline_terms(user_handle)
 
 
-class BaseRPBotPermission(ABC):
+class BaseRPBotPermission(BasePermission):
     def __init__(self, auth: Auth):
         self.auth = auth
 
 
 class GroupAdmin(BaseRPBotPermission):
+    requires_group_admin = True
+
     async def check(self, person: Person, context: Context) -> bool:
         return context.is_group_admin
 
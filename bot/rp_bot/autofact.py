@@ -0,0 +1,136 @@
+import asyncio
+from logging import Logger
+from typing import List, Optional
+
+from omnimodkit.models_toolkit import ModelsToolkit
+from pydantic import BaseModel, Field
+
+from .db import DB
+from .prompt_manager import PromptManager
+from .storage import AutofactJobRecord
+from ..models.config.bot_config import AutofactConfig
+from ..models.handlers_input import Context
+
+
+class ChatFact(BaseModel):
+    user_fact: str = Field(description="a fact about the user")
+    user_handle: str = Field(
+        description="the user's handle (e.g., '@username'), NOT their display name or first name"
+    )
+
+
+class ResponseFactsGeneration(BaseModel):
+    facts_generation_needed: bool = Field(
+        default=False,
+        description=(
+            "Indicates if the response requires facts generation. "
+            "Note that the fact extraction is called for every few turns, "
+            "so you need to be very sure that the facts generation is needed. "
+            "Only when a very important fact that is clearly truthful and cannot be easily inferred from the context, "
+            "should you set this to True and generate the facts."
+        ),
+    )
+    user_facts: Optional[List[ChatFact]] = Field(
+        default=None,
+        description=(
+            "List of facts about the user. Be resourceful and generate facts only when necessary. "
+            "If facts are not needed, set this field to null."
+        ),
+    )
+
+
+class AutofactWorker:
+    """Extracts facts from finished turns queued in the autofact jobs store.
+
+    Turns of the same chat are claimed in batches, so one extraction call
+    covers several turns and the reply path never waits for it.
+    """
+
+    def __init__(
+        self,
+        db: DB,
+        prompt_manager: PromptManager,
+        models_toolkit: ModelsToolkit,
+        autofact_config: AutofactConfig,
+        logger: Logger,
+    ) -> None:
+        self.db = db
+        self.prompt_manager = prompt_manager
+        self.models_toolkit = models_toolkit
+        self.autofact_config = autofact_config
+        self.logger = logger
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                processed = await self.process_next_batch()
+            except Exception as exc:
+                self.logger.error(f"Autofact worker failed to claim jobs: {exc}")
+                processed = False
+            if not processed:
+                await asyncio.sleep(self.autofact_config.poll_interval_seconds)
+
+    async def process_next_batch(self) -> bool:
+        """Process one batch of jobs; returns False when the queue is empty"""
+        jobs = await self.db.autofact_jobs.claim_batch(
+            max_jobs=self.autofact_config.batch_size,
+            lease_seconds=self.autofact_config.lease_seconds,
+        )
+        if not jobs:
+            return False
+        claim_id = jobs[0].claim_id
+        try:
+            await self.extract_facts(jobs)
+        except Exception as exc:
+            self.logger.error(
+                f"Autofact extraction failed for chat {jobs[0].chat_id}: {exc}"
+            )
+            await self.db.autofact_jobs.fail(
+                claim_id, max_attempts=self.autofact_config.max_attempts
+            )
+            return True
+        await self.db.autofact_jobs.complete(claim_id)
+        return True
+
+    async def extract_facts(self, jobs: List[AutofactJobRecord]) -> None:
+        context = Context(
+            chat_id=jobs[0].chat_id,
+            chat_name=jobs[0].chat_name,
+            thread_id=jobs[-1].thread_id,
+        )
+        facts: ResponseFactsGeneration = await self.models_toolkit.text_model.arun(
+            system_prompt=self.prompt_manager.compose_autofact_system_prompt(),
+            pydantic_model=ResponseFactsGeneration,
+            user_input=await self.prompt_manager.compose_autofact_prompt(
+                context, jobs
+            ),
+        )
+        if not facts.facts_generation_needed or not facts.user_facts:
+            self.logger.info(
+                f"No new facts generated for {len(jobs)} turn(s) "
+                f"in chat {context.chat_id}"
+            )
+            return
+        self.logger.info(f"Generated new facts: {facts.user_facts}")
+        for fact in facts.user_facts:
+            await self.db.user_facts.add_fact(
+                context=context,
+                facts_user_handle=fact.user_handle,
+                fact=fact.user_fact,
+                created_by="autofact",
+            )
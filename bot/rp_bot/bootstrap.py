@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from ..models.cache import TTLCache
+from ..models.handlers_input import Context, Person
+
+
+BootstrapKey = Tuple[int, str, str]
+
+
+class BootstrapRegistry:
+    """Remembers which (chat, user) pairs already went through store bootstrap.
+
+    The key includes the current UTC date so that daily per-user work
+    (e.g. usage resets) still runs once per day for every pair.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None) -> None:
+        self.initialized: TTLCache[BootstrapKey, bool] = TTLCache(
+            max_size=max_size, ttl_seconds=ttl_seconds
+        )
+        self._pending: Dict[BootstrapKey, asyncio.Future] = {}
+
+    @staticmethod
+    def get_key(person: Person, context: Context) -> BootstrapKey:
+        current_date = datetime.now(timezone.utc).date().isoformat()
+        return (context.chat_id, person.user_handle, current_date)
+
+    async def ensure(
+        self,
+        person: Person,
+        context: Context,
+        bootstrap: Callable[[], Awaitable[None]],
+    ) -> bool:
+        """Run bootstrap once per key, sharing the run between concurrent callers.
+
+        Returns True if the bootstrap was executed (or awaited) by this call.
+        A failed bootstrap fails its waiters too, while a cancelled one only
+        cancels its own caller and lets a waiter run the bootstrap instead.
+        """
+        key = self.get_key(person, context)
+        while True:
+            if self.initialized.get(key):
+                return False
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                continue
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            await bootstrap()
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(None)
+            self.initialized.set(key, True)
+        finally:
+            del self._pending[key]
+        return True
+
+    def forget_user(self, user_handle: str) -> None:
+        self.initialized.discard_where(lambda key: key[1] == user_handle)
@@ -1,4 +1,4 @@
-from typing import List, Union, Type
+from typing import List, Optional, Union, Type
 from logging import Logger
 from omnimodkit.ai_config import AIConfig
 from omnimodkit.models_toolkit import ModelsToolkit
@@ -11,10 +11,13 @@ from .rp_bot_handlers import (
 from .commands import handlers as command_handlers
 from .callbacks import handlers as callback_handlers
 from .messages import handlers as message_handlers
+from .autofact import AutofactWorker
 from .db import DB
 from .auth import Auth
 from .prompt_manager import PromptManager
+from .prompt_packer import count_tokens, warm_up_encoding
 from .memory_manager import MemoryManager
+from .summarizer import ConversationSummarizer
 from .localizer import Localizer
 from ..models.config import (
     BotConfig,
@@ -41,28 +44,47 @@ def get_rp_bot(
         last_n_messages_to_remember=bot_config.last_n_messages_to_remember,
         last_n_messages_to_store=bot_config.last_n_messages_to_store,
         default_usage_limit=bot_config.default_usage_limit,
+        cache_config=bot_config.cache,
+        message_storage_config=bot_config.message_storage,
+        count_tokens=count_tokens,
     )
     localizer = Localizer(
         db=db,
         translations=translations,
         default_language=bot_config.default_language,
     )
-    prompt_manager = PromptManager(db=db)
+    prompt_manager = PromptManager(
+        db=db, cache_config=bot_config.cache, memory_config=bot_config.memory
+    )
+    models_toolkit = ModelsToolkit(
+        openai_api_key=openai_api_key,
+        ai_config=ai_config,
+    )
     memory_manager = MemoryManager(
         db=db,
         prompt_manager=prompt_manager,
         memory_config=bot_config.memory,
         openai_api_key=openai_api_key,
-    )
-    models_toolkit = ModelsToolkit(
-        openai_api_key=openai_api_key,
-        ai_config=ai_config,
+        summarizer=ConversationSummarizer(
+            db=db,
+            prompt_manager=prompt_manager,
+            models_toolkit=models_toolkit,
+            memory_config=bot_config.memory,
+            logger=logger.getChild(ConversationSummarizer.__name__),
+        ),
     )
     auth = Auth(
         allowed_handles=allowed_handles,
         admin_handles=admin_handles,
         db=db,
     )
+    autofact_worker = AutofactWorker(
+        db=db,
+        prompt_manager=prompt_manager,
+        models_toolkit=models_toolkit,
+        autofact_config=bot_config.autofact,
+        logger=logger.getChild(AutofactWorker.__name__),
+    )
     return RPBot(
         db=db,
         models_toolkit=models_toolkit,
@@ -72,6 +94,7 @@ def get_rp_bot(
         auth=auth,
         bot_config=bot_config,
         logger=logger,
+        autofact_worker=autofact_worker,
     )
 
 
@@ -86,6 +109,7 @@ class RPBot(BaseBot):
         auth: Auth,
         bot_config: BotConfig,
         logger: Logger,
+        autofact_worker: Optional[AutofactWorker] = None,
     ):
         self.db = db
         self.models_toolkit = models_toolkit
@@ -95,6 +119,19 @@ class RPBot(BaseBot):
         self.auth = auth
         self.bot_config = bot_config
         self.logger = logger
+        self.autofact_worker = autofact_worker
+
+    async def startup(self) -> None:
+        await self.db.ensure_indexes()
+        self.logger.info("Database indexes are in place")
+        if not await warm_up_encoding():
+            self.logger.warning("Token counts are estimated until tiktoken loads")
+        if self.autofact_worker is not None:
+            self.autofact_worker.start()
+
+    async def shutdown(self) -> None:
+        if self.autofact_worker is not None:
+            await self.autofact_worker.stop()
 
     def _init_handlers(
         self,
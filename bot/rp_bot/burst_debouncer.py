@@ -0,0 +1,57 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class Burst(Generic[T]):
+    started_at: float
+    generation: int = 0
+    items: List[T] = field(default_factory=list)
+
+
+class BurstDebouncer(Generic[T]):
+    """Coalesces bursts of items per key into a single decision.
+
+    Every caller waits for the key to stay quiet for `quiet_seconds`; only
+    the caller holding the last item of the burst gets the whole burst back,
+    the others get None. A burst never waits longer than `max_wait_seconds`
+    from its first item so that a constantly busy chat is still answered.
+    """
+
+    def __init__(
+        self,
+        quiet_seconds: float,
+        max_wait_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.quiet_seconds = quiet_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.clock = clock
+        self.bursts: Dict[Hashable, Burst[T]] = {}
+
+    async def wait_for_quiet(self, key: Hashable, item: T) -> Optional[List[T]]:
+        now = self.clock()
+        burst = self.bursts.get(key)
+        if burst is None:
+            burst = Burst(started_at=now)
+            self.bursts[key] = burst
+        burst.generation += 1
+        generation = burst.generation
+        burst.items.append(item)
+
+        deadline = burst.started_at + self.max_wait_seconds
+        await asyncio.sleep(min(self.quiet_seconds, max(deadline - now, 0)))
+
+        if self.bursts.get(key) is not burst or burst.generation != generation:
+            return None
+        del self.bursts[key]
+        return burst.items
+
+    def discard(self, key: Hashable) -> None:
+        """Drop the pending burst, e.g. when it was answered another way"""
+        self.bursts.pop(key, None)
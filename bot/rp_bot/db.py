@@ -1,9 +1,12 @@
-from typing import Optional, List
+import asyncio
+from typing import Callable, Optional, List
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from ..models.config import DefaultChatModes
+from ..models.config import CacheConfig, DefaultChatModes, MessageStorageConfig
 from ..models.handlers_input import Person, Context
+from .bootstrap import BootstrapRegistry
+from .db_models.autofact_jobs import AutofactJobs
 from .db_models.chats import Chats
 from .db_models.user_facts import UserFacts
 from .db_models.user_introductions import UserIntroductions
@@ -12,6 +15,7 @@ from .db_models.dialogs import Dialogs
 from .db_models.users import Users
 from .db_models.user_usage import UserUsage
 from .storage import (
+    AutofactJobsStore,
     BaseStore,
     ChatModesStore,
     ChatsStore,
@@ -32,18 +36,29 @@ class DB:
         last_n_messages_to_remember: int,
         last_n_messages_to_store: Optional[int],
         default_usage_limit: int,
+        cache_config: Optional[CacheConfig] = None,
+        message_storage_config: Optional[MessageStorageConfig] = None,
+        count_tokens: Optional[Callable[[str], int]] = None,
     ):
+        message_storage_config = message_storage_config or MessageStorageConfig()
         client = AsyncIOMotorClient(db_uri)
         db = client.get_default_database()
-        self.users: UsersStore = Users(db)
+        self.users: UsersStore = Users(db, cache_config)
         self.user_usage: UserUsageStore = UserUsage(db, default_usage_limit)
-        self.chats: ChatsStore = Chats(db, default_language)
-        self.user_facts: UserFactsStore = UserFacts(db)
+        self.chats: ChatsStore = Chats(db, default_language, cache_config)
+        self.user_facts: UserFactsStore = UserFacts(db, cache_config)
         self.user_introductions: UserIntroductionsStore = UserIntroductions(db)
         self.chat_modes: ChatModesStore = ChatModes(db, default_chat_modes)
         self.dialogs: RecentDialogStore = Dialogs(
-            db, last_n_messages_to_remember, last_n_messages_to_store
+            db,
+            last_n_messages_to_remember,
+            last_n_messages_to_store,
+            storage_layout=message_storage_config.layout,
+            bucket_max_messages=message_storage_config.max_messages,
+            count_tokens=count_tokens,
+            cache_config=cache_config,
         )
+        self.autofact_jobs: AutofactJobsStore = AutofactJobs(db)
         self.models: List[BaseStore] = [
             self.users,
             self.user_usage,
@@ -52,17 +67,45 @@ class DB:
             self.user_introductions,
             self.chat_modes,
             self.dialogs,
+            self.autofact_jobs,
         ]
+        cache_config = cache_config or CacheConfig()
+        self.bootstrap_registry = BootstrapRegistry(
+            max_size=cache_config.max_bootstrapped_pairs,
+            ttl_seconds=cache_config.bootstrap_ttl_seconds,
+        )
+
+    async def ensure_indexes(self) -> None:
+        await asyncio.gather(*[model.ensure_indexes() for model in self.models])
 
     async def create_if_not_exists(self, person: Person, context: Context) -> None:
-        for model in self.models:
-            await model.create_if_not_exists(context=context, person=person)
+        await asyncio.gather(
+            *[
+                model.create_if_not_exists(context=context, person=person)
+                for model in self.models
+            ]
+        )
 
     async def update_if_needed(self, person: Person, context: Context) -> None:
-        for model in self.models:
-            await model.update_if_needed(person=person, context=context)
+        await asyncio.gather(
+            *[
+                model.update_if_needed(person=person, context=context)
+                for model in self.models
+            ]
+        )
+
+    async def initialize_context(self, person: Person, context: Context) -> None:
+        """Bootstrap the stores for a (chat, user) pair once instead of per update"""
+
+        async def bootstrap() -> None:
+            await self.create_if_not_exists(person, context)
+            await self.update_if_needed(person, context)
+
+        await self.bootstrap_registry.ensure(person, context, bootstrap)
 
     async def clear_user_data(self, user_handle: str) -> None:
-        # TODO: implement this method for all models
+        # Every store keyed by user implements it; chats hold no user data
+        # and usage is kept so that deleting data does not reset the limit
         for model in self.models:
             await model.clear_user_data(user_handle)
+        self.bootstrap_registry.forget_user(user_handle)
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from typing import List
+from uuid import uuid4
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from .base_db_model import BaseDBModel
+from ...models.handlers_input import Person, Context
+from ..storage import AutofactJobRecord
+
+
+class AutofactJobs(BaseDBModel):
+    """Persistent queue of finished turns waiting for fact extraction.
+
+    A job is available once `available_at` has passed. Claiming a batch moves
+    `available_at` forward by the lease, so a batch that is never completed
+    (e.g. the process died) becomes available again for a retry.
+    """
+
+    indexes = {
+        "autofact_jobs": [
+            [("available_at", 1)],
+            [("chat_id", 1), ("available_at", 1)],
+            # Claimed jobs are read back in insertion order
+            [("claim_id", 1), ("_id", 1)],
+            [("user_handle", 1)],
+        ],
+    }
+
+    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+        super().__init__(db)
+        self.autofact_jobs = db.autofact_jobs
+
+    async def enqueue(
+        self,
+        context: Context,
+        person: Person,
+        user_message: str,
+        bot_response: str,
+    ) -> None:
+        now = datetime.utcnow()
+        await self.autofact_jobs.insert_one(
+            {
+                "chat_id": context.chat_id,
+                "thread_id": context.thread_id,
+                "chat_name": context.chat_name,
+                "user_handle": person.user_handle,
+                "user_message": user_message,
+                "bot_response": bot_response,
+                "created_at": now,
+                "available_at": now,
+                "attempts": 0,
+            }
+        )
+
+    async def claim_batch(
+        self, max_jobs: int, lease_seconds: float
+    ) -> List[AutofactJobRecord]:
+        """Claim up to max_jobs available jobs of a single chat, oldest first"""
+        now = datetime.utcnow()
+        oldest_job = await self.autofact_jobs.find_one(
+            {"available_at": {"$lte": now}},
+            {"chat_id": 1},
+            sort=[("available_at", 1)],
+        )
+        if oldest_job is None:
+            return []
+        cursor = (
+            self.autofact_jobs.find(
+                {"chat_id": oldest_job["chat_id"], "available_at": {"$lte": now}},
+                {"_id": 1},
+            )
+            .sort("available_at", 1)
+            .limit(max_jobs)
+        )
+        job_ids = [job["_id"] for job in await cursor.to_list(length=max_jobs)]
+        claim_id = str(uuid4())
+        # Jobs claimed concurrently by another worker no longer match the filter
+        await self.autofact_jobs.update_many(
+            {"_id": {"$in": job_ids}, "available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "claim_id": claim_id,
+                    "available_at": now + timedelta(seconds=lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+        cursor = self.autofact_jobs.find({"claim_id": claim_id}).sort("_id", 1)
+        return [
+            AutofactJobRecord(id=job["_id"], **job)
+            for job in await cursor.to_list(length=max_jobs)
+        ]
+
+    async def complete(self, claim_id: str) -> None:
+        await self.autofact_jobs.delete_many({"claim_id": claim_id})
+
+    async def fail(self, claim_id: str, max_attempts: int) -> None:
+        """Drop jobs of a failed claim that ran out of attempts; others retry"""
+        await self.autofact_jobs.delete_many(
+            {"claim_id": claim_id, "attempts": {"$gte": max_attempts}}
+        )
+
+    async def clear_user_data(self, user_handle: str) -> None:
+        await self.autofact_jobs.delete_many({"user_handle": user_handle})
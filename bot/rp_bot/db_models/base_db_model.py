@@ -1,12 +1,31 @@
+from typing import ClassVar, Dict, List, Tuple
+
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from ...models.handlers_input import Context, Person
 
 
+IndexKeys = List[Tuple[str, int]]
+
+
 class BaseDBModel:
+    # Collection name -> index key specs that cover every query the model issues
+    indexes: ClassVar[Dict[str, List[IndexKeys]]] = {}
+    # Collection name -> index key specs that must also be unique
+    unique_indexes: ClassVar[Dict[str, List[IndexKeys]]] = {}
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
 
+    async def ensure_indexes(self) -> None:
+        """Create the declared indexes; create_index is a no-op for existing ones"""
+        for collection_name, collection_indexes in self.indexes.items():
+            for keys in collection_indexes:
+                await self.db[collection_name].create_index(keys)
+        for collection_name, collection_indexes in self.unique_indexes.items():
+            for keys in collection_indexes:
+                await self.db[collection_name].create_index(keys, unique=True)
+
     async def create_if_not_exists(self, context: Context, person: Person) -> None:
         pass
 
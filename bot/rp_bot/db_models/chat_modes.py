@@ -1,5 +1,6 @@
 from typing import List
 from bson import ObjectId
+from pymongo import UpdateOne
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 
@@ -13,6 +14,14 @@ ChatModeResponse = ChatModeRecord
 
 
 class ChatModes(BaseDBModel):
+    indexes = {
+        "chat_modes": [
+            [("chat_id", 1), ("active_mode", 1)],
+            [("chat_id", 1), ("mode_name", 1)],
+            [("added_by_handle", 1)],
+        ],
+    }
+
     def __init__(
         self, db: AsyncIOMotorDatabase, default_chat_modes: DefaultChatModes
     ) -> None:
@@ -21,12 +30,16 @@ class ChatModes(BaseDBModel):
         self.default_chat_modes = default_chat_modes
 
     async def create_if_not_exists(self, context: Context, person: Person) -> None:
-        for _, mode in self.default_chat_modes.default_chat_modes.items():
-            self.chat_modes.update_one(
+        operations = [
+            UpdateOne(
                 {"chat_id": context.chat_id, "mode_name": mode.name},
                 {"$setOnInsert": {"mode_description": mode.description}},
                 upsert=True,
             )
+            for mode in self.default_chat_modes.default_chat_modes.values()
+        ]
+        if operations:
+            await self.chat_modes.bulk_write(operations, ordered=False)
 
     async def get_chat_modes(self, context: Context) -> List[ChatModeResponse]:
         cursor = self.chat_modes.find({"chat_id": context.chat_id})
@@ -1,14 +1,45 @@
+from typing import Optional
+
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from .base_db_model import BaseDBModel
+from ...models.cache import TTLCache
+from ...models.config import CacheConfig
 from ...models.handlers_input import Person, Context
+from ..storage import ChatSettings
+
+
+CHAT_SETTINGS_PROJECTION = {
+    "_id": 0,
+    "language": 1,
+    "is_started": 1,
+    "conversation_tracker": 1,
+    "auto_fact": 1,
+    "autoengage": 1,
+}
 
 
 class Chats(BaseDBModel):
-    def __init__(self, db: AsyncIOMotorDatabase, default_language: str) -> None:
+    indexes = {
+        "chats": [[("chat_id", 1)]],
+    }
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        default_language: str,
+        cache_config: Optional[CacheConfig] = None,
+    ) -> None:
         super().__init__(db)
+        cache_config = cache_config or CacheConfig()
         self.chats = db.chats
         self.default_language = default_language
+        # Language is localized for every streamed chunk, so it is kept in memory
+        # and invalidated on write; the ttl bounds staleness across processes
+        self.language_cache: TTLCache[int, str] = TTLCache(
+            max_size=cache_config.max_chats,
+            ttl_seconds=cache_config.language_ttl_seconds,
+        )
 
     async def create_if_not_exists(self, person: Person, context: Context) -> None:
         chat_id = context.chat_id
@@ -58,12 +89,39 @@ class Chats(BaseDBModel):
             {"chat_id": context.chat_id},
             {"$set": {"language": language}},
         )
+        self.language_cache.pop(context.chat_id)
 
     async def get_language(self, context: Context) -> str:
+        language = self.language_cache.get(context.chat_id)
+        if language is not None:
+            return language
         chat_data = await self.chats.find_one(
             {"chat_id": context.chat_id}, {"_id": 0, "language": 1}
         )
-        return chat_data.get("language")
+        language = chat_data.get("language") if chat_data else None
+        if language is not None:
+            self.language_cache.set(context.chat_id, language)
+        return language
+
+    def get_language_cache_stats(self) -> dict:
+        return self.language_cache.get_stats()
+
+    async def get_chat_settings(self, context: Context) -> ChatSettings:
+        """Load every chat flag used while handling a message in a single read"""
+        chat_data = await self.chats.find_one(
+            {"chat_id": context.chat_id}, CHAT_SETTINGS_PROJECTION
+        )
+        if not chat_data:
+            return ChatSettings(language=self.default_language)
+        if chat_data.get("language") is not None:
+            self.language_cache.set(context.chat_id, chat_data["language"])
+        return ChatSettings(
+            language=chat_data.get("language", self.default_language),
+            is_started=chat_data.get("is_started", False),
+            conversation_tracker=chat_data.get("conversation_tracker", False),
+            auto_fact=chat_data.get("auto_fact", False),
+            autoengage=chat_data.get("autoengage", False),
+        )
 
     async def get_conversation_tracker_state(self, context: Context) -> bool:
         chat_data = await self.chats.find_one(
@@ -136,6 +194,24 @@ class Chats(BaseDBModel):
             upsert=True,
         )
 
+    async def update_memory_scope(
+        self, context: Context, scope_key: str, fields: dict
+    ) -> None:
+        """Set individual fields of a memory scope, keeping the other ones"""
+        await self.chats.update_one(
+            {"chat_id": context.chat_id},
+            {
+                "$set": {
+                    "memory.version": 1,
+                    **{
+                        f"memory.scopes.{scope_key}.{name}": value
+                        for name, value in fields.items()
+                    },
+                }
+            },
+            upsert=True,
+        )
+
     async def clear_memory(self, context: Context) -> None:
         await self.chats.update_one(
             {"chat_id": context.chat_id},
@@ -1,26 +1,94 @@
-from typing import List, Tuple, Union, Literal, Optional, Dict, Any
+import sys
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Union
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 
 from .base_db_model import BaseDBModel
+from ...models.cache import TTLCache
+from ...models.config import CacheConfig
 from ...models.handlers_input import Person, Context, TranscribedMessage
 from ..memory_utils import build_scope_key, get_participant_key
+from ..storage import DialogMessageRecord
 
 
 class Dialogs(BaseDBModel):
+    indexes = {
+        "dialogs": [
+            [("chat_id", 1), ("_id", -1)],
+            [("chat_id", 1), ("thread_id", 1), ("_id", 1)],
+            [("user_handle", 1)],
+        ],
+        "dialog_buckets": [
+            [("messages.user_handle", 1)],
+        ],
+    }
+    # One bucket per chat, concurrent first-message upserts must not create two
+    unique_indexes = {
+        "dialog_buckets": [
+            [("chat_id", 1)],
+        ],
+    }
+
     def __init__(
         self,
         db: AsyncIOMotorDatabase,
         last_n_messages_to_remember: int,
         last_n_messages_to_store: Optional[int],
+        storage_layout: Literal["documents", "buckets"] = "documents",
+        bucket_max_messages: int = 50,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        cache_config: Optional[CacheConfig] = None,
     ) -> None:
         super().__init__(db)
+        cache_config = cache_config or CacheConfig()
         self.dialogs = db.dialogs
+        self.dialog_buckets = db.dialog_buckets
         self.last_n_messages_to_remember = last_n_messages_to_remember
         self.last_n_messages_to_store = last_n_messages_to_store
+        self.storage_layout = storage_layout
+        # Counted once on insert when given, so prompts never re-tokenize history
+        self.count_tokens = count_tokens
+        # A bucket lives in a single document, so it is always capped
+        self.bucket_max_messages = last_n_messages_to_store or bucket_max_messages
+        # The prompt window of every chat is kept in memory so a turn only reads
+        # the messages stored since the last one; the ttl bounds staleness
+        # across processes
+        self.windows: TTLCache[int, List[DialogMessageRecord]] = TTLCache(
+            max_size=cache_config.max_chats,
+            ttl_seconds=cache_config.history_ttl_seconds,
+        )
+
+    def uses_buckets(self) -> bool:
+        return self.storage_layout == "buckets"
+
+    def _window_size(self) -> int:
+        # Messages trimmed from storage must not stay in the cached window
+        stored = (
+            self.bucket_max_messages
+            if self.uses_buckets()
+            else self.last_n_messages_to_store
+        )
+        return min(self.last_n_messages_to_remember, stored or sys.maxsize)
 
     async def reset(self, context: Context) -> None:
+        self.windows.pop(context.chat_id)
+        if self.uses_buckets():
+            await self.dialog_buckets.delete_one({"chat_id": context.chat_id})
+            return
         await self.dialogs.delete_many({"chat_id": context.chat_id})
 
+    async def _get_bucket_messages(
+        self, context: Context, last_n: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        projection: Dict[str, Any] = {"_id": 0, "messages": 1}
+        if last_n is not None:
+            projection["messages"] = {"$slice": -last_n}
+        bucket = await self.dialog_buckets.find_one(
+            {"chat_id": context.chat_id}, projection
+        )
+        return bucket.get("messages", []) if bucket else []
+
     async def get_messages(
         self, context: Context
     ) -> List[Tuple[str, bool, TranscribedMessage]]:
@@ -28,31 +96,89 @@ class Dialogs(BaseDBModel):
 
         Args:
             context (Context): context object
-            last_n (int, optional): amount of messages. Defaults to 10.
 
         Returns:
             List[Tuple[str, bool, TranscribedMessage]]: list of tuples with user_handle, is_bot and message
         """
-        cursor = (
-            self.dialogs.find({"chat_id": context.chat_id})
-            .sort("_id", -1)
-            .limit(self.last_n_messages_to_remember)
-        )
-        messages = await cursor.to_list(length=self.last_n_messages_to_remember)
         return [
-            (
-                msg["user_handle"],
-                msg["is_bot"],
-                TranscribedMessage(
-                    message_text=msg.get("message_text"),
-                    timestamp=msg["timestamp"],
-                    image_description=msg.get("image_description"),
-                    voice_description=msg.get("voice_description"),
-                ),
-            )
-            for msg in reversed(messages)
+            (record.user_handle, record.is_bot, record.message)
+            for record in await self.get_message_records(context)
         ]
 
+    async def get_message_records(self, context: Context) -> List[DialogMessageRecord]:
+        """Get the last N messages from the dialog along with their ids
+
+        Message ids are stable, so callers can use them to reuse work done
+        for messages they have already seen. Only messages stored after the
+        cached window are read.
+        """
+        window = self.windows.get(context.chat_id) or []
+        after_id = window[-1].id if window else None
+        window_size = self._window_size()
+        if self.uses_buckets():
+            messages = await self._get_bucket_messages(context, last_n=window_size)
+            if after_id is not None:
+                messages = [msg for msg in messages if msg["_id"] > after_id]
+        else:
+            filters: Dict[str, Any] = {"chat_id": context.chat_id}
+            if after_id is not None:
+                filters["_id"] = {"$gt": after_id}
+            cursor = self.dialogs.find(filters).sort("_id", -1).limit(window_size)
+            messages = await cursor.to_list(length=window_size)
+            messages.reverse()
+        window = (window + [self._to_record(msg) for msg in messages])[-window_size:]
+        self.windows.set(context.chat_id, window)
+        return list(window)
+
+    async def get_message_records_after(
+        self, context: Context, after_id: Optional[ObjectId], limit: int
+    ) -> List[DialogMessageRecord]:
+        """Get up to limit messages of the thread stored after after_id, oldest first
+
+        Without after_id the last limit messages are returned. Unlike
+        get_message_records the read is not bound to the prompt window, so
+        callers can follow every message of the thread.
+        """
+        filters: Dict[str, Any] = {
+            "chat_id": context.chat_id,
+            "thread_id": context.thread_id,
+        }
+        if self.uses_buckets():
+            messages = [
+                msg
+                for msg in await self._get_bucket_messages(context)
+                if msg.get("thread_id") == context.thread_id
+            ]
+            if after_id is not None:
+                messages = [msg for msg in messages if msg["_id"] > after_id]
+                return [self._to_record(msg) for msg in messages[:limit]]
+            return [self._to_record(msg) for msg in messages[-limit:]]
+        if after_id is None:
+            cursor = self.dialogs.find(filters).sort("_id", -1).limit(limit)
+            messages = await cursor.to_list(length=limit)
+            messages.reverse()
+        else:
+            filters["_id"] = {"$gt": after_id}
+            cursor = self.dialogs.find(filters).sort("_id", 1).limit(limit)
+            messages = await cursor.to_list(length=limit)
+        return [self._to_record(msg) for msg in messages]
+
+    @staticmethod
+    def _to_record(msg: Dict[str, Any]) -> DialogMessageRecord:
+        return DialogMessageRecord(
+            id=msg["_id"],
+            user_handle=msg["user_handle"],
+            is_bot=msg["is_bot"],
+            message=TranscribedMessage(
+                message_text=msg.get("message_text"),
+                timestamp=msg["timestamp"],
+                image_description=msg.get("image_description"),
+                voice_description=msg.get("voice_description"),
+            ),
+            token_count=msg.get("token_count"),
+            thread_id=msg.get("thread_id"),
+        )
+
     async def add_message_to_dialog(
         self,
         context: Context,
@@ -61,7 +187,8 @@ class Dialogs(BaseDBModel):
         scope_key: Optional[str] = None,
         memory_role: Optional[str] = None,
         provider_metadata: Optional[Dict[str, Any]] = None,
-    ) -> None:
+    ) -> ObjectId:
+        """Store the message and return its id"""
         chat_id = context.chat_id
         user_handle = "bot" if person == "bot" else person.user_handle
         participant_key = None if person == "bot" else get_participant_key(person)
@@ -69,6 +196,7 @@ class Dialogs(BaseDBModel):
 
         # Insert the new message
         document = {
+            "_id": ObjectId(),
             "chat_id": chat_id,
             "thread_id": context.thread_id,
             "scope_key": scope_key or build_scope_key(context),
@@ -81,9 +209,33 @@ class Dialogs(BaseDBModel):
             "image_description": transcribed_message.image_description,
             "voice_description": transcribed_message.voice_description,
             "timestamp": transcribed_message.timestamp,
+            "token_count": self._count_message_tokens(transcribed_message),
         }
         if provider_metadata:
             document["provider_metadata"] = provider_metadata
+
+        if self.uses_buckets():
+            # Append and trim the ring buffer in one atomic update
+            bucket_update = {
+                "$setOnInsert": {"chat_id": chat_id},
+                "$push": {
+                    "messages": {
+                        "$each": [document],
+                        "$slice": -self.bucket_max_messages,
+                    }
+                },
+            }
+            try:
+                await self.dialog_buckets.update_one(
+                    {"chat_id": chat_id}, bucket_update, upsert=True
+                )
+            except DuplicateKeyError:
+                # A concurrent upsert created the bucket first, append to it
+                await self.dialog_buckets.update_one(
+                    {"chat_id": chat_id}, bucket_update, upsert=True
+                )
+            return document["_id"]
+
         await self.dialogs.insert_one(document)
 
         # Check if the stored messages exceed the limit and delete the oldest if necessary
@@ -97,9 +249,33 @@ class Dialogs(BaseDBModel):
             )
             if oldest_message:
                 await self.dialogs.delete_one({"_id": oldest_message["_id"]})
+        return document["_id"]
+
+    def _count_message_tokens(
+        self, transcribed_message: TranscribedMessage
+    ) -> Optional[int]:
+        if self.count_tokens is None:
+            return None
+        return self.count_tokens(
+            " ".join(
+                text
+                for text in [
+                    transcribed_message.message_text,
+                    transcribed_message.image_description,
+                    transcribed_message.voice_description,
+                ]
+                if text
+            )
+        )
 
     async def clear_user_data(self, user_handle: str) -> None:
+        # The user may have written in any chat
+        self.windows.clear()
         await self.dialogs.delete_many({"user_handle": user_handle})
+        await self.dialog_buckets.update_many(
+            {"messages.user_handle": user_handle},
+            {"$pull": {"messages": {"user_handle": user_handle}}},
+        )
 
     async def search_recent_dialog(
         self,
@@ -108,6 +284,15 @@ class Dialogs(BaseDBModel):
         participant_key: Optional[str] = None,
         limit: int = 6,
     ) -> List[str]:
+        if self.uses_buckets():
+            return self._search_bucket_messages(
+                await self._get_bucket_messages(context),
+                context=context,
+                query=query,
+                participant_key=participant_key,
+                limit=limit,
+            )
+
         filters: Dict[str, Any] = {"chat_id": context.chat_id}
         if context.thread_id is not None:
             filters["thread_id"] = context.thread_id
@@ -118,8 +303,35 @@ class Dialogs(BaseDBModel):
 
         cursor = self.dialogs.find(filters).sort("_id", -1).limit(limit)
         messages = await cursor.to_list(length=limit)
-        result = []
+        return self._format_search_results(reversed(messages))
+
+    def _search_bucket_messages(
+        self,
+        messages: List[Dict[str, Any]],
+        context: Context,
+        query: Optional[str],
+        participant_key: Optional[str],
+        limit: int,
+    ) -> List[str]:
+        matches = []
         for msg in reversed(messages):
+            if len(matches) >= limit:
+                break
+            thread_id = msg.get("thread_id")
+            if context.thread_id is not None and thread_id != context.thread_id:
+                continue
+            if participant_key and msg.get("participant_key") != participant_key:
+                continue
+            message_text = msg.get("message_text") or ""
+            if query and query.lower() not in message_text.lower():
+                continue
+            matches.append(msg)
+        return self._format_search_results(reversed(matches))
+
+    @staticmethod
+    def _format_search_results(messages) -> List[str]:
+        result = []
+        for msg in messages:
             message_text = msg.get("message_text") or ""
             if not message_text:
                 continue
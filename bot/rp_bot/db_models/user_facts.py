@@ -1,27 +1,130 @@
+import asyncio
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Tuple
 from uuid import uuid4
 
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from .base_db_model import BaseDBModel
+from ...models.cache import TTLCache
+from ...models.config import CacheConfig
 from ...models.handlers_input import Person, Context
+from ..fact_search import FactSearchIndex
 from ..memory_utils import get_display_name, get_participant_key
 
 
+FACTS_SNAPSHOT_PROJECTION = {
+    "_id": 0,
+    "user_handle": 1,
+    "participant_key": 1,
+    "facts": 1,
+}
+
+FactsVersion = Tuple[int, int]
+
+
+@dataclass
+class ChatFactsSnapshot:
+    """All fact documents of a chat as of a given facts version"""
+
+    version: FactsVersion
+    documents: List[Dict[str, Any]] = field(default_factory=list)
+    _search_index: Optional[FactSearchIndex] = field(
+        default=None, repr=False, compare=False
+    )
+
+    @property
+    def search_index(self) -> FactSearchIndex:
+        if self._search_index is None:
+            self._search_index = FactSearchIndex.from_documents(self.documents)
+        return self._search_index
+
+
 class UserFacts(BaseDBModel):
-    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+    indexes = {
+        "user_facts": [
+            [("chat_id", 1), ("participant_key", 1)],
+            [("chat_id", 1), ("user_handle", 1)],
+            [("user_handle", 1)],
+        ],
+    }
+
+    def __init__(
+        self, db: AsyncIOMotorDatabase, cache_config: Optional[CacheConfig] = None
+    ) -> None:
         super().__init__(db)
         self.user_facts = db.user_facts
+        cache_config = cache_config or CacheConfig()
+        # Facts are read on every prompt and written rarely, so each chat's
+        # facts are kept in memory and invalidated by bumping its version.
+        # The global version covers writes that span every chat.
+        self.facts_cache: TTLCache[int, ChatFactsSnapshot] = TTLCache(
+            max_size=cache_config.max_chats,
+            ttl_seconds=cache_config.facts_ttl_seconds,
+        )
+        self.global_facts_version = 0
+        # A chat whose version is evicted has no cached snapshot left to
+        # match it, so bounding the versions only costs a reload
+        self.chat_facts_versions: TTLCache[int, int] = TTLCache(
+            max_size=cache_config.max_chats
+        )
+        # Counts every write, so a read that raced any of them is not cached
+        self.facts_writes = 0
+        self._pending_snapshots: Dict[
+            Tuple[int, FactsVersion], "asyncio.Future[ChatFactsSnapshot]"
+        ] = {}
+
+    def get_facts_version(self, chat_id: int) -> FactsVersion:
+        return (self.global_facts_version, self.chat_facts_versions.get(chat_id, 0))
+
+    def _bump_chat_facts_version(self, chat_id: int) -> None:
+        self.chat_facts_versions.set(
+            chat_id, self.chat_facts_versions.get(chat_id, 0) + 1
+        )
+        self.facts_writes += 1
+        self.facts_cache.pop(chat_id)
+
+    async def get_chat_facts_snapshot(self, context: Context) -> ChatFactsSnapshot:
+        chat_id = context.chat_id
+        version = self.get_facts_version(chat_id)
+        snapshot = self.facts_cache.get(chat_id)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        # Concurrent misses of the same chat share a single read
+        key = (chat_id, version)
+        pending = self._pending_snapshots.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                self._load_chat_facts_snapshot(chat_id, version)
+            )
+            self._pending_snapshots[key] = pending
+            pending.add_done_callback(
+                lambda _: self._pending_snapshots.pop(key, None)
+            )
+        return await asyncio.shield(pending)
+
+    async def _load_chat_facts_snapshot(
+        self, chat_id: int, version: FactsVersion
+    ) -> ChatFactsSnapshot:
+        facts_writes = self.facts_writes
+        cursor = self.user_facts.find({"chat_id": chat_id}, FACTS_SNAPSHOT_PROJECTION)
+        snapshot = ChatFactsSnapshot(
+            version=version, documents=await cursor.to_list(length=None)
+        )
+        # Skip caching if a write landed while the snapshot was being read
+        if self.facts_writes == facts_writes:
+            self.facts_cache.set(chat_id, snapshot)
+        return snapshot
 
     async def get_chat_facts(self, context: Context) -> List[Tuple[str, str]]:
         """
         Return a list of facts for the current chat as a list
         user_handle, fact
         """
-        cursor = self.user_facts.find({"chat_id": context.chat_id})
+        snapshot = await self.get_chat_facts_snapshot(context)
         facts = []
-        async for doc in cursor:
-            for fact in doc["facts"]:
+        for doc in snapshot.documents:
+            for fact in doc.get("facts", []):
                 facts.append((doc["user_handle"], fact))
         return facts
 
@@ -31,7 +134,8 @@ class UserFacts(BaseDBModel):
             participant_key=get_participant_key(person),
             fallback_user_handle=person.user_handle,
         )
-        return facts.get("facts", []) if facts else []
+        # Copies, the snapshot documents are shared by every reader
+        return list(facts.get("facts", [])) if facts else []
 
     async def get_user_facts_by_participant(
         self,
@@ -44,7 +148,7 @@ class UserFacts(BaseDBModel):
             participant_key=participant_key,
             fallback_user_handle=fallback_user_handle,
         )
-        return facts.get("facts", []) if facts else []
+        return list(facts.get("facts", [])) if facts else []
 
     async def get_facts_for_user_handle(
         self, context: Context, user_handle: str
@@ -58,10 +162,11 @@ class UserFacts(BaseDBModel):
         Returns:
             List[str]: list of facts
         """
-        facts = await self.user_facts.find_one(
-            {"chat_id": context.chat_id, "user_handle": user_handle}
-        )
-        return facts.get("facts", []) if facts else []
+        snapshot = await self.get_chat_facts_snapshot(context)
+        for doc in snapshot.documents:
+            if doc.get("user_handle") == user_handle:
+                return list(doc.get("facts", []))
+        return []
 
     async def add_fact(
         self,
@@ -105,6 +210,7 @@ class UserFacts(BaseDBModel):
         if set_fields:
             update["$set"] = set_fields
         await self.user_facts.update_one(filters, update, upsert=True)
+        self._bump_chat_facts_version(context.chat_id)
 
     async def clear_facts(self, context: Context, facts_user_handle: str) -> None:
         """Delete all facts associated with a user
@@ -116,9 +222,13 @@ class UserFacts(BaseDBModel):
         await self.user_facts.delete_one(
             {"chat_id": context.chat_id, "user_handle": facts_user_handle}
         )
+        self._bump_chat_facts_version(context.chat_id)
 
     async def clear_user_data(self, user_handle: str) -> None:
         await self.user_facts.delete_many({"user_handle": user_handle})
+        self.global_facts_version += 1
+        self.facts_writes += 1
+        self.facts_cache.clear()
 
     async def _find_user_facts_doc(
         self,
@@ -126,16 +236,15 @@ class UserFacts(BaseDBModel):
         participant_key: Optional[str],
         fallback_user_handle: Optional[str] = None,
     ) -> Optional[Dict[str, Any]]:
+        snapshot = await self.get_chat_facts_snapshot(context)
         if participant_key:
-            facts = await self.user_facts.find_one(
-                {"chat_id": context.chat_id, "participant_key": participant_key}
-            )
-            if facts:
-                return facts
+            for doc in snapshot.documents:
+                if doc.get("participant_key") == participant_key:
+                    return doc
         if fallback_user_handle:
-            return await self.user_facts.find_one(
-                {"chat_id": context.chat_id, "user_handle": fallback_user_handle}
-            )
+            for doc in snapshot.documents:
+                if doc.get("user_handle") == fallback_user_handle:
+                    return doc
         return None
 
     async def search_chat_facts(
@@ -143,18 +252,21 @@ class UserFacts(BaseDBModel):
         context: Context,
         query: Optional[str] = None,
         participant_key: Optional[str] = None,
+        limit: int = 10,
     ) -> List[str]:
-        filters: Dict[str, Any] = {"chat_id": context.chat_id}
-        if participant_key:
-            filters["participant_key"] = participant_key
-        if query:
-            filters["facts"] = {"$regex": query, "$options": "i"}
+        """Return up to limit chat facts ranked by BM25 relevance to query
 
-        cursor = self.user_facts.find(filters)
-        facts = []
-        async for doc in cursor:
-            for fact in doc.get("facts", []):
-                if query and query.lower() not in fact.lower():
-                    continue
-                facts.append(f"{doc.get('user_handle', 'unknown')}: {fact}")
-        return facts
+        Without a query the last facts in storage order are returned: facts
+        are grouped by user and each user's facts are in the order they were
+        added, facts carry no timestamp to sort them across users.
+        """
+        # A slice from -0 would return every fact
+        if limit <= 0:
+            return []
+        snapshot = await self.get_chat_facts_snapshot(context)
+        index = snapshot.search_index
+        if not query:
+            facts = index.iter_facts(participant_key)[-limit:]
+        else:
+            facts = index.search(query, limit=limit, participant_key=participant_key)
+        return [fact.format() for fact in facts]
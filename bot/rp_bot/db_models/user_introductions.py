@@ -5,6 +5,13 @@ from ...models.handlers_input import Person, Context
 
 
 class UserIntroductions(BaseDBModel):
+    indexes = {
+        "user_introductions": [
+            [("chat_id", 1), ("user_handle", 1)],
+            [("user_handle", 1)],
+        ],
+    }
+
     def __init__(self, db: AsyncIOMotorDatabase) -> None:
         super().__init__(db)
         self.user_introductions = db.user_introductions
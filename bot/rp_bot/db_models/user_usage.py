@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, time, timezone
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from .base_db_model import BaseDBModel
@@ -10,6 +10,10 @@ UserUsageResponse = UserUsageRecord
 
 
 class UserUsage(BaseDBModel):
+    indexes = {
+        "user_usage": [[("handle", 1)]],
+    }
+
     def __init__(self, db: AsyncIOMotorDatabase, default_usage_limit: int) -> None:
         super().__init__(db)
         self.user_usage = db.user_usage
@@ -19,28 +23,66 @@ class UserUsage(BaseDBModel):
         """
         Initialize user usage with 0 and last_reset with the current date.
         If the current date is after the last_reset date, reset the usage to 0.
+        Both cases are handled by a single upserting pipeline update.
         TODO: this logic should be flexible to allow for different reset periods.
         """
-        user_handle = person.user_handle
-        current_date = datetime.now().date()
-        user_data = await self.user_usage.find_one({"handle": user_handle})
-        if user_data is None:
-            await self.user_usage.insert_one(
-                {"handle": user_handle, "usage": 0, "limit": self.default_usage_limit}
-            )
-        else:
-            last_reset = user_data.get("last_reset", current_date)
-            if current_date > last_reset:
-                await self.user_usage.update_one(
-                    {"handle": user_handle},
-                    {"$set": {"usage": 0, "last_reset": current_date}},
-                )
+        # Days are UTC days, like the bootstrap registry keys
+        current_date = datetime.combine(
+            datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc
+        )
+        await self.user_usage.update_one(
+            {"handle": person.user_handle},
+            [
+                {
+                    "$set": {
+                        "usage": {
+                            "$cond": [
+                                {
+                                    "$lt": [
+                                        {"$ifNull": ["$last_reset", current_date]},
+                                        current_date,
+                                    ]
+                                },
+                                0,
+                                {"$ifNull": ["$usage", 0]},
+                            ]
+                        },
+                        "limit": {"$ifNull": ["$limit", self.default_usage_limit]},
+                        "last_reset": current_date,
+                    }
+                }
+            ],
+            upsert=True,
+        )
 
     async def add_usage_points(self, person: Person, points: int) -> None:
         await self.user_usage.update_one(
             {"handle": person.user_handle}, {"$inc": {"usage": points}}
         )
 
+    async def reserve_usage(self, person: Person, points: float) -> bool:
+        """Atomically reserve points if the usage stays under the user's limit
+
+        The check and the increment are a single conditional update, so
+        concurrent messages from one user cannot overshoot the limit together.
+        """
+        result = await self.user_usage.update_one(
+            {
+                "handle": person.user_handle,
+                "$expr": {"$lt": [{"$add": ["$usage", points]}, "$limit"]},
+            },
+            {"$inc": {"usage": points}},
+        )
+        return result.modified_count == 1
+
+    async def settle_usage(
+        self, person: Person, reserved_points: float, actual_points: float
+    ) -> None:
+        """Replace a reservation with the actual price of the response"""
+        difference = actual_points - reserved_points
+        if difference:
+            await self.add_usage_points(person, difference)
+
     async def get_user_usage(self, person: Person) -> int:
         usage_data = await self.user_usage.find_one(
             {"handle": person.user_handle}, {"_id": 0, "usage": 1}
@@ -53,9 +95,9 @@ class UserUsage(BaseDBModel):
             {"_id": 0, "usage": 1, "limit": 1, "last_reset": 1},
         )
         return UserUsageResponse(
-            usage_data.get("usage", 0),
-            usage_data.get("limit", 0),
-            usage_data.get("last_reset", datetime.now()),
+            this_month_usage=usage_data.get("usage", 0),
+            limit=usage_data.get("limit", 0),
+            last_reset=usage_data.get("last_reset", datetime.now(timezone.utc)),
         )
 
     async def get_user_usage_limit(self, person: Person) -> int:
@@ -1,14 +1,39 @@
 from datetime import datetime
+from typing import Optional
+
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from .base_db_model import BaseDBModel
+from ...models.cache import TTLCache
+from ...models.config import CacheConfig
 from ...models.handlers_input import Person, Context
+from ..storage import UserAccessState
+
+
+ACCESS_STATE_PROJECTION = {
+    "_id": 0,
+    "banned": 1,
+    "banned_until": 1,
+    "accepted_terms": 1,
+    "declined_terms": 1,
+}
 
 
 class Users(BaseDBModel):
-    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+    indexes = {
+        "users": [[("handle", 1)]],
+    }
+
+    def __init__(
+        self, db: AsyncIOMotorDatabase, cache_config: Optional[CacheConfig] = None
+    ) -> None:
         super().__init__(db)
         self.users = db.users
+        cache_config = cache_config or CacheConfig()
+        self.access_state_ttl_seconds = cache_config.access_state_ttl_seconds
+        self.access_state_cache: TTLCache[str, UserAccessState] = TTLCache(
+            max_size=cache_config.max_users
+        )
 
     async def create_if_not_exists(self, person: Person, context: Context) -> None:
         user_handle = person.user_handle
@@ -52,6 +77,7 @@ class Users(BaseDBModel):
                 }
             },
         )
+        self.access_state_cache.pop(user_handle)
 
     async def unban_user(self, user_handle: str) -> None:
         # remove the banned field from the user
@@ -64,22 +90,35 @@ class Users(BaseDBModel):
                 }
             },
         )
+        self.access_state_cache.pop(user_handle)
+
+    async def get_access_state(self, user_handle: str) -> UserAccessState:
+        access_state = self.access_state_cache.get(user_handle)
+        if access_state is not None:
+            return access_state
+        user_data = await self.users.find_one(
+            {"handle": user_handle}, ACCESS_STATE_PROJECTION
+        )
+        access_state = UserAccessState(**(user_data or {}))
+        ttl_seconds = self.access_state_ttl_seconds
+        now = datetime.now().timestamp()
+        if access_state.is_banned(now) and access_state.banned_until is not None:
+            # Re-read as soon as the ban expires
+            ttl_seconds = min(ttl_seconds, access_state.banned_until - now)
+        self.access_state_cache.set(user_handle, access_state, ttl_seconds=ttl_seconds)
+        return access_state
 
     async def is_user_banned(self, user_handle: str) -> bool:
-        user_data = await self.users.find_one({"handle": user_handle}, {"banned": 1})
-        return user_data.get("banned", False)
+        access_state = await self.get_access_state(user_handle)
+        return access_state.is_banned(datetime.now().timestamp())
 
     async def has_accepted_terms(self, user_handle: str) -> bool:
-        user_data = await self.users.find_one(
-            {"handle": user_handle}, {"accepted_terms": 1}
-        )
-        return user_data.get("accepted_terms", False)
+        access_state = await self.get_access_state(user_handle)
+        return access_state.accepted_terms
 
     async def has_declined_terms(self, user_handle: str) -> bool:
-        user_data = await self.users.find_one(
-            {"handle": user_handle}, {"declined_terms": 1}
-        )
-        return user_data.get("declined_terms", False)
+        access_state = await self.get_access_state(user_handle)
+        return access_state.declined_terms
 
     async def accept_terms(self, user_handle: str) -> None:
         """Accept terms for a user and clear any previous decline"""
@@ -88,6 +127,7 @@ class Users(BaseDBModel):
             {"$set": {"accepted_terms": True}, "$unset": {"declined_terms": ""}},
             upsert=True,
         )
+        self.access_state_cache.pop(user_handle)
 
     async def decline_terms(self, user_handle: str) -> None:
         """Decline terms for a user and clear any previous acceptance"""
@@ -96,6 +136,7 @@ class Users(BaseDBModel):
             {"$set": {"declined_terms": True}, "$unset": {"accepted_terms": ""}},
             upsert=True,
         )
+        self.access_state_cache.pop(user_handle)
 
     async def clear_user_data(self, user_handle: str) -> None:
         # Nullify first and last name for the handle
@@ -0,0 +1,111 @@
+import math
+import re
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from ..models.config import EngageConfig
+from ..models.handlers_input import Context
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+QUESTION_WORDS = frozenset(
+    (
+        "what why how when where who which can could should would is are do does "
+        "anyone somebody что почему зачем как когда где кто какой можно "
+        "подскажите посоветуйте"
+    ).split()
+)
+SECOND_PERSON_WORDS = frozenset("you your ты вы тебя вас".split())
+
+# Hand-tuned logistic model over cheap message features. Its engage side is
+# kept for long, clearly addressed questions, shorter ones go to the LLM
+SCORER_BIAS = -2.0
+SCORER_WEIGHTS = {
+    "question_mark": 2.5,
+    "question_word": 1.5,
+    "second_person": 1.0,
+    "length": 1.0,
+}
+
+# Decision made by a cascade stage and the stage name
+StageDecision = Tuple[Optional[bool], str]
+
+
+class EngageCascade:
+    """Decides whether the bot should engage, asking the LLM only as a last resort.
+
+    Stages run from the cheapest to the most expensive: deterministic rules,
+    then a local scoring model, then the LLM for messages the scorer cannot
+    call confidently. Every decision is counted per stage.
+    """
+
+    def __init__(self, engage_config: EngageConfig) -> None:
+        self.engage_config = engage_config
+        self.bot_names = [name.lower() for name in engage_config.bot_names]
+        self.decisions: Counter = Counter()
+
+    def apply_rules(self, context: Context, message_text: str) -> Optional[bool]:
+        if context.is_bot_mentioned:
+            return True
+        text = message_text.strip().lower()
+        words = WORD_PATTERN.findall(text)
+        if len(text) < self.engage_config.min_message_chars or not words:
+            return False
+        if any(name in words for name in self.bot_names):
+            return True
+        # A reply to another user is addressed to them, even when it is a
+        # question; replies to the bot count as mentions
+        if context.replied_to_user_handle is not None:
+            return False
+        return None
+
+    def score(self, context: Context, message_text: str) -> float:
+        text = message_text.strip().lower()
+        words = WORD_PATTERN.findall(text)
+        features = {
+            "question_mark": float("?" in text),
+            "question_word": float(bool(words) and words[0] in QUESTION_WORDS),
+            "second_person": float(not SECOND_PERSON_WORDS.isdisjoint(words)),
+            "length": min(len(words), 30) / 30,
+        }
+        logit = SCORER_BIAS + sum(
+            SCORER_WEIGHTS[name] * value for name, value in features.items()
+        )
+        return 1 / (1 + math.exp(-logit))
+
+    def decide_locally(self, context: Context, message_text: str) -> StageDecision:
+        decision = self.apply_rules(context, message_text)
+        if decision is not None:
+            return decision, "rules"
+        probability = self.score(context, message_text)
+        if probability >= self.engage_config.scorer_engage_threshold:
+            return True, "scorer"
+        if probability <= self.engage_config.scorer_skip_threshold:
+            return False, "scorer"
+        return None, "llm"
+
+    async def should_engage(
+        self,
+        context: Context,
+        message_text: str,
+        ask_llm: Callable[[], Awaitable[bool]],
+    ) -> bool:
+        decision, stage = self.decide_locally(context, message_text)
+        if decision is None:
+            decision = await ask_llm()
+        self.decisions[(stage, decision)] += 1
+        return decision
+
+    def get_stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = {}
+        for (stage, decision), count in self.decisions.items():
+            key = f"{stage}_{'engage' if decision else 'skip'}"
+            stats[key] = count
+        total = sum(self.decisions.values())
+        llm_calls = sum(
+            count for (stage, _), count in self.decisions.items() if stage == "llm"
+        )
+        stats["total"] = total
+        stats["llm_calls_avoided"] = total - llm_calls
+        return stats
@@ -0,0 +1,105 @@
+import heapq
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+@dataclass
+class IndexedFact:
+    user_handle: str
+    participant_key: Optional[str]
+    fact: str
+    length: int
+
+    def format(self) -> str:
+        return f"{self.user_handle}: {self.fact}"
+
+
+class FactSearchIndex:
+    """In-memory inverted index over chat facts ranked with Okapi BM25.
+
+    The index is immutable: it is built once per facts snapshot and
+    discarded together with it when the chat's facts change.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.facts: List[IndexedFact] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.average_length = 0.0
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "FactSearchIndex":
+        index = cls()
+        for doc in documents:
+            for fact in doc.get("facts", []):
+                index.add(
+                    user_handle=doc.get("user_handle", "unknown"),
+                    participant_key=doc.get("participant_key"),
+                    fact=fact,
+                )
+        return index
+
+    def add(self, user_handle: str, participant_key: Optional[str], fact: str) -> None:
+        tokens = tokenize(fact)
+        position = len(self.facts)
+        self.facts.append(
+            IndexedFact(
+                user_handle=user_handle,
+                participant_key=participant_key,
+                fact=fact,
+                length=len(tokens),
+            )
+        )
+        for token, frequency in Counter(tokens).items():
+            self.postings.setdefault(token, []).append((position, frequency))
+        total_length = self.average_length * position + len(tokens)
+        self.average_length = total_length / len(self.facts)
+
+    def _idf(self, document_frequency: int) -> float:
+        total = len(self.facts)
+        return math.log(
+            1 + (total - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        participant_key: Optional[str] = None,
+    ) -> List[IndexedFact]:
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf(len(postings))
+            for position, frequency in postings:
+                fact = self.facts[position]
+                if participant_key and fact.participant_key != participant_key:
+                    continue
+                length_norm = 1 - self.b + self.b * fact.length / (
+                    self.average_length or 1
+                )
+                scores[position] = scores.get(position, 0.0) + idf * (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                )
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [self.facts[position] for position, _ in best]
+
+    def iter_facts(self, participant_key: Optional[str] = None) -> List[IndexedFact]:
+        return [
+            fact
+            for fact in self.facts
+            if not participant_key or fact.participant_key == participant_key
+        ]
@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import List, Optional
 
@@ -5,8 +6,10 @@ from .agent_runtime import AgentTool
 from ..models.config.bot_config import MemoryConfig
 from ..models.handlers_input import Context, Person, TranscribedMessage
 from .db import DB
-from .memory_utils import build_scope_key, get_display_name, get_participant_key
+from .memory_utils import get_display_name, get_participant_key
 from .prompt_manager import PromptManager
+from .summarizer import ConversationSummarizer
+from .turn_reads import TurnReads
 
 
 @dataclass
@@ -48,11 +51,13 @@ class MemoryTools:
         context: Context,
         query: Optional[str] = None,
         participant_key: Optional[str] = None,
+        limit: int = 10,
     ) -> List[str]:
         return await self.db.user_facts.search_chat_facts(
             context=context,
             query=query,
             participant_key=participant_key,
+            limit=limit,
         )
 
     async def search_recent_dialog(
@@ -77,11 +82,13 @@ class MemoryManager:
         prompt_manager: PromptManager,
         memory_config: MemoryConfig,
         openai_api_key: Optional[str] = None,
+        summarizer: Optional[ConversationSummarizer] = None,
     ) -> None:
         self.db = db
         self.prompt_manager = prompt_manager
         self.memory_config = memory_config
         self.openai_api_key = openai_api_key
+        self.summarizer = summarizer
         self.tools = MemoryTools(db)
 
     def is_legacy_mode(self) -> bool:
@@ -90,33 +97,47 @@ class MemoryManager:
             or self.memory_config.strategy == "legacy_prompt"
         )
 
-    async def get_scope_key(self, context: Context) -> str:
-        chat_mode = await self.db.chat_modes.get_chat_mode(context)
-        return build_scope_key(context=context, mode_id=chat_mode.mode_name)
+    def schedule_summary_update(self, context: Context) -> None:
+        if self.summarizer is None or not self.memory_config.summary_enabled:
+            return
+        self.summarizer.schedule(context)
+
+    async def get_scope_key(
+        self, context: Context, reads: Optional[TurnReads] = None
+    ) -> str:
+        reads = reads or self.prompt_manager.new_turn_reads(context)
+        return await reads.get_scope_key()
 
     async def prepare_context(
         self,
         initiator: Person,
         context: Context,
         user_transcribed_message: TranscribedMessage,
+        reads: Optional[TurnReads] = None,
     ) -> PreparedMemoryContext:
+        reads = reads or self.prompt_manager.new_turn_reads(context, initiator)
         if self.is_legacy_mode():
             user_input = await self.prompt_manager.compose_prompt(
                 initiator=initiator,
                 context=context,
                 user_transcribed_message=user_transcribed_message,
+                reads=reads,
             )
             return PreparedMemoryContext(user_input=user_input)
 
-        scope_key = await self.get_scope_key(context)
         if self.memory_config.strategy == "expanded_prompt":
-            user_input = await self._compose_expanded_prompt(
-                initiator=initiator,
-                context=context,
-                user_transcribed_message=user_transcribed_message,
+            scope_key, user_input = await asyncio.gather(
+                self.get_scope_key(context, reads),
+                self._compose_expanded_prompt(
+                    initiator=initiator,
+                    context=context,
+                    user_transcribed_message=user_transcribed_message,
+                    reads=reads,
+                ),
             )
             return PreparedMemoryContext(user_input=user_input, scope_key=scope_key)
 
+        scope_key = await self.get_scope_key(context, reads)
         if self.memory_config.strategy in {"agent_tools", "hybrid_provider_state"}:
             user_input = self._compose_agent_user_input(
                 initiator=initiator,
@@ -125,14 +146,19 @@ class MemoryManager:
             )
             return PreparedMemoryContext(user_input=user_input, scope_key=scope_key)
 
-        user_input = await self.prompt_manager.compose_prompt(
+        compose_prompt = self.prompt_manager.compose_prompt(
             initiator=initiator,
             context=context,
             user_transcribed_message=user_transcribed_message,
+            reads=reads,
         )
         shadow_results = []
         if self.memory_config.strategy == "agent_tools_shadow":
-            shadow_results = await self.run_shadow_tools(initiator, context)
+            user_input, shadow_results = await asyncio.gather(
+                compose_prompt, self.run_shadow_tools(initiator, context)
+            )
+        else:
+            user_input = await compose_prompt
         return PreparedMemoryContext(
             user_input=user_input,
             scope_key=scope_key,
@@ -144,11 +170,13 @@ class MemoryManager:
         initiator: Person,
         context: Context,
         user_transcribed_message: TranscribedMessage,
+        reads: Optional[TurnReads] = None,
     ) -> str:
         legacy_prompt = await self.prompt_manager.compose_prompt(
             initiator=initiator,
             context=context,
             user_transcribed_message=user_transcribed_message,
+            reads=reads,
         )
         identity_prompt = "\n".join(
             [
@@ -193,12 +221,14 @@ class MemoryManager:
     async def run_shadow_tools(
         self, initiator: Person, context: Context
     ) -> List[MemoryToolResult]:
-        user_facts = await self.tools.get_user_facts(context, initiator)
-        replied_user_facts = await self.tools.get_replied_user_facts(context)
-        recent_dialog = await self.tools.search_recent_dialog(
-            context=context,
-            participant_key=get_participant_key(initiator),
-            limit=self.memory_config.fallback_last_n_messages,
+        user_facts, replied_user_facts, recent_dialog = await asyncio.gather(
+            self.tools.get_user_facts(context, initiator),
+            self.tools.get_replied_user_facts(context),
+            self.tools.search_recent_dialog(
+                context=context,
+                participant_key=get_participant_key(initiator),
+                limit=self.memory_config.fallback_last_n_messages,
+            ),
         )
         return [
             MemoryToolResult("get_user_facts", len(user_facts), user_facts[:3]),
@@ -225,9 +255,13 @@ class MemoryManager:
             facts = await self.tools.get_replied_user_facts(context)
             return "\n".join(facts) if facts else "No replied-to user facts found."
 
-        async def search_chat_facts(query: str) -> str:
-            """Search known chat facts by text query."""
-            facts = await self.tools.search_chat_facts(context, query=query)
+        async def search_chat_facts(query: str, limit: int) -> str:
+            """Search known chat facts by text query, most relevant first."""
+            max_limit = self.memory_config.fact_search_limit
+            capped_limit = max(1, min(limit, max_limit))
+            facts = await self.tools.search_chat_facts(
+                context, query=query, limit=capped_limit
+            )
             return "\n".join(facts) if facts else "No matching chat facts found."
 
         async def search_recent_dialog(query: str, limit: int) -> str:
@@ -18,8 +18,15 @@ def get_thread_key(context: Context) -> str:
     return str(context.thread_id) if context.thread_id is not None else "main"
 
 
+def escape_field_name(name: str) -> str:
+    """Escape characters MongoDB treats specially in dotted field paths"""
+    return name.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
 def build_scope_key(
     context: Context,
     mode_id: str = "default",
 ) -> str:
-    return f"chat:{context.chat_id}:thread:{get_thread_key(context)}:mode:{mode_id}"
+    # Scope keys are used as field names, while mode names are user-defined
+    mode_key = escape_field_name(mode_id)
+    return f"chat:{context.chat_id}:thread:{get_thread_key(context)}:mode:{mode_key}"
@@ -1,16 +1,41 @@
-from typing import Optional, AsyncIterator, List
+from typing import Collection, Optional, AsyncIterator, List, Tuple
 
+from bson import ObjectId
+
+from ...models.cache import TTLCache
+from ...models.config import AgentConfig, CacheConfig, EngageConfig
 from ...models.handlers_response import CommandResponse
 from ...models.handlers_input import Person, Context, Message, TranscribedMessage
 from ..auth import AllowedUser, NotBanned
 from ..rp_bot_handlers import RPBotMessageHandler
 from ..ai_agent.agent_tools.agent import AIAgent
+from ..burst_debouncer import BurstDebouncer
+from ..engage_cascade import EngageCascade
 
 
 class MessageHandler(RPBotMessageHandler):
     needs_terms_accepted = True
     permission_classes = (AllowedUser, NotBanned)
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        engage_config = getattr(self.bot_config, "engage", None) or EngageConfig()
+        self.engage_cascade = EngageCascade(engage_config)
+        self.engage_stats_log_interval = engage_config.stats_log_interval
+        # Burst items are the persisted message ids along with their texts
+        self.engage_debouncer: BurstDebouncer[
+            Tuple[Optional[ObjectId], str]
+        ] = BurstDebouncer(
+            quiet_seconds=engage_config.debounce_seconds,
+            max_wait_seconds=engage_config.max_debounce_seconds,
+        )
+        cache_config = getattr(self.bot_config, "cache", None) or CacheConfig()
+        self.media_transcriptions: TTLCache[str, str] = TTLCache(
+            max_size=cache_config.max_media_transcriptions,
+            ttl_seconds=cache_config.media_transcription_ttl_seconds,
+        )
+        self.agent_config = getattr(self.bot_config, "agent", None) or AgentConfig()
+
     def should_persist_dialog_messages(self) -> bool:
         message_storage = getattr(self.bot_config, "message_storage", None)
         storage_mode = getattr(message_storage, "mode", "persistent_recent")
@@ -22,26 +47,55 @@ class MessageHandler(RPBotMessageHandler):
         context: Context,
         person: Person | str,
         transcribed_message: TranscribedMessage,
-    ) -> None:
+    ) -> Optional[ObjectId]:
         if not self.should_persist_dialog_messages():
-            return
-        await self.db.dialogs.add_message_to_dialog(
+            return None
+        return await self.db.dialogs.add_message_to_dialog(
             context=context,
             person=person,
             transcribed_message=transcribed_message,
         )
 
-    async def is_usage_under_limit(
+    async def reserve_estimated_usage(
         self, person: Person, context: Context, message: Message
-    ) -> bool:
+    ) -> Optional[float]:
+        """Reserve the estimated price of the response against the user's limit
+
+        Returns the reserved points or None if the limit would be exceeded.
+        """
+        # The price estimate only checks whether media is attached, so the
+        # handles are passed without downloading them
         estimated_usage = self.models_toolkit.estimate_price(
             input_text=message.message_text,
             input_image=message.in_file_image,
             input_audio=message.in_file_audio,
         )
-        user_usage = await self.db.user_usage.get_user_usage(person=person)
-        user_limit = await self.db.user_usage.get_user_usage_limit(person=person)
-        return user_usage + estimated_usage < user_limit
+        if not await self.db.user_usage.reserve_usage(
+            person=person, points=estimated_usage
+        ):
+            return None
+        return estimated_usage
+
+    async def ask_engage_needed(
+        self,
+        person: Person,
+        context: Context,
+        message: Message,
+        engage_text: Optional[str] = None,
+        exclude_message_ids: Collection[ObjectId] = (),
+    ) -> bool:
+        prompt = await self.prompt_manager.compose_engage_needed_prompt(
+            initiator=person,
+            context=context,
+            user_transcribed_message=TranscribedMessage(
+                message_text=engage_text or message.message_text,
+                timestamp=message.timestamp,
+            ),
+            exclude_message_ids=exclude_message_ids,
+        )
+        return await self.models_toolkit.text_model.async_ask_yes_no_question(
+            question=prompt
+        )
 
     async def get_usage_over_limit_response(self, person: Person) -> CommandResponse:
         usage_limit = await self.db.user_usage.get_user_usage_limit(person=person)
@@ -69,48 +123,81 @@ class MessageHandler(RPBotMessageHandler):
     async def stream_get_response(
         self, person: Person, context: Context, message: Message, args: List[str]
     ) -> AsyncIterator[CommandResponse]:
-        conversation_tracker_enabled = (
-            await self.db.chats.get_conversation_tracker_state(context=context)
-        )
-        chat_is_started = await self.db.chats.chat_is_started(context=context)
-        if not chat_is_started or (
-            not conversation_tracker_enabled and not context.is_bot_mentioned
+        chat_settings = await self.db.chats.get_chat_settings(context=context)
+        if not chat_settings.is_started or (
+            not chat_settings.conversation_tracker and not context.is_bot_mentioned
         ):
             self.logger.info(
                 f"Ignoring message from {person.user_handle} in chat {context.chat_id}"
             )
             return
 
-        autoengage_state = await self.db.chats.get_autoengage_state(context=context)
         engage_is_needed = False
-        if autoengage_state:
-            prompt = await self.prompt_manager.compose_engage_needed_prompt(
-                initiator=person,
+        user_message_persisted = False
+        user_message_id = None
+        if chat_settings.autoengage:
+            engage_text = message.message_text
+            burst_message_ids = []
+            if context.is_bot_mentioned:
+                # The mention is answered directly, so the pending burst is too
+                self.engage_debouncer.discard(context.chat_id)
+            elif self.engage_debouncer.quiet_seconds > 0:
+                # Persist right away so the burst is in the history, then let
+                # only the last message of the burst decide on engaging
+                user_message_id = await self.persist_dialog_message(
+                    context=context,
+                    person=person,
+                    transcribed_message=TranscribedMessage(
+                        message_text=message.message_text,
+                        timestamp=message.timestamp,
+                    ),
+                )
+                user_message_persisted = True
+                burst = await self.engage_debouncer.wait_for_quiet(
+                    context.chat_id, (user_message_id, message.message_text)
+                )
+                if burst is None:
+                    self.logger.info(
+                        "Deferring the engage decision for the message from "
+                        f"{person.user_handle} in chat {context.chat_id} "
+                        "to the end of the burst"
+                    )
+                    return
+                engage_text = "\n".join(text for _, text in burst)
+                # The burst is the question, so it is not repeated as history
+                burst_message_ids = [
+                    message_id for message_id, _ in burst if message_id is not None
+                ]
+            # Rules and a local scorer settle most messages without the LLM
+            engage_is_needed = await self.engage_cascade.should_engage(
                 context=context,
-                user_transcribed_message=TranscribedMessage(
-                    message_text=message.message_text,
-                    timestamp=message.timestamp,
+                message_text=engage_text,
+                ask_llm=lambda: self.ask_engage_needed(
+                    person,
+                    context,
+                    message,
+                    engage_text=engage_text,
+                    exclude_message_ids=burst_message_ids,
                 ),
             )
-            engage_is_needed = (
-                await self.models_toolkit.text_model.async_ask_yes_no_question(
-                    question=prompt
-                )
-            )
+            engage_stats = self.engage_cascade.get_stats()
+            if engage_stats["total"] % self.engage_stats_log_interval == 0:
+                self.logger.info(f"Engage cascade stats: {engage_stats}")
 
         # Determine if we should engage or just save to DB
         should_engage = engage_is_needed or context.is_bot_mentioned
 
         if not should_engage:
-            # Save message without transcribing to save resources
-            await self.persist_dialog_message(
-                context=context,
-                person=person,
-                transcribed_message=TranscribedMessage(
-                    message_text=message.message_text,
-                    timestamp=message.timestamp,
-                ),
-            )
+            if not user_message_persisted:
+                # Save message without transcribing to save resources
+                await self.persist_dialog_message(
+                    context=context,
+                    person=person,
+                    transcribed_message=TranscribedMessage(
+                        message_text=message.message_text,
+                        timestamp=message.timestamp,
+                    ),
+                )
             if self.should_persist_dialog_messages():
                 self.logger.info(
                     f"Saving the message from {person.user_handle} in chat {context.chat_id} "
@@ -129,81 +216,99 @@ class MessageHandler(RPBotMessageHandler):
                 "as the agent detected a question or a request for information"
             )
 
-        if not await self.is_usage_under_limit(
+        reserved_usage = await self.reserve_estimated_usage(
             person=person, context=context, message=message
-        ):
+        )
+        if reserved_usage is None:
             yield await self.get_usage_over_limit_response(person=person)
             return
 
-        autofact_enabled = await self.db.chats.get_auto_fact_state(context=context)
-
-        ai_agent = AIAgent(
-            person=person,
-            context=context,
-            message=message,
-            db=self.db,
-            models_toolkit=self.models_toolkit,
-            prompt_manager=self.prompt_manager,
-            memory_manager=self.memory_manager,
-            autofact_enabled=autofact_enabled,
-            logger=self.logger,
-        )
-        self.logger.info(
-            "Using AI to generate a response to the message from "
-            f"{person.user_handle} in chat {context.chat_id}"
-        )
-        response = None
-        agent_response = None
-        async for agent_response in ai_agent.astream():
-            if agent_response is None:
-                continue
-            response = CommandResponse(
-                text="streaming_message_response",
-                image_url=agent_response.image_url,
-                audio_bytes=agent_response.audio_bytes,
-                kwargs={"response_text": agent_response.total_text or ""},
-            )
-            yield response
-
-        if agent_response:
-            await self.persist_dialog_message(
-                context=context,
+        usage_settled = False
+        try:
+            ai_agent = AIAgent(
                 person=person,
-                transcribed_message=agent_response.transcribed_user_message,
-            )
-            await self.db.user_usage.add_usage_points(
-                person=person, points=agent_response.total_price
-            )
-            await self.persist_dialog_message(
                 context=context,
-                person="bot",
-                transcribed_message=TranscribedMessage(
-                    message_text=agent_response.total_text,
-                    image_description=agent_response.image_description,
-                    voice_description=agent_response.audio_description,
-                    timestamp=message.timestamp,
-                ),
+                message=message,
+                db=self.db,
+                models_toolkit=self.models_toolkit,
+                prompt_manager=self.prompt_manager,
+                memory_manager=self.memory_manager,
+                chat_settings=chat_settings,
+                agent_config=self.agent_config,
+                media_transcriptions=self.media_transcriptions,
+                exclude_message_ids=[user_message_id] if user_message_id else [],
+                logger=self.logger,
             )
-            for fact in agent_response.generated_facts:
-                await self.db.user_facts.add_fact(
-                    context=context,
-                    facts_user_handle=fact.user_handle,
-                    fact=fact.user_fact,
-                    created_by="autofact",
-                )
             self.logger.info(
-                f"Generated a response for the message from {person.user_handle} in chat {context.chat_id} "
-                f"with usage of {agent_response.total_price}"
-            )
-        else:
-            await self.persist_dialog_message(
-                context=context,
-                person=person,
-                transcribed_message=TranscribedMessage(
-                    message_text=message.message_text,
-                    timestamp=message.timestamp,
-                ),
-            )
-            self.logger.info(
-                f"No response generated for the message from {person.user_handle} in chat {context.chat_id}"
+                "Using AI to generate a response to the message from "
+                f"{person.user_handle} in chat {context.chat_id}"
             )
+            response = None
+            agent_response = None
+            async for agent_response in ai_agent.astream():
+                if agent_response is None:
+                    continue
+                response = CommandResponse(
+                    text="streaming_message_response",
+                    image_url=agent_response.image_url,
+                    audio_bytes=agent_response.audio_bytes,
+                    kwargs={"response_text": agent_response.total_text or ""},
+                )
+                yield response
+
+            if agent_response:
+                if not user_message_persisted:
+                    await self.persist_dialog_message(
+                        context=context,
+                        person=person,
+                        transcribed_message=agent_response.transcribed_user_message,
+                    )
+                await self.db.user_usage.settle_usage(
+                    person=person,
+                    reserved_points=reserved_usage,
+                    actual_points=agent_response.total_price or 0,
+                )
+                usage_settled = True
+                await self.persist_dialog_message(
+                    context=context,
+                    person="bot",
+                    transcribed_message=TranscribedMessage(
+                        message_text=agent_response.total_text,
+                        image_description=agent_response.image_description,
+                        voice_description=agent_response.audio_description,
+                        timestamp=message.timestamp,
+                    ),
+                )
+                self.memory_manager.schedule_summary_update(context)
+                if chat_settings.auto_fact:
+                    # Facts are extracted in batches by the autofact worker
+                    await self.db.autofact_jobs.enqueue(
+                        context=context,
+                        person=person,
+                        user_message=(
+                            agent_response.transcribed_user_message.message_text
+                        ),
+                        bot_response=agent_response.total_text or "",
+                    )
+                self.logger.info(
+                    f"Generated a response for the message from {person.user_handle} in chat {context.chat_id} "
+                    f"with usage of {agent_response.total_price}"
+                )
+            elif not user_message_persisted:
+                await self.persist_dialog_message(
+                    context=context,
+                    person=person,
+                    transcribed_message=TranscribedMessage(
+                        message_text=message.message_text,
+                        timestamp=message.timestamp,
+                    ),
+                )
+                self.logger.info(
+                    f"No response generated for the message from {person.user_handle} in chat {context.chat_id}"
+                )
+        finally:
+            if not usage_settled:
+                # Release the reservation when no response was produced
+                await self.db.user_usage.settle_usage(
+                    person=person, reserved_points=reserved_usage, actual_points=0
+                )
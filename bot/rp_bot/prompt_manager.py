@@ -1,12 +1,55 @@
-from typing import Tuple
+import asyncio
+from typing import Collection, Dict, List, Optional, Tuple
+
+from bson import ObjectId
 
 from .db import DB
+from .prompt_packer import PromptPacker, PromptSection, count_tokens
+from .storage import AutofactJobRecord, DialogMessageRecord
+from .turn_reads import TurnReads
+from ..models.cache import TTLCache
+from ..models.config import CacheConfig, MemoryConfig
 from ..models.handlers_input import Person, Context, TranscribedMessage
 
 
+CHAT_FACTS_HEADER = "The following facts are known about the users in this chat:\n"
+USER_FACTS_HEADER = "The following facts are known about the user:\n"
+
+# Rendered history line and its token count
+RenderedLine = Tuple[str, int]
+
+
 class PromptManager:
-    def __init__(self, db: DB) -> None:
+    def __init__(
+        self,
+        db: DB,
+        cache_config: Optional[CacheConfig] = None,
+        memory_config: Optional[MemoryConfig] = None,
+    ) -> None:
         self.db = db
+        cache_config = cache_config or CacheConfig()
+        memory_config = memory_config or MemoryConfig()
+        self.memory_config = memory_config
+        # Rendered history lines per chat thread, keyed by dialog message id
+        self.rendered_history: TTLCache[
+            Tuple[int, Optional[int]], Dict[ObjectId, RenderedLine]
+        ] = TTLCache(max_size=cache_config.max_chats)
+        self.prompt_packer = PromptPacker(memory_config.prompt_token_budget)
+
+    def new_turn_reads(
+        self,
+        context: Context,
+        person: Optional[Person] = None,
+        chat_language: Optional[str] = None,
+        exclude_message_ids: Collection[ObjectId] = (),
+    ) -> TurnReads:
+        return TurnReads(
+            db=self.db,
+            context=context,
+            person=person,
+            chat_language=chat_language,
+            exclude_message_ids=exclude_message_ids,
+        )
 
     async def _compose_user_input_prompt(
         self,
@@ -39,15 +82,19 @@ class PromptManager:
         initiator: Person,
         context: Context,
         user_transcribed_message: TranscribedMessage,
+        exclude_message_ids: Collection[ObjectId] = (),
     ) -> str:
+        reads = self.new_turn_reads(
+            context, initiator, exclude_message_ids=exclude_message_ids
+        )
         user_input = await self._compose_user_input_prompt(
             person=initiator,
             context=context,
             transcribed_message=user_transcribed_message,
         )
-        chat_mode_prompt = await self._compose_chat_mode_prompt(context)
-        chat_history_prompt = await self._compose_chat_history_prompt(
-            user_input, context
+        chat_mode_prompt, chat_history_prompt = await asyncio.gather(
+            self._compose_chat_mode_prompt(context, reads),
+            self._compose_chat_history_prompt(user_input, context, reads),
         )
         return (
             "Your task is to determine wether or not we can somehow "
@@ -63,28 +110,28 @@ class PromptManager:
             "usefulness, funniness and other factors."
         )
 
-    async def _compose_chat_mode_prompt(self, context: Context) -> str:
-        chat_mode = await self.db.chat_modes.get_chat_mode(context)
+    async def _compose_chat_mode_prompt(
+        self, context: Context, reads: Optional[TurnReads] = None
+    ) -> str:
+        reads = reads or self.new_turn_reads(context)
+        chat_mode = await reads.get_chat_mode()
         return f"The current chat mode is: {chat_mode.mode_name}. {chat_mode.mode_description}"
 
-    async def compose_chat_facts_prompt(self, context: Context) -> str:
-        chat_facts = await self.db.user_facts.get_chat_facts(context)
-        return (
-            "The following facts are known about the users in this chat:\n"
-            + "\n".join([f"{user}: {fact}" for user, fact in chat_facts])
+    async def compose_chat_facts_prompt(
+        self, context: Context, reads: Optional[TurnReads] = None
+    ) -> str:
+        reads = reads or self.new_turn_reads(context)
+        chat_facts = await reads.get_chat_facts()
+        return CHAT_FACTS_HEADER + "\n".join(
+            [f"{user}: {fact}" for user, fact in chat_facts]
         )
 
-    async def compose_user_facts_prompt(self, person: Person, context: Context) -> str:
-        user_facts = await self.db.user_facts.get_user_facts(context, person)
-        return "The following facts are known about the user:\n" + "\n".join(user_facts)
-
-    async def _compose_user_introduction_prompt(
-        self, person: Person, context: Context
+    async def compose_user_facts_prompt(
+        self, person: Person, context: Context, reads: Optional[TurnReads] = None
     ) -> str:
-        user_introduction = await self.db.user_introductions.get_user_introduction(
-            context, person
-        )
-        return f"Introduction of a user who requested the response: {user_introduction}"
+        reads = reads or self.new_turn_reads(context, person)
+        user_facts = await reads.get_user_facts()
+        return USER_FACTS_HEADER + "\n".join(user_facts)
 
     def _compose_message_history_prompt(
         self, message_tuple: Tuple[str, bool, TranscribedMessage]
@@ -107,25 +154,166 @@ class PromptManager:
         message_prompt = ". ".join(result)
         return f"{name} ({message_date.strftime('%Y-%m-%d %H:%M:%S')} UTC): {message_prompt}"
 
-    async def _compose_chat_history_prompt(self, user_input, context: Context) -> str:
-        messages_history = await self.db.dialogs.get_messages(context)
+    def _render_history_line(self, record: DialogMessageRecord) -> RenderedLine:
+        line = self._compose_message_history_prompt(
+            (record.user_handle, record.is_bot, record.message)
+        )
+        message = record.message
+        if (
+            record.token_count is None
+            or message.image_description
+            or message.voice_description
+        ):
+            return line, count_tokens(line)
+        # The stored count covers the message text, only the prefix is counted
+        prefix = line[: len(line) - len(message.message_text or "")]
+        return line, record.token_count + count_tokens(prefix)
+
+    def _render_history_lines(
+        self, context: Context, records: List[DialogMessageRecord]
+    ) -> List[RenderedLine]:
+        """Render history lines, reusing lines rendered on previous turns
+
+        Stored messages never change, so only messages that entered the window
+        since the last turn are rendered. Lines of messages that left the
+        window (or were deleted) are dropped.
+        """
+        # Threads of a chat leave out different summarized messages, so
+        # they keep their own lines
+        history_key = (context.chat_id, context.thread_id)
+        previous = self.rendered_history.get(history_key) or {}
+        rendered: Dict[ObjectId, RenderedLine] = {}
+        for record in records:
+            rendered_line = previous.get(record.id)
+            if rendered_line is None:
+                rendered_line = self._render_history_line(record)
+            rendered[record.id] = rendered_line
+        self.rendered_history.set(history_key, rendered)
+        return list(rendered.values())
+
+    def _build_chat_history_section(
+        self,
+        context: Context,
+        messages_history: List[DialogMessageRecord],
+        summarized_until_id: Optional[ObjectId] = None,
+    ) -> PromptSection:
         if len(messages_history) == 0:
-            return "It's the first message in the chat.\n"
+            return PromptSection(
+                name="chat_history", header="It's the first message in the chat.\n"
+            )
         # Take everything besides the last one since the last one is the current message
-        messages_history_prompt = "\n".join(
-            [
-                self._compose_message_history_prompt(message_tuple)
-                for message_tuple in messages_history[:-1]
+        tail = messages_history[:-1]
+        if summarized_until_id is not None:
+            # Older messages of the thread are covered by its summary
+            tail = [
+                record
+                for record in tail
+                if record.id > summarized_until_id
+                or record.thread_id != context.thread_id
             ]
+        rendered_lines = self._render_history_lines(context, tail)
+        return PromptSection(
+            name="chat_history",
+            header="The conversation so far:\n",
+            lines=[line for line, _ in rendered_lines],
+            footer="\n\n",
+            token_counts=[tokens for _, tokens in rendered_lines],
+            keep="last",
+        )
+
+    async def _compose_chat_history_prompt(
+        self, user_input, context: Context, reads: Optional[TurnReads] = None
+    ) -> str:
+        reads = reads or self.new_turn_reads(context)
+        messages_history = await reads.get_message_records()
+        section = self._build_chat_history_section(context, messages_history)
+        return section.render(section.lines)
+
+    async def _get_summary_scope(self, reads: TurnReads) -> dict:
+        if not self.memory_config.summary_enabled:
+            return {}
+        return await reads.get_memory_scope()
+
+    def compose_summary_system_prompt(self) -> str:
+        return (
+            "You maintain a rolling summary of a group chat conversation. "
+            "Merge the new messages into the current summary, keeping names, "
+            "decisions, open questions and anything the participants may refer "
+            "back to. Drop small talk. Write the summary in the language of the "
+            "conversation and keep it under "
+            f"{self.memory_config.summary_token_target} tokens."
+        )
+
+    def compose_summary_prompt(
+        self, summary: Optional[str], records: List[DialogMessageRecord]
+    ) -> str:
+        new_messages = "\n".join(
+            self._compose_message_history_prompt(
+                (record.user_handle, record.is_bot, record.message)
+            )
+            for record in records
+        )
+        return (
+            f"Current summary:\n{summary or 'There is no summary yet.'}\n\n"
+            f"New messages:\n{new_messages}"
+        )
+
+    def compose_output_type_router_system_prompt(self) -> str:
+        return (
+            "You choose the output type of the assistant's answer to the latest "
+            "message of a group chat. Answer with text unless the user explicitly "
+            "asks for audio or an image. Only pick the output type, its content "
+            "is written separately."
+        )
+
+    def compose_output_type_router_prompt(
+        self,
+        transcribed_message: TranscribedMessage,
+        allowed_output_types: List[str],
+    ) -> str:
+        prompt_lines = [f"Message: {transcribed_message.message_text or ''}"]
+        if transcribed_message.voice_description:
+            prompt_lines.append(
+                f"Voice message transcript: {transcribed_message.voice_description}"
+            )
+        has_image = transcribed_message.image_description is not None
+        prompt_lines.append(f"Has attached image: {'yes' if has_image else 'no'}")
+        prompt_lines.append(f"Allowed output types: {', '.join(allowed_output_types)}")
+        return "\n".join(prompt_lines)
+
+    def compose_autofact_system_prompt(self) -> str:
+        return (
+            "You extract durable facts about the participants of a group chat "
+            "from their conversation with an assistant."
+        )
+
+    async def compose_autofact_prompt(
+        self, context: Context, jobs: List[AutofactJobRecord]
+    ) -> str:
+        existing_facts = await self.compose_chat_facts_prompt(context)
+        turns = "\n\n".join(
+            f"The user {job.user_handle} said: {job.user_message}\n"
+            f"The assistant replied: {job.bot_response}"
+            for job in jobs
+        )
+        return (
+            "Here are the latest turns of the conversation:\n"
+            f"{turns}\n\n"
+            f"{existing_facts}\n"
+            "Generate facts based on the above context. Avoid generating facts that are "
+            "already saved in our database (see existing facts above).\n"
+            "IMPORTANT: For the user_handle field, use the user's handle (e.g., '@username'), "
+            "NOT their display name or first name."
         )
-        return "The conversation so far:\n" f"{messages_history_prompt}\n\n"
 
     async def compose_prompt(
         self,
         initiator: Person,
         context: Context,
         user_transcribed_message: TranscribedMessage,
+        reads: Optional[TurnReads] = None,
     ) -> str:
+        reads = reads or self.new_turn_reads(context, initiator)
         current_date = user_transcribed_message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
         current_date_prompt = f"Today's date and time is: {current_date} (UTC)"
         user_input_prompt = await self._compose_user_input_prompt(
@@ -133,29 +321,90 @@ class PromptManager:
             context=context,
             transcribed_message=user_transcribed_message,
         )
-        chat_history_prompt = await self._compose_chat_history_prompt(
-            user_input_prompt, context
+        # The sections read independent data, so their reads run concurrently
+        (
+            messages_history,
+            chat_facts,
+            user_facts,
+            user_introduction,
+            summary_scope,
+        ) = await asyncio.gather(
+            reads.get_message_records(),
+            reads.get_chat_facts(),
+            reads.get_user_facts(),
+            reads.get_user_introduction(),
+            self._get_summary_scope(reads),
         )
-        chat_facts_prompt = await self.compose_chat_facts_prompt(context)
-        user_facts_prompt = await self.compose_user_facts_prompt(initiator, context)
-        user_introduction_prompt = await self._compose_user_introduction_prompt(
-            initiator, context
+        summary = summary_scope.get("summary")
+        # Sections are listed by priority: the lowest ones are cut first when
+        # the prompt would exceed the token budget
+        packed = self.prompt_packer.pack(
+            [
+                PromptSection(
+                    name="current_date", header=current_date_prompt, required=True
+                ),
+                PromptSection(
+                    name="user_input", header=user_input_prompt, required=True
+                ),
+                PromptSection(
+                    name="user_facts",
+                    header=USER_FACTS_HEADER,
+                    lines=user_facts,
+                    ordered=False,
+                ),
+                # The summary is what is left of the older messages cut from
+                # the history, so it outranks the raw history
+                PromptSection(
+                    name="conversation_summary",
+                    lines=[f"Summary of the earlier conversation:\n{summary}"]
+                    if summary
+                    else [],
+                ),
+                self._build_chat_history_section(
+                    context,
+                    messages_history,
+                    summary_scope.get("summarized_until_id") if summary else None,
+                ),
+                PromptSection(
+                    name="chat_facts",
+                    header=CHAT_FACTS_HEADER,
+                    lines=[f"{user}: {fact}" for user, fact in chat_facts],
+                    ordered=False,
+                ),
+                PromptSection(
+                    name="user_introduction",
+                    lines=[
+                        "Introduction of a user who requested the response: "
+                        f"{user_introduction}"
+                    ],
+                ),
+            ]
         )
         return "\n".join(
-            [
-                current_date_prompt,
-                chat_history_prompt,
-                user_input_prompt,
-                chat_facts_prompt,
-                user_facts_prompt,
-                user_introduction_prompt,
+            packed[name]
+            for name in [
+                "current_date",
+                "conversation_summary",
+                "chat_history",
+                "user_input",
+                "chat_facts",
+                "user_facts",
+                "user_introduction",
             ]
+            if packed[name]
         )
 
-    async def get_reply_system_prompt(self, context: Context) -> str:
+    async def get_reply_system_prompt(
+        self,
+        context: Context,
+        chat_language: Optional[str] = None,
+        reads: Optional[TurnReads] = None,
+    ) -> str:
+        reads = reads or self.new_turn_reads(context, chat_language=chat_language)
         chat_name = context.chat_name
-        chat_mode_prompt = await self._compose_chat_mode_prompt(context)
-        chat_language = await self.db.chats.get_language(context)
+        chat_mode_prompt, chat_language = await asyncio.gather(
+            self._compose_chat_mode_prompt(context, reads), reads.get_language()
+        )
         return (
             "You are a helpful assistant. "
             f"You are currently in the chat: {chat_name}. "
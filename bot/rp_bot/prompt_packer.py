@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+TOKENIZER_ENCODING = "o200k_base"
+# Rough average for English text when no tokenizer is available
+CHARS_PER_TOKEN = 4
+# A failed encoding load is retried in the background after that long
+ENCODING_RETRY_SECONDS = 300
+
+_encoding = None
+_next_load_attempt = 0.0
+_load_task: Optional[asyncio.Task] = None
+
+
+def _load_encoding():
+    global _encoding, _next_load_attempt
+    _next_load_attempt = time.monotonic() + ENCODING_RETRY_SECONDS
+    try:
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as exc:
+        # The encoding is downloaded on first use, which may be impossible
+        logging.getLogger(__name__).warning(
+            "tiktoken encoding is unavailable, estimating token counts: %s", exc
+        )
+    return _encoding
+
+
+async def warm_up_encoding() -> bool:
+    """Load the encoding in a worker thread, its first load is a download
+
+    Returns whether token counts are exact from now on.
+    """
+    if tiktoken is not None and _encoding is None:
+        await asyncio.to_thread(_load_encoding)
+    return _encoding is not None
+
+
+def _get_encoding():
+    global _load_task
+    if tiktoken is None or _encoding is not None:
+        return _encoding
+    if time.monotonic() < _next_load_attempt:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop to block, so the encoding can be loaded right here
+        return _load_encoding()
+    # Never download inside the event loop, estimate until the load is done
+    if _load_task is None or _load_task.done():
+        _load_task = loop.create_task(warm_up_encoding())
+    return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PromptSection:
+    """A block of the prompt made of a header, lines and a footer.
+
+    Lines are dropped one by one when the section does not fit the budget;
+    `keep` tells which end of the section is worth keeping. Lines of an
+    ordered section (e.g. chat history) are only taken from that end, while
+    an unordered one (e.g. facts) skips a line that does not fit and goes on.
+    """
+
+    name: str
+    header: str = ""
+    lines: List[str] = field(default_factory=list)
+    footer: str = ""
+    token_counts: Optional[List[int]] = None
+    keep: Literal["first", "last"] = "last"
+    ordered: bool = True
+    required: bool = False
+
+    def render(self, lines: List[str]) -> str:
+        return self.header + "\n".join(lines) + self.footer
+
+
+class PromptPacker:
+    """Fits prompt sections into a token budget by priority.
+
+    Sections are given in priority order. Required sections are always kept;
+    the others take whole lines while the budget lasts and are left out
+    entirely once even their header, or none of their lines, no longer fits.
+    """
+
+    def __init__(self, token_budget: int) -> None:
+        self.token_budget = token_budget
+
+    def pack(self, sections: List[PromptSection]) -> Dict[str, str]:
+        remaining = self.token_budget
+        packed: Dict[str, str] = {}
+        for section in sections:
+            if section.required:
+                text = section.render(section.lines)
+                packed[section.name] = text
+                remaining -= count_tokens(text)
+                continue
+            overhead = count_tokens(section.header) + count_tokens(section.footer)
+            if overhead > remaining:
+                packed[section.name] = ""
+                continue
+            lines = self._take_lines(section, remaining - overhead)
+            if section.lines and not lines:
+                # A header without any of its lines would only confuse
+                packed[section.name] = ""
+                continue
+            remaining -= overhead + sum(tokens for _, tokens in lines)
+            packed[section.name] = section.render([line for line, _ in lines])
+        return packed
+
+    @staticmethod
+    def _take_lines(
+        section: PromptSection, budget: int
+    ) -> List[Tuple[str, int]]:
+        token_counts = section.token_counts or [
+            count_tokens(line) for line in section.lines
+        ]
+        # Each line is joined with a newline
+        weighted = [
+            (line, tokens + 1) for line, tokens in zip(section.lines, token_counts)
+        ]
+        if section.keep == "last":
+            weighted.reverse()
+        taken = []
+        for line, tokens in weighted:
+            if tokens > budget:
+                if section.ordered:
+                    # Skipping would leave a gap, e.g. a reply without its question
+                    break
+                continue
+            taken.append((line, tokens))
+            budget -= tokens
+        if section.keep == "last":
+            taken.reverse()
+        return taken
@@ -60,8 +60,7 @@ class RPBotHandlerMixin(ABC):
         )
 
     async def initialize_context(self, person: Person, context: Context) -> None:
-        await self.db.create_if_not_exists(person, context)
-        await self.db.update_if_needed(person, context)
+        await self.db.initialize_context(person, context)
 
     async def has_terms_accepted(self, person: Person, context: Context) -> bool:
         return await self.auth.has_accepted_terms(person.user_handle)
@@ -15,6 +15,53 @@ class ChatModeRecord(BaseModel):
     mode_description: str
 
 
+class ChatSettings(BaseModel):
+    """Snapshot of the per-chat flags read on the message hot path"""
+
+    language: Optional[str] = None
+    is_started: bool = False
+    conversation_tracker: bool = False
+    auto_fact: bool = False
+    autoengage: bool = False
+
+
+class UserAccessState(BaseModel):
+    """Ban and terms state of a user, loaded with a single projection"""
+
+    banned: bool = False
+    banned_until: Optional[float] = None
+    accepted_terms: bool = False
+    declined_terms: bool = False
+
+    def is_banned(self, now: float) -> bool:
+        return self.banned and (self.banned_until is None or self.banned_until > now)
+
+
+class DialogMessageRecord(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    id: ObjectId
+    user_handle: str
+    is_bot: bool
+    message: TranscribedMessage
+    token_count: Optional[int] = None
+    thread_id: Optional[int] = None
+
+
+class AutofactJobRecord(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    id: ObjectId
+    chat_id: int
+    thread_id: Optional[int] = None
+    chat_name: Optional[str] = None
+    user_handle: str
+    user_message: str = ""
+    bot_response: str = ""
+    created_at: datetime
+    claim_id: Optional[str] = None
+
+
 class UserUsageRecord(BaseModel):
     this_month_usage: int
     limit: int
@@ -22,6 +69,9 @@ class UserUsageRecord(BaseModel):
 
 
 class BaseStore(Protocol):
+    async def ensure_indexes(self) -> None:
+        pass
+
     async def create_if_not_exists(self, context: Context, person: Person) -> None:
         pass
 
@@ -42,6 +92,9 @@ class UsersStore(BaseStore, Protocol):
     async def unban_user(self, user_handle: str) -> None:
         pass
 
+    async def get_access_state(self, user_handle: str) -> UserAccessState:
+        pass
+
     async def is_user_banned(self, user_handle: str) -> bool:
         pass
 
@@ -62,6 +115,14 @@ class UserUsageStore(BaseStore, Protocol):
     async def add_usage_points(self, person: Person, points: int) -> None:
         pass
 
+    async def reserve_usage(self, person: Person, points: float) -> bool:
+        pass
+
+    async def settle_usage(
+        self, person: Person, reserved_points: float, actual_points: float
+    ) -> None:
+        pass
+
     async def get_user_usage(self, person: Person) -> int:
         pass
 
@@ -88,6 +149,12 @@ class ChatsStore(BaseStore, Protocol):
     async def get_language(self, context: Context) -> str:
         pass
 
+    async def get_chat_settings(self, context: Context) -> ChatSettings:
+        pass
+
+    def get_language_cache_stats(self) -> dict:
+        pass
+
     async def get_conversation_tracker_state(self, context: Context) -> bool:
         pass
 
@@ -114,6 +181,11 @@ class ChatsStore(BaseStore, Protocol):
     ) -> None:
         pass
 
+    async def update_memory_scope(
+        self, context: Context, scope_key: str, fields: dict
+    ) -> None:
+        pass
+
     async def clear_memory(self, context: Context) -> None:
         pass
 
@@ -157,6 +229,7 @@ class UserFactsStore(BaseStore, Protocol):
         context: Context,
         query: Optional[str] = None,
         participant_key: Optional[str] = None,
+        limit: int = 10,
     ) -> List[str]:
         pass
 
@@ -206,6 +279,14 @@ class RecentDialogStore(BaseStore, Protocol):
     ) -> List[Tuple[str, bool, TranscribedMessage]]:
         pass
 
+    async def get_message_records(self, context: Context) -> List[DialogMessageRecord]:
+        pass
+
+    async def get_message_records_after(
+        self, context: Context, after_id: Optional[ObjectId], limit: int
+    ) -> List[DialogMessageRecord]:
+        pass
+
     async def add_message_to_dialog(
         self,
         context: Context,
@@ -214,7 +295,7 @@ class RecentDialogStore(BaseStore, Protocol):
         scope_key: Optional[str] = None,
         memory_role: Optional[str] = None,
         provider_metadata: Optional[Dict[str, Any]] = None,
-    ) -> None:
+    ) -> ObjectId:
         pass
 
     async def search_recent_dialog(
@@ -225,3 +306,25 @@ class RecentDialogStore(BaseStore, Protocol):
         limit: int = 6,
     ) -> List[str]:
         pass
+
+
+class AutofactJobsStore(BaseStore, Protocol):
+    async def enqueue(
+        self,
+        context: Context,
+        person: Person,
+        user_message: str,
+        bot_response: str,
+    ) -> None:
+        pass
+
+    async def claim_batch(
+        self, max_jobs: int, lease_seconds: float
+    ) -> List[AutofactJobRecord]:
+        pass
+
+    async def complete(self, claim_id: str) -> None:
+        pass
+
+    async def fail(self, claim_id: str, max_attempts: int) -> None:
+        pass
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+from logging import Logger
+from typing import Dict, Optional, Tuple
+
+from omnimodkit.models_toolkit import ModelsToolkit
+from pydantic import BaseModel, Field
+
+from .db import DB
+from .prompt_manager import PromptManager
+from ..models.config.bot_config import MemoryConfig
+from ..models.handlers_input import Context
+
+
+class ConversationSummary(BaseModel):
+    summary: str = Field(
+        description="Updated summary of the conversation including the new messages."
+    )
+
+
+# Messages folded into the summary by a single update at most
+SUMMARY_BATCH_MESSAGES = 100
+
+
+class ConversationSummarizer:
+    """Keeps a rolling summary per memory scope outside of the reply path.
+
+    Messages older than the raw tail of `fallback_last_n_messages` are folded
+    into the scope's summary, and the id of the last folded message is stored
+    next to it so prompts only send the messages after it verbatim. Messages
+    are read from that id forward, so the ones that left the prompt window
+    between two updates are folded too.
+
+    The summary serves everyone in the thread, so its model calls are not
+    billed to the usage of the user whose message triggered the update.
+    """
+
+    def __init__(
+        self,
+        db: DB,
+        prompt_manager: PromptManager,
+        models_toolkit: ModelsToolkit,
+        memory_config: MemoryConfig,
+        logger: Logger,
+    ) -> None:
+        self.db = db
+        self.prompt_manager = prompt_manager
+        self.models_toolkit = models_toolkit
+        self.memory_config = memory_config
+        self.logger = logger
+        self._tasks: Dict[Tuple[int, Optional[int]], asyncio.Task] = {}
+
+    def schedule(self, context: Context) -> None:
+        """Start a summary update unless one is already running for the thread"""
+        key = (context.chat_id, context.thread_id)
+        if key in self._tasks:
+            return
+        task = asyncio.create_task(self._run(context))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _run(self, context: Context) -> None:
+        try:
+            await self.update_summary(context)
+        except Exception as exc:
+            self.logger.error(
+                "Failed to update the conversation summary in chat "
+                f"{context.chat_id}: {exc}"
+            )
+
+    async def update_summary(self, context: Context) -> bool:
+        """Fold messages that left the raw tail into the summary
+
+        Returns True if the summary was updated.
+        """
+        reads = self.prompt_manager.new_turn_reads(context)
+        memory_scope = await reads.get_memory_scope()
+        # The summary belongs to the thread, other threads are not folded in
+        records = await self.db.dialogs.get_message_records_after(
+            context,
+            after_id=memory_scope.get("summarized_until_id"),
+            limit=self.memory_config.fallback_last_n_messages
+            + SUMMARY_BATCH_MESSAGES,
+        )
+        aged_out = records[
+            : max(len(records) - self.memory_config.fallback_last_n_messages, 0)
+        ]
+        if not aged_out:
+            return False
+
+        result: ConversationSummary = await self.models_toolkit.text_model.arun(
+            system_prompt=self.prompt_manager.compose_summary_system_prompt(),
+            pydantic_model=ConversationSummary,
+            user_input=self.prompt_manager.compose_summary_prompt(
+                memory_scope.get("summary"), aged_out
+            ),
+        )
+        await self.db.chats.update_memory_scope(
+            context=context,
+            scope_key=await reads.get_scope_key(),
+            fields={
+                "summary": result.summary,
+                "summarized_until_id": aged_out[-1].id,
+                "summary_updated_at": datetime.utcnow(),
+            },
+        )
+        return True
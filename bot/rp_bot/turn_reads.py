@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from .db import DB
+from .memory_utils import build_scope_key
+from .storage import ChatModeRecord, DialogMessageRecord
+from ..models.handlers_input import Context, Person
+
+
+class TurnReads:
+    """Store reads needed to build the prompts of a single turn.
+
+    Every read is started at most once per turn and shared by all callers,
+    so independent reads can be awaited concurrently without being issued
+    twice (e.g. the chat mode used by both the system prompt and the memory
+    scope key).
+    """
+
+    def __init__(
+        self,
+        db: DB,
+        context: Context,
+        person: Optional[Person] = None,
+        chat_language: Optional[str] = None,
+        exclude_message_ids: Collection[ObjectId] = (),
+    ) -> None:
+        self.db = db
+        self.person = person
+        self.context = context
+        self.chat_language = chat_language
+        # Messages already persisted but passed to the prompts as user input
+        self.exclude_message_ids = set(exclude_message_ids)
+        self._tasks: Dict[str, asyncio.Future] = {}
+
+    def _load(self, name: str, read: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        task = self._tasks.get(name)
+        if task is None:
+            task = asyncio.ensure_future(read())
+            self._tasks[name] = task
+        return task
+
+    async def get_chat_mode(self) -> ChatModeRecord:
+        return await self._load(
+            "chat_mode", lambda: self.db.chat_modes.get_chat_mode(self.context)
+        )
+
+    async def get_scope_key(self) -> str:
+        chat_mode = await self.get_chat_mode()
+        return build_scope_key(context=self.context, mode_id=chat_mode.mode_name)
+
+    async def get_memory_scope(self) -> dict:
+        async def read() -> dict:
+            scope_key = await self.get_scope_key()
+            return await self.db.chats.get_memory_scope(self.context, scope_key)
+
+        return await self._load("memory_scope", read)
+
+    async def get_language(self) -> str:
+        if self.chat_language is not None:
+            return self.chat_language
+        return await self._load(
+            "language", lambda: self.db.chats.get_language(self.context)
+        )
+
+    async def get_message_records(self) -> List[DialogMessageRecord]:
+        async def read() -> List[DialogMessageRecord]:
+            records = await self.db.dialogs.get_message_records(self.context)
+            return [
+                record
+                for record in records
+                if record.id not in self.exclude_message_ids
+            ]
+
+        return await self._load("message_records", read)
+
+    async def get_chat_facts(self) -> List[Tuple[str, str]]:
+        return await self._load(
+            "chat_facts", lambda: self.db.user_facts.get_chat_facts(self.context)
+        )
+
+    async def get_user_facts(self) -> List[str]:
+        return await self._load(
+            "user_facts",
+            lambda: self.db.user_facts.get_user_facts(self.context, self.person),
+        )
+
+    async def get_user_introduction(self) -> str:
+        return await self._load(
+            "user_introduction",
+            lambda: self.db.user_introductions.get_user_introduction(
+                self.context, self.person
+            ),
+        )
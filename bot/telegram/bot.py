@@ -6,6 +6,7 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    ChatMemberHandler,
     filters,
     Application,
 )
@@ -13,17 +14,24 @@ from telegram.constants import ParseMode
 
 import logging
 import asyncio
-from typing import Literal, Optional, Tuple
+import io
+import time
+from typing import AsyncIterator, Literal, Optional, Tuple
 from functools import partial
 
+from .edit_scheduler import EditScheduler
+from .latest_value_channel import LatestValueChannel
+from .media import can_downscale_images
+from .webhook import TelegramWebhookApp, serve_asgi_app
 from .utils import (
     get_bot_input,
-    buffer_streaming_response,
+    is_admin_change,
     is_group_chat,
 )
 from .keyboards import get_paginated_list_keyboard
 
 from ..models.base_bot import BaseBot
+from ..models.cache import TTLCache
 from ..models.config import TGConfig
 from ..models.base_handlers import BaseHandler
 from ..models.handlers_response import KeyboardResponse
@@ -36,18 +44,36 @@ class TelegramBot:
         telegram_token: str,
         bot: BaseBot,
         telegram_bot_config: TGConfig,
+        webhook_secret_token: Optional[str] = None,
     ):
         self.telegram_token = telegram_token
+        self.webhook_secret_token = webhook_secret_token
         self.telegram_bot_config = telegram_bot_config
+        self.bot = bot
         self.commands = bot.commands
         self.messages = bot.messages
         self.callbacks = bot.callbacks
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.admin_cache = TTLCache(
+            max_size=telegram_bot_config.admin_cache_max_chats,
+            ttl_seconds=telegram_bot_config.admin_cache_ttl_seconds,
+        )
+        self.edit_scheduler = EditScheduler(
+            private_chat_interval=telegram_bot_config.private_chat_edit_interval,
+            group_chat_interval=telegram_bot_config.group_chat_edit_interval,
+            global_edits_per_second=telegram_bot_config.global_edits_per_second,
+        )
 
     async def post_init(self, application: Application) -> None:
         """
         Post initialization hook for the bot.
         """
+        if self.telegram_bot_config.downscale_photos and not can_downscale_images():
+            self.logger.warning(
+                "downscale_photos is enabled but Pillow is not installed, "
+                "photos are sent to the vision model without downscaling"
+            )
+        await self.bot.startup()
         bot_commands = [
             BotCommand(
                 command=command.command,
@@ -59,6 +85,12 @@ class TelegramBot:
         ]
         await application.bot.set_my_commands(bot_commands)
 
+    async def post_shutdown(self, application: Application) -> None:
+        """
+        Post shutdown hook for the bot.
+        """
+        await self.bot.shutdown()
+
     def run(self) -> None:
         """
         Runs the bot indefinitely until the user presses Ctrl+C
@@ -73,6 +105,7 @@ class TelegramBot:
                 )
             )
             .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
             .build()
         )
         command_handlers = [
@@ -95,11 +128,71 @@ class TelegramBot:
             )
             for callback in self.callbacks
         ]
+        chat_member_handlers = [
+            ChatMemberHandler(
+                self.handle_chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER
+            )
+        ]
         application.add_handlers(
-            command_handlers + message_handlers + callback_handlers
+            command_handlers
+            + message_handlers
+            + callback_handlers
+            + chat_member_handlers
         )
         application.add_error_handler(self.error_handle)
-        application.run_polling()
+        if self.telegram_bot_config.webhook.enabled:
+            asyncio.run(self.run_webhook(application))
+        else:
+            # chat_member updates are only delivered when requested explicitly
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    async def run_webhook(self, application: Application) -> None:
+        """
+        Receives updates through a webhook served by an embedded ASGI server.
+        Run a single replica: bans, facts snapshots, autoengage debouncing and
+        edit pacing are kept per process, and every start registers the webhook.
+        """
+        webhook_config = self.telegram_bot_config.webhook
+        if not self.webhook_secret_token:
+            # Without it anyone could post forged updates, e.g. from admins
+            raise RuntimeError(
+                "Webhook mode requires a secret token, set TELEGRAM_WEBHOOK_SECRET"
+            )
+        webhook_app = TelegramWebhookApp(
+            application,
+            url_path=webhook_config.url_path,
+            secret_token=self.webhook_secret_token,
+        )
+        await application.initialize()
+        await self.post_init(application)
+        await application.start()
+        try:
+            if webhook_config.public_url:
+                await application.bot.set_webhook(
+                    url=webhook_config.public_url.rstrip("/") + webhook_app.url_path,
+                    secret_token=self.webhook_secret_token,
+                    max_connections=webhook_config.max_connections,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            await serve_asgi_app(
+                webhook_app,
+                listen=webhook_config.listen,
+                port=webhook_config.port,
+                max_connections=webhook_config.max_connections,
+            )
+        finally:
+            await application.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
+
+    async def handle_chat_member_update(
+        self, update: Update, context: CallbackContext
+    ) -> None:
+        """
+        Drops the cached administrators of a chat when an admin joins or leaves.
+        """
+        if is_admin_change(update):
+            self.admin_cache.pop(update.effective_chat.id)
 
     async def error_handle(self, update: Update, context: CallbackContext) -> None:
         self.logger.error(
@@ -112,43 +205,50 @@ class TelegramBot:
         """
         Handles the update and sends the response back to the user.
         """
-        bot_input = await get_bot_input(update, context)
+        bot_input = await get_bot_input(
+            update,
+            context,
+            resolve_group_admin=bot_handler.requires_group_admin,
+            admin_cache=self.admin_cache,
+            photo_pixel_budget=self.telegram_bot_config.photo_pixel_budget,
+            downscale_photos=self.telegram_bot_config.downscale_photos,
+            photo_jpeg_quality=self.telegram_bot_config.photo_jpeg_quality,
+        )
 
         if bot_handler.streamable and self.telegram_bot_config.enable_message_streaming:
             first_message_id = None
-            final_image_url = None
-            final_audio_bytes = None
-            final_keyboard = None
             last_sent_text = None  # Track last sent text to avoid duplicate edits
+            chat_id = update.effective_chat.id
+            group_chat = is_group_chat(update=update)
 
-            async for result in buffer_streaming_response(
-                bot_handler.stream_handle(
-                    person=bot_input.person,
-                    context=bot_input.context,
-                    message=bot_input.message,
-                    args=bot_input.args,
-                ),
-                is_group_chat(update=update),
-            ):
-                if result is not None:
-                    # Determine appropriate state based on content and push it
-                    await self.push_state(update, context, result)
-
-                    # Track the final media and keyboard for sending after streaming
-                    if result.image_url:
-                        final_image_url = result.image_url
-                    if result.audio_bytes:
-                        final_audio_bytes = result.audio_bytes
-                    if result.keyboard:
-                        final_keyboard = result.keyboard
-
-                    # Stream only text updates (ignore media during streaming)
-                    first_message_id, last_sent_text = await self.process_stream_result(
+            # Generation runs in its own task and never waits for Telegram,
+            # delivery always sends the freshest result
+            results: LatestValueChannel[LocalizedCommandResponse] = (
+                LatestValueChannel()
+            )
+            generation_task = asyncio.create_task(
+                self.generate_stream_results(
+                    bot_handler.stream_handle(
+                        person=bot_input.person,
+                        context=bot_input.context,
+                        message=bot_input.message,
+                        args=bot_input.args,
+                    ),
+                    results,
+                )
+            )
+            try:
+                async for result in results:
+                    await self.edit_scheduler.acquire(chat_id, group_chat)
+                    # Results generated while waiting for the slot supersede it
+                    result = results.take_latest(result)
+                    first_message_id, last_sent_text = await self.deliver_stream_result(
                         result, update, context, first_message_id, last_sent_text
                     )
-                    await asyncio.sleep(
-                        self.telegram_bot_config.stream_buffer_sleep_time
-                    )
+            finally:
+                if not generation_task.done():
+                    generation_task.cancel()
+            final_image_url, final_audio_bytes, final_keyboard = await generation_task
 
             # After streaming is complete, send media as separate message if needed
             # Priority: audio > image
@@ -186,6 +286,52 @@ class TelegramBot:
                 await self.push_state(update, context, result)
                 await self.process_result(result, update, context)
 
+    async def generate_stream_results(
+        self,
+        stream: AsyncIterator[Optional[LocalizedCommandResponse]],
+        results: LatestValueChannel[LocalizedCommandResponse],
+    ) -> Tuple[Optional[str], Optional[io.BytesIO], Optional[KeyboardResponse]]:
+        """
+        Publishes the streamed results to the channel as fast as they are
+        generated and returns the final media and keyboard.
+        """
+        final_image_url = None
+        final_audio_bytes = None
+        final_keyboard = None
+        try:
+            async for result in stream:
+                if result is None:
+                    continue
+                # Track the final media and keyboard for sending after streaming
+                if result.image_url:
+                    final_image_url = result.image_url
+                if result.audio_bytes:
+                    final_audio_bytes = result.audio_bytes
+                if result.keyboard:
+                    final_keyboard = result.keyboard
+                results.publish(result)
+        except Exception as e:
+            # Raised to the handler by the delivery loop
+            results.close(error=e)
+            return None, None, None
+        results.close()
+        return final_image_url, final_audio_bytes, final_keyboard
+
+    async def deliver_stream_result(
+        self,
+        result: LocalizedCommandResponse,
+        update: Update,
+        context: CallbackContext,
+        first_message_id: Optional[str],
+        last_sent_text: Optional[str] = None,
+    ) -> Tuple[Optional[str], Optional[str]]:
+        # Determine appropriate state based on content and push it
+        await self.push_state(update, context, result)
+        # Stream only text updates (ignore media during streaming)
+        return await self.process_stream_result(
+            result, update, context, first_message_id, last_sent_text
+        )
+
     async def process_stream_result(
         self,
         result: LocalizedCommandResponse,
@@ -200,6 +346,7 @@ class TelegramBot:
         if latest_text_response:
             if first_message_id is None:
                 # Send initial text message (without image/keyboard for streaming)
+                started_at = time.monotonic()
                 message = await self.send_message(
                     context=context,
                     chat_id=update.effective_chat.id,
@@ -209,17 +356,22 @@ class TelegramBot:
                     reply_message_id=update.effective_message.message_id,
                     keyboard=None,  # No keyboard during streaming
                 )
+                self.edit_scheduler.record_latency(time.monotonic() - started_at)
                 return message.message_id, latest_text_response
             else:
                 # Only update if text content has actually changed
                 if latest_text_response != last_sent_text:
                     try:
+                        started_at = time.monotonic()
                         await context.bot.edit_message_text(
                             chat_id=update.effective_chat.id,
                             message_id=first_message_id,
                             text=latest_text_response,
                             reply_markup=None,  # No keyboard during streaming
                         )
+                        self.edit_scheduler.record_latency(
+                            time.monotonic() - started_at
+                        )
                         return first_message_id, latest_text_response
                     except Exception as e:
                         self.logger.debug(f"Message edit failed: {e}")
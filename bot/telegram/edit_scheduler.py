@@ -0,0 +1,73 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict
+
+
+# Chats are only pruned once there are more of them than that
+MAX_TRACKED_CHATS = 1024
+
+
+class EditScheduler:
+    """Paces streamed message sends and edits under Telegram's rate limits.
+
+    Telegram allows about one message per second in a private chat, twenty
+    per minute in a group and thirty per second for the whole bot. Every
+    chat gets its next slot one interval after its last send, and all chats
+    share a global slot spacing. The intervals are stretched by the measured
+    edit latency, so a slow Bot API gets fewer, larger edits instead of a
+    queue of requests that the rate limiter would have to retry.
+    """
+
+    def __init__(
+        self,
+        private_chat_interval: float = 1.0,
+        group_chat_interval: float = 3.0,
+        global_edits_per_second: float = 25.0,
+        latency_smoothing: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.private_chat_interval = private_chat_interval
+        self.group_chat_interval = group_chat_interval
+        self.global_interval = 1 / global_edits_per_second
+        self.latency_smoothing = latency_smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self.edit_latency = 0.0
+        self._chat_next_slot: Dict[int, float] = {}
+        self._global_next_slot = 0.0
+
+    def _chat_interval(self, is_group_chat: bool) -> float:
+        interval = (
+            self.group_chat_interval if is_group_chat else self.private_chat_interval
+        )
+        return interval + self.edit_latency
+
+    def _next_slot(self, chat_id: int) -> float:
+        return max(self._chat_next_slot.get(chat_id, 0.0), self._global_next_slot)
+
+    def _reserve(self, chat_id: int, is_group_chat: bool, slot: float) -> None:
+        if len(self._chat_next_slot) > MAX_TRACKED_CHATS:
+            self._prune(slot)
+        self._chat_next_slot[chat_id] = slot + self._chat_interval(is_group_chat)
+        self._global_next_slot = slot + self.global_interval
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [
+            chat_id
+            for chat_id, next_slot in self._chat_next_slot.items()
+            if next_slot <= now
+        ]:
+            del self._chat_next_slot[chat_id]
+
+    async def acquire(self, chat_id: int, is_group_chat: bool) -> None:
+        """Wait for the next free slot of the chat and reserve it"""
+        slot = max(self._next_slot(chat_id), self.clock())
+        # Reserved before sleeping so concurrent streams queue behind it
+        self._reserve(chat_id, is_group_chat, slot)
+        delay = slot - self.clock()
+        if delay > 0:
+            await self.sleep(delay)
+
+    def record_latency(self, latency: float) -> None:
+        self.edit_latency += self.latency_smoothing * (latency - self.edit_latency)
@@ -0,0 +1,52 @@
+import asyncio
+from typing import AsyncIterator, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class LatestValueChannel(Generic[T]):
+    """Hands the freshest value from a fast producer to a slower consumer.
+
+    Publishing never waits: a value that was not received yet is replaced by
+    the newer one. Closing the channel lets the consumer receive the last
+    value and then stop, or re-raise the producer's error.
+    """
+
+    def __init__(self) -> None:
+        self._value: Optional[T] = None
+        self._has_value = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, value: T) -> None:
+        self._value = value
+        self._has_value = True
+        self._changed.set()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self._closed = True
+        self._error = error
+        self._changed.set()
+
+    def take_latest(self, default: T) -> T:
+        """Take the value published since the last receive, if there is one"""
+        if not self._has_value:
+            return default
+        value = self._value
+        self._value = None
+        self._has_value = False
+        return value
+
+    async def __aiter__(self) -> AsyncIterator[T]:
+        while True:
+            if not self._has_value and not self._closed:
+                self._changed.clear()
+                await self._changed.wait()
+            if self._has_value:
+                yield self.take_latest(self._value)
+                continue
+            if self._error is not None:
+                raise self._error
+            return
@@ -0,0 +1,59 @@
+import io
+import math
+from typing import Optional, Sequence
+
+from telegram import PhotoSize
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def select_photo_size(
+    photo_sizes: Sequence[PhotoSize], pixel_budget: Optional[int] = None
+) -> PhotoSize:
+    """
+    Selects the smallest photo size that has at least pixel_budget pixels,
+    or the largest one if none of them does
+    """
+    largest = max(photo_sizes, key=lambda size: size.width * size.height)
+    if pixel_budget is None:
+        return largest
+    fitting_sizes = [
+        size for size in photo_sizes if size.width * size.height >= pixel_budget
+    ]
+    if not fitting_sizes:
+        return largest
+    return min(fitting_sizes, key=lambda size: size.width * size.height)
+
+
+def can_downscale_images() -> bool:
+    return Image is not None
+
+
+def downscale_image(
+    content: io.BytesIO, pixel_budget: int, jpeg_quality: int
+) -> io.BytesIO:
+    """
+    Downscales the image to fit into pixel_budget and re-encodes it as JPEG.
+    Blocking, so it is meant to run in a worker thread.
+    """
+    if Image is None:
+        return content
+    content.seek(0)
+    with Image.open(content) as image:
+        width, height = image.size
+        if width * height <= pixel_budget:
+            content.seek(0)
+            return content
+        scale = math.sqrt(pixel_budget / (width * height))
+        resized = image.convert("RGB").resize(
+            (max(1, int(width * scale)), max(1, int(height * scale))),
+            Image.LANCZOS,
+        )
+    downscaled = io.BytesIO()
+    resized.save(downscaled, format="JPEG", quality=jpeg_quality)
+    downscaled.name = "image.jpg"
+    downscaled.seek(0)
+    return downscaled
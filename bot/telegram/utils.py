@@ -1,12 +1,14 @@
+import asyncio
 import io
 
-from typing import List, Optional, AsyncIterator
+from typing import Awaitable, Callable, FrozenSet, List, Optional
 
 from telegram import Update, constants
 from telegram.ext import ContextTypes
 
-from ..models.handlers_input import Person, Context, Message, BotInput
-from ..models.handlers_response import LocalizedCommandResponse
+from ..models.cache import TTLCache
+from ..models.handlers_input import Person, Context, Message, BotInput, MediaHandle
+from .media import can_downscale_images, downscale_image, select_photo_size
 
 
 def get_user_handle(user) -> str:
@@ -19,7 +21,11 @@ def is_callback(update: Update) -> bool:
     return update.callback_query is not None
 
 
-async def is_group_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+async def is_group_admin(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    admin_cache: Optional[TTLCache[int, FrozenSet[int]]] = None,
+) -> bool:
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
@@ -28,8 +34,30 @@ async def is_group_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return True
 
     # For group chats, check actual administrators
-    chat_administrators = await context.bot.get_chat_administrators(chat_id)
-    return any(admin.user.id == user_id for admin in chat_administrators)
+    admin_ids = admin_cache.get(chat_id) if admin_cache is not None else None
+    if admin_ids is None:
+        chat_administrators = await context.bot.get_chat_administrators(chat_id)
+        admin_ids = frozenset(admin.user.id for admin in chat_administrators)
+        if admin_cache is not None:
+            admin_cache.set(chat_id, admin_ids)
+    return user_id in admin_ids
+
+
+def is_admin_change(update: Update) -> bool:
+    """
+    Checks if a chat member update adds or removes an administrator
+    """
+    member_update = update.chat_member or update.my_chat_member
+    if member_update is None:
+        return False
+    admin_statuses = {
+        constants.ChatMemberStatus.ADMINISTRATOR,
+        constants.ChatMemberStatus.OWNER,
+    }
+    return (
+        member_update.old_chat_member.status in admin_statuses
+        or member_update.new_chat_member.status in admin_statuses
+    )
 
 
 def is_group_chat(update: Update) -> bool:
@@ -41,13 +69,23 @@ def is_group_chat(update: Update) -> bool:
     ]
 
 
-async def get_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Context:
+async def get_context(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    resolve_group_admin: bool = True,
+    admin_cache: Optional[TTLCache[int, FrozenSet[int]]] = None,
+) -> Context:
+    group_admin = (
+        await is_group_admin(update, context, admin_cache)
+        if resolve_group_admin
+        else False
+    )
     if is_callback(update):
         return Context(
             chat_id=update.callback_query.message.chat.id,
             chat_name=update.callback_query.message.chat.title,
             is_group=is_group_chat(update),
-            is_group_admin=await is_group_admin(update, context),
+            is_group_admin=group_admin,
         )
     else:
         replied_to_user_handle = (
@@ -61,7 +99,7 @@ async def get_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Con
             thread_id=get_thread_id(update),
             is_group=is_group_chat(update),
             is_bot_mentioned=bot_mentioned(update, context),
-            is_group_admin=await is_group_admin(update, context),
+            is_group_admin=group_admin,
             replied_to_user_handle=replied_to_user_handle,
         )
 
@@ -85,7 +123,18 @@ async def get_person(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Pers
         )
 
 
-async def get_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Message:
+async def get_message(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    photo_pixel_budget: Optional[int] = None,
+    downscale_photos: bool = False,
+    photo_jpeg_quality: int = 85,
+) -> Message:
+    """
+    Get the message from the update. Of the photo sizes Telegram offers, the
+    smallest one that still has photo_pixel_budget pixels is used, and with
+    downscale_photos it is also shrunk to the budget before the vision call.
+    """
     if is_callback(update):
         return Message(
             message_text=update.callback_query.message.text,
@@ -93,16 +142,27 @@ async def get_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Mes
         )
     message = update.message.text
     is_bot_mentioned = bot_mentioned(update, context)
-    # get image and audio in memory
+    # Media is only downloaded once the response is actually generated
     image = None
     if is_bot_mentioned and update.message.photo:
-        image = await get_file_in_memory(update.message.photo[-1].file_id, context)
-        image.name = "image.png"
+        preprocess = None
+        if downscale_photos and photo_pixel_budget and can_downscale_images():
+
+            async def preprocess(content: io.BytesIO) -> io.BytesIO:
+                return await asyncio.to_thread(
+                    downscale_image, content, photo_pixel_budget, photo_jpeg_quality
+                )
+
+        image = get_media_handle(
+            select_photo_size(update.message.photo, photo_pixel_budget),
+            context,
+            "image.png",
+            preprocess=preprocess,
+        )
 
     voice = None
     if is_bot_mentioned and update.message.voice:
-        voice = await get_file_in_memory(update.message.voice.file_id, context)
-        voice.name = "audio.wav"
+        voice = get_media_handle(update.message.voice, context, "audio.wav")
     return Message(
         message_text=message or "",
         timestamp=update.message.date,
@@ -146,6 +206,32 @@ async def get_file_in_memory(
     return bytes_io
 
 
+def get_media_handle(
+    media,
+    context: ContextTypes.DEFAULT_TYPE,
+    file_name: str,
+    preprocess: Optional[Callable[[io.BytesIO], Awaitable[io.BytesIO]]] = None,
+) -> MediaHandle:
+    """
+    Wraps a Telegram photo size, voice or audio into a lazily downloaded handle
+    """
+
+    async def load() -> io.BytesIO:
+        bytes_io = await get_file_in_memory(media.file_id, context)
+        bytes_io.name = file_name
+        if preprocess is not None:
+            bytes_io = await preprocess(bytes_io)
+        return bytes_io
+
+    return MediaHandle(
+        file_id=media.file_id,
+        file_unique_id=media.file_unique_id,
+        file_size=media.file_size,
+        duration=getattr(media, "duration", None),
+        loader=load,
+    )
+
+
 def get_thread_id(update: Update) -> Optional[int]:
     """
     Gets the message thread id for the update, if any
@@ -155,50 +241,34 @@ def get_thread_id(update: Update) -> Optional[int]:
     return None
 
 
-async def get_bot_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> BotInput:
+async def get_bot_input(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    resolve_group_admin: bool = True,
+    admin_cache: Optional[TTLCache[int, FrozenSet[int]]] = None,
+    photo_pixel_budget: Optional[int] = None,
+    downscale_photos: bool = False,
+    photo_jpeg_quality: int = 85,
+) -> BotInput:
     """
-    Get the bot input from the update and context
+    Get the bot input from the update and context.
+    The group admin lookup is an extra Bot API call, so it is only made
+    when resolve_group_admin is set.
     """
     return BotInput(
         person=await get_person(update, context),
-        context=await get_context(update, context),
-        message=await get_message(update, context),
+        context=await get_context(
+            update,
+            context,
+            resolve_group_admin=resolve_group_admin,
+            admin_cache=admin_cache,
+        ),
+        message=await get_message(
+            update,
+            context,
+            photo_pixel_budget=photo_pixel_budget,
+            downscale_photos=downscale_photos,
+            photo_jpeg_quality=photo_jpeg_quality,
+        ),
         args=await get_args(update, context),
     )
-
-
-def min_char_diff_for_buffering(content: str, is_group_chat: bool) -> int:
-    """
-    Get the minimum string length difference to trigger new yield in the streaming response
-    """
-    if is_group_chat:
-        len_thresholds = [(180, 1000), (120, 200), (90, 50), (50, -1)]
-    else:
-        len_thresholds = [(90, 1000), (45, 200), (25, 50), (15, -1)]
-
-    min_char_diff = 10
-    for char_diff, len_threshold in len_thresholds:
-        if len(content) > len_threshold:
-            min_char_diff = char_diff
-            break
-    return min_char_diff
-
-
-async def buffer_streaming_response(
-    stream: AsyncIterator[LocalizedCommandResponse], is_group_chat: bool
-) -> AsyncIterator[LocalizedCommandResponse]:
-    last_response_len = 0
-    current_response = None
-    i = 0
-    async for chunk in stream:
-        current_response = chunk
-        i += 1
-        if len(chunk.localized_text) - last_response_len > min_char_diff_for_buffering(
-            chunk.localized_text, is_group_chat
-        ):
-            yield current_response
-            current_response = None
-            i = 0
-            last_response_len = len(chunk.localized_text)
-    if i and current_response:
-        yield current_response
@@ -0,0 +1,126 @@
+import hmac
+import json
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+
+SECRET_TOKEN_HEADER = b"x-telegram-bot-api-secret-token"
+
+ASGIReceive = Callable[[], Awaitable[dict]]
+ASGISend = Callable[[dict], Awaitable[None]]
+
+
+class TelegramWebhookApp:
+    """Minimal ASGI app that feeds Telegram webhook updates into an Application.
+
+    Only POST requests to url_path carrying the expected secret token header
+    are accepted, so a secret token is required. Updates are put on the
+    application's update queue, so they are handled exactly like polled ones.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        url_path: str,
+        secret_token: str,
+        max_body_bytes: int = 1024 * 1024,
+    ) -> None:
+        if not secret_token:
+            raise ValueError("The webhook requires a secret token")
+        self.application = application
+        self.url_path = "/" + url_path.strip("/")
+        self.secret_token = secret_token
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: dict, receive: ASGIReceive, send: ASGISend) -> None:
+        if scope["type"] == "lifespan":
+            # The application lifecycle is managed by TelegramBot
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["path"] != self.url_path:
+            await self._respond(send, 404)
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405)
+            return
+        if not self._is_authorized(dict(scope["headers"])):
+            await self._respond(send, 403)
+            return
+        body = await self._read_body(receive)
+        if body is None:
+            await self._respond(send, 413)
+            return
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        # Valid JSON that is not an object (null, 1, []) is not an update either
+        if not isinstance(data, dict):
+            await self._respond(send, 400)
+            return
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            await self._respond(send, 400)
+            return
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200)
+
+    def _is_authorized(self, headers: Dict[bytes, bytes]) -> bool:
+        return hmac.compare_digest(
+            headers.get(SECRET_TOKEN_HEADER, b""), self.secret_token.encode()
+        )
+
+    async def _read_body(self, receive: ASGIReceive) -> Optional[bytes]:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > self.max_body_bytes:
+                return None
+            if not message.get("more_body", False):
+                return body
+
+    async def _respond(self, send: ASGISend, status: int) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-length", b"0")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def serve_asgi_app(
+    app: TelegramWebhookApp, listen: str, port: int, max_connections: int
+) -> None:
+    """
+    Serves the app with uvicorn until the process is asked to stop
+    """
+    if uvicorn is None:
+        raise RuntimeError("Webhook mode requires uvicorn to be installed")
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app,
+            host=listen,
+            port=port,
+            limit_concurrency=max_connections,
+            lifespan="off",
+        )
+    )
+    await server.serve()
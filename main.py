@@ -60,6 +60,7 @@ def main():
         telegram_token=config("TELEGRAM_BOT_TOKEN"),
         bot=rp_bot,
         telegram_bot_config=telegram_bot_config,
+        webhook_secret_token=config("TELEGRAM_WEBHOOK_SECRET", default=None),
     )
     tg_bot.run()
 
@@ -0,0 +1,26 @@
+import pytest
+
+
+class IndexRecordingDatabase:
+    """Fake database that records every create_index call as
+    (collection name, keys, unique)."""
+
+    def __init__(self) -> None:
+        self.created = []
+
+    def __getattr__(self, name):
+        return None
+
+    def __getitem__(self, name):
+        created = self.created
+
+        class Collection:
+            async def create_index(self, keys, unique=False):
+                created.append((name, tuple(keys), unique))
+
+        return Collection()
+
+
+@pytest.fixture
+def index_recording_db() -> IndexRecordingDatabase:
+    return IndexRecordingDatabase()
@@ -0,0 +1,225 @@
+import asyncio
+import io
+from datetime import datetime
+from logging import getLogger
+from types import SimpleNamespace
+
+import pytest
+
+from bot.models.cache import TTLCache
+from bot.models.config import AgentConfig
+from bot.models.handlers_input import Context, MediaHandle, Message, Person
+from bot.rp_bot.ai_agent.agent_tools.agent import (
+    AIAgent,
+    AudioResponse,
+    TextStreamingResponse,
+)
+from bot.rp_bot.prompt_manager import PromptManager
+
+
+class FakeTextModel:
+    def __init__(self, output_type) -> None:
+        self.output_type = output_type
+        self.stream_started = asyncio.Event()
+        self.stream_cancelled = False
+        self.router_calls = []
+        self.content_calls = []
+        self.priced_calls = []
+
+    async def arun(self, system_prompt, pydantic_model, user_input, **kwargs):
+        if pydantic_model is type(self.output_type):
+            self.content_calls.append((system_prompt, user_input))
+            return self.output_type
+        self.router_calls.append((pydantic_model, user_input))
+        # The router only answers once the text stream is already running
+        await asyncio.wait_for(self.stream_started.wait(), timeout=1)
+        return SimpleNamespace(output_type=type(self.output_type).__name__)
+
+    async def astream_default(self, system_prompt, user_input, **kwargs):
+        self.stream_started.set()
+        try:
+            for text in ("Hel", "lo"):
+                yield SimpleNamespace(text_chunk=text)
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.stream_cancelled = True
+            raise
+
+    def get_price(self, input_text=None, output_text=None) -> float:
+        self.priced_calls.append((input_text, output_text))
+        return 1
+
+
+class FakeAudioGenerationModel:
+    async def arun_default(self, system_prompt, user_input, voice, **kwargs):
+        return SimpleNamespace(audio_bytes=io.BytesIO(b"audio"))
+
+
+class FakeMediaModel:
+    def __init__(self, started: asyncio.Event, other_started: asyncio.Event) -> None:
+        self.started = started
+        self.other_started = other_started
+        self.calls = 0
+
+    async def arun_default(self, **kwargs):
+        self.calls += 1
+        self.started.set()
+        # Only finishes when the other media model runs at the same time
+        await asyncio.wait_for(self.other_started.wait(), timeout=1)
+        return f"description {self.calls}"
+
+
+class FakeModelsToolkit:
+    def __init__(self, output_type) -> None:
+        self.text_model = FakeTextModel(output_type)
+        self.audio_generation_model = FakeAudioGenerationModel()
+        vision_started, recognition_started = asyncio.Event(), asyncio.Event()
+        self.vision_model = FakeMediaModel(vision_started, recognition_started)
+        self.audio_recognition_model = FakeMediaModel(
+            recognition_started, vision_started
+        )
+
+    def can_use_model(self, model_type: str) -> bool:
+        return model_type in {"text", "audio_generation"}
+
+    def get_price(self, **kwargs) -> float:
+        return 0
+
+
+class FakePromptManager(PromptManager):
+    def __init__(self) -> None:
+        pass
+
+    def new_turn_reads(
+        self, context, person=None, chat_language=None, exclude_message_ids=()
+    ):
+        return None
+
+    async def get_reply_system_prompt(self, context, reads=None) -> str:
+        return "system"
+
+
+class FakeMemoryManager:
+    async def prepare_context(self, **kwargs):
+        return SimpleNamespace(
+            shadow_tool_results=[], user_input="input", scope_key=None
+        )
+
+    def should_use_live_agent(self) -> bool:
+        return False
+
+
+def build_agent(
+    output_type,
+    message: Message | None = None,
+    media_transcriptions: TTLCache | None = None,
+) -> AIAgent:
+    return AIAgent(
+        person=Person(telegram_id=1, user_handle="@ada"),
+        context=Context(chat_id=1),
+        message=message
+        or Message(message_text="hello", timestamp=datetime(2026, 7, 24)),
+        db=None,
+        models_toolkit=FakeModelsToolkit(output_type),
+        prompt_manager=FakePromptManager(),
+        memory_manager=FakeMemoryManager(),
+        logger=getLogger("test-agent"),
+        agent_config=AgentConfig(speculative_text_stream=True),
+        media_transcriptions=media_transcriptions,
+    )
+
+
+@pytest.mark.asyncio
+async def test_text_stream_starts_together_with_output_type_routing():
+    agent = build_agent(TextStreamingResponse())
+
+    responses = [response async for response in agent.astream()]
+
+    assert [response.text_new_chunk for response in responses] == ["Hel", "lo", ""]
+    assert responses[-1].total_text == "Hello"
+    assert responses[-1].is_final_response
+
+
+@pytest.mark.asyncio
+async def test_speculative_text_stream_is_cancelled_for_audio_output():
+    agent = build_agent(AudioResponse(audio_text_to_generate="Hi"))
+
+    responses = [response async for response in agent.astream()]
+
+    assert len(responses) == 1
+    assert responses[0].audio_description == "Hi"
+    assert responses[0].total_text is None
+    assert agent.models_toolkit.text_model.stream_cancelled
+    # The spoken text is written with the full persona and context
+    assert agent.models_toolkit.text_model.content_calls == [("system", "input")]
+
+
+@pytest.mark.asyncio
+async def test_router_and_discarded_stream_are_billed():
+    agent = build_agent(AudioResponse(audio_text_to_generate="Hi"))
+
+    responses = [response async for response in agent.astream()]
+
+    ((input_text, output_text),) = agent.models_toolkit.text_model.priced_calls
+    assert responses[-1].total_price == 1
+    # The router prompt and the speculative prompt are both charged as input
+    assert "Allowed output types" in input_text
+    assert output_text.startswith("AudioResponse")
+    # The structured call writing the spoken text is charged too
+    assert input_text.count("system\ninput") == 2
+    assert output_text.endswith('"voice":"alloy"}')
+
+
+@pytest.mark.asyncio
+async def test_router_gets_compact_input_and_a_cached_schema():
+    first_agent = build_agent(TextStreamingResponse())
+    second_agent = build_agent(TextStreamingResponse())
+
+    [response async for response in first_agent.astream()]
+    [response async for response in second_agent.astream()]
+
+    ((first_model, router_input),) = first_agent.models_toolkit.text_model.router_calls
+    ((second_model, _),) = second_agent.models_toolkit.text_model.router_calls
+    assert first_model is second_model
+    assert set(first_model.model_json_schema()["properties"]) == {"output_type"}
+    assert router_input == (
+        "Message: hello\n"
+        "Has attached image: no\n"
+        "Allowed output types: TextStreamingResponse, AudioResponse"
+    )
+
+
+def build_media(content: bytes, loads: list, file_unique_id: str | None = None):
+    async def load() -> io.BytesIO:
+        loads.append(content)
+        return io.BytesIO(content)
+
+    return MediaHandle(file_id="file", file_unique_id=file_unique_id, loader=load)
+
+
+@pytest.mark.asyncio
+async def test_media_is_described_concurrently_and_once_per_content():
+    media_transcriptions = TTLCache(max_size=10)
+    loads = []
+    message = Message(
+        message_text="look",
+        timestamp=datetime(2026, 7, 24),
+        in_file_image=build_media(b"image", loads, file_unique_id="photo-1"),
+        in_file_audio=build_media(b"voice", loads),
+    )
+    agent = build_agent(
+        TextStreamingResponse(), message, media_transcriptions=media_transcriptions
+    )
+
+    first = await agent._get_transcribed_message()
+    # A re-forwarded photo is known by its id and is not downloaded again,
+    # a voice note without an id is matched by its content
+    message.in_file_image = build_media(b"image", loads, file_unique_id="photo-1")
+    message.in_file_audio = build_media(b"voice", loads)
+    second = await agent._get_transcribed_message()
+
+    assert first.image_description == second.image_description == "description 1"
+    assert first.voice_description == second.voice_description == "description 1"
+    assert agent.models_toolkit.vision_model.calls == 1
+    assert agent.models_toolkit.audio_recognition_model.calls == 1
+    assert sorted(loads) == [b"image", b"voice", b"voice"]
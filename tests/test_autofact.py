@@ -0,0 +1,110 @@
+from datetime import datetime
+from logging import getLogger
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from bot.models.config.bot_config import AutofactConfig
+from bot.rp_bot.autofact import AutofactWorker, ChatFact, ResponseFactsGeneration
+from bot.rp_bot.storage import AutofactJobRecord
+
+
+class FakeAutofactJobs:
+    def __init__(self, jobs: list) -> None:
+        self.jobs = jobs
+        self.completed = []
+        self.failed = []
+
+    async def claim_batch(self, max_jobs, lease_seconds):
+        batch, self.jobs = self.jobs[:max_jobs], self.jobs[max_jobs:]
+        return batch
+
+    async def complete(self, claim_id):
+        self.completed.append(claim_id)
+
+    async def fail(self, claim_id, max_attempts):
+        self.failed.append(claim_id)
+
+
+class FakeUserFacts:
+    def __init__(self) -> None:
+        self.facts = []
+
+    async def add_fact(self, *, context, facts_user_handle, fact, created_by):
+        self.facts.append((context.chat_id, facts_user_handle, fact, created_by))
+
+
+class FakeTextModel:
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.prompts = []
+
+    async def arun(self, system_prompt, pydantic_model, user_input):
+        self.prompts.append(user_input)
+        if self.error is not None:
+            raise self.error
+        return ResponseFactsGeneration(
+            facts_generation_needed=True,
+            user_facts=[ChatFact(user_handle="@ada", user_fact="Ada likes tests.")],
+        )
+
+
+class FakePromptManager:
+    def compose_autofact_system_prompt(self) -> str:
+        return "system"
+
+    async def compose_autofact_prompt(self, context, jobs) -> str:
+        return "\n".join(job.user_message for job in jobs)
+
+
+def build_job(text: str) -> AutofactJobRecord:
+    return AutofactJobRecord(
+        id=ObjectId(),
+        chat_id=1,
+        user_handle="@ada",
+        user_message=text,
+        bot_response="ok",
+        created_at=datetime(2026, 7, 24),
+        claim_id="claim",
+    )
+
+
+def build_worker(jobs: list, text_model: FakeTextModel) -> AutofactWorker:
+    db = SimpleNamespace(
+        autofact_jobs=FakeAutofactJobs(jobs), user_facts=FakeUserFacts()
+    )
+    return AutofactWorker(
+        db=db,
+        prompt_manager=FakePromptManager(),
+        models_toolkit=SimpleNamespace(text_model=text_model),
+        autofact_config=AutofactConfig(batch_size=3),
+        logger=getLogger("test-autofact"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_worker_extracts_facts_for_a_batch_in_one_call():
+    text_model = FakeTextModel()
+    worker = build_worker([build_job(f"turn {i}") for i in range(3)], text_model)
+
+    assert await worker.process_next_batch() is True
+    assert await worker.process_next_batch() is False
+
+    assert text_model.prompts == ["turn 0\nturn 1\nturn 2"]
+    assert worker.db.user_facts.facts == [
+        (1, "@ada", "Ada likes tests.", "autofact")
+    ]
+    assert worker.db.autofact_jobs.completed == ["claim"]
+    assert worker.db.autofact_jobs.failed == []
+
+
+@pytest.mark.asyncio
+async def test_worker_releases_batch_for_retry_when_extraction_fails():
+    worker = build_worker([build_job("turn")], FakeTextModel(RuntimeError("boom")))
+
+    assert await worker.process_next_batch() is True
+
+    assert worker.db.user_facts.facts == []
+    assert worker.db.autofact_jobs.completed == []
+    assert worker.db.autofact_jobs.failed == ["claim"]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from bot.models.handlers_input import Context, Person
+from bot.rp_bot.bootstrap import BootstrapRegistry
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_registry_runs_bootstrap_once_per_pair():
+    registry = BootstrapRegistry(max_size=10)
+    person = Person(telegram_id=1, user_handle="@ada")
+    calls = []
+
+    async def bootstrap():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    await asyncio.gather(
+        *[registry.ensure(person, Context(chat_id=1), bootstrap) for _ in range(5)]
+    )
+    await registry.ensure(person, Context(chat_id=1), bootstrap)
+    await registry.ensure(person, Context(chat_id=2), bootstrap)
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_registry_retries_after_failure_and_forget():
+    registry = BootstrapRegistry(max_size=10)
+    person = Person(telegram_id=1, user_handle="@ada")
+    context = Context(chat_id=1)
+    calls = []
+
+    async def failing_bootstrap():
+        calls.append("failed")
+        raise RuntimeError("mongo is down")
+
+    async def bootstrap():
+        calls.append("ok")
+
+    with pytest.raises(RuntimeError):
+        await registry.ensure(person, context, failing_bootstrap)
+    await registry.ensure(person, context, bootstrap)
+    registry.forget_user("@ada")
+    await registry.ensure(person, context, bootstrap)
+
+    assert calls == ["failed", "ok", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_registry_cancellation_does_not_fail_waiters():
+    registry = BootstrapRegistry(max_size=10)
+    person = Person(telegram_id=1, user_handle="@ada")
+    context = Context(chat_id=1)
+    started = asyncio.Event()
+    calls = []
+
+    async def slow_bootstrap():
+        calls.append("cancelled")
+        started.set()
+        await asyncio.sleep(10)
+
+    async def bootstrap():
+        calls.append("ok")
+
+    first = asyncio.create_task(registry.ensure(person, context, slow_bootstrap))
+    await started.wait()
+    waiter = asyncio.create_task(registry.ensure(person, context, bootstrap))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    # The waiter runs the bootstrap itself instead of failing
+    assert await waiter is True
+    assert calls == ["cancelled", "ok"]
+    assert await registry.ensure(person, context, bootstrap) is False
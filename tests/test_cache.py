@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bot.models.cache import TTLCache
+from bot.models.handlers_input import Context
+from bot.rp_bot.db_models.chats import Chats
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeChatsCollection:
+    def __init__(self, language: str) -> None:
+        self.document = {"chat_id": 1, "language": language, "is_started": True}
+        self.find_one_calls = 0
+
+    async def find_one(self, filters, projection=None):
+        self.find_one_calls += 1
+        return dict(self.document)
+
+    async def update_one(self, filters, update, upsert=False):
+        self.document.update(update.get("$set", {}))
+
+
+def test_ttl_cache_evicts_least_recently_used_entry():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries_and_counts_hits_and_misses():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    clock.now = 6
+    assert cache.get("a") is None
+    assert cache.get_stats() == {"size": 0, "hits": 1, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_chats_language_is_cached_and_invalidated_on_set_language():
+    collection = FakeChatsCollection(language="english")
+    chats = Chats(SimpleNamespace(chats=collection), default_language="english")
+    context = Context(chat_id=1)
+
+    assert await chats.get_language(context) == "english"
+    assert await chats.get_language(context) == "english"
+    assert collection.find_one_calls == 1
+
+    await chats.set_language(context, "spanish")
+
+    assert await chats.get_language(context) == "spanish"
+    assert collection.find_one_calls == 2
+    assert chats.get_language_cache_stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_settings_read_warms_language_cache():
+    collection = FakeChatsCollection(language="spanish")
+    chats = Chats(SimpleNamespace(chats=collection), default_language="english")
+    context = Context(chat_id=1)
+
+    settings = await chats.get_chat_settings(context)
+
+    assert settings.language == "spanish"
+    assert settings.is_started is True
+    assert await chats.get_language(context) == "spanish"
+    assert collection.find_one_calls == 1
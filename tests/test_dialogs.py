@@ -0,0 +1,197 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from bot.models.handlers_input import Context, Person, TranscribedMessage
+from bot.rp_bot.db_models.dialogs import Dialogs
+
+
+class FakeBucketsCollection:
+    def __init__(self) -> None:
+        self.buckets = {}
+        self.operations = []
+
+    async def update_one(self, filters, update, upsert=False):
+        self.operations.append("update_one")
+        bucket = self.buckets.setdefault(filters["chat_id"], {"messages": []})
+        push = update["$push"]["messages"]
+        bucket["messages"] = (bucket["messages"] + push["$each"])[push["$slice"] :]
+
+    async def find_one(self, filters, projection=None):
+        self.operations.append("find_one")
+        bucket = self.buckets.get(filters["chat_id"])
+        if bucket is None:
+            return None
+        messages = bucket["messages"]
+        message_slice = projection["messages"]
+        if isinstance(message_slice, dict):
+            messages = messages[message_slice["$slice"] :]
+        return {"messages": list(messages)}
+
+
+def build_dialogs(store_limit: int = 3) -> Dialogs:
+    db = SimpleNamespace(dialogs=None, dialog_buckets=FakeBucketsCollection())
+    return Dialogs(
+        db,
+        last_n_messages_to_remember=2,
+        last_n_messages_to_store=store_limit,
+        storage_layout="buckets",
+        count_tokens=lambda text: len(text.split()),
+    )
+
+
+@pytest.mark.asyncio
+async def test_bucket_layout_appends_with_single_update_and_trims():
+    dialogs = build_dialogs(store_limit=3)
+    context = Context(chat_id=1)
+    person = Person(telegram_id=1, user_handle="@ada")
+
+    for i in range(5):
+        await dialogs.add_message_to_dialog(
+            context=context,
+            person=person,
+            transcribed_message=TranscribedMessage(
+                message_text=f"message {i}", timestamp=datetime(2026, 7, 24)
+            ),
+        )
+
+    bucket = dialogs.dialog_buckets.buckets[1]
+    assert all(msg["token_count"] == 2 for msg in bucket["messages"])
+    assert [msg["message_text"] for msg in bucket["messages"]] == [
+        "message 2",
+        "message 3",
+        "message 4",
+    ]
+    assert dialogs.dialog_buckets.operations == ["update_one"] * 5
+
+    messages = await dialogs.get_messages(context)
+
+    assert [msg.message_text for _, _, msg in messages] == ["message 3", "message 4"]
+    assert dialogs.dialog_buckets.operations[-1] == "find_one"
+
+
+@pytest.mark.asyncio
+async def test_bucket_layout_search_filters_in_memory():
+    dialogs = build_dialogs(store_limit=10)
+    context = Context(chat_id=1)
+    for text in ["I like tea (a lot)", "bot reply", "tea again"]:
+        await dialogs.add_message_to_dialog(
+            context=context,
+            person=Person(telegram_id=1, user_handle="@ada"),
+            transcribed_message=TranscribedMessage(
+                message_text=text, timestamp=datetime(2026, 7, 24)
+            ),
+        )
+
+    results = await dialogs.search_recent_dialog(context, query="tea (", limit=5)
+
+    assert results == ["@ada: I like tea (a lot)"]
+
+
+@pytest.mark.asyncio
+async def test_records_after_an_id_follow_the_thread_past_the_window():
+    dialogs = build_dialogs(store_limit=10)
+    person = Person(telegram_id=1, user_handle="@ada")
+    message_ids = []
+    for i in range(6):
+        message_ids.append(
+            await dialogs.add_message_to_dialog(
+                context=Context(chat_id=1, thread_id=i % 2),
+                person=person,
+                transcribed_message=TranscribedMessage(
+                    message_text=f"message {i}", timestamp=datetime(2026, 7, 24)
+                ),
+            )
+        )
+
+    records = await dialogs.get_message_records_after(
+        Context(chat_id=1, thread_id=0), after_id=message_ids[0], limit=10
+    )
+
+    assert [record.message.message_text for record in records] == [
+        "message 2",
+        "message 4",
+    ]
+
+
+class FakeCursor:
+    def __init__(self, documents) -> None:
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+
+class FakeDialogsCollection:
+    def __init__(self) -> None:
+        self.documents = []
+        self.queries = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+    async def delete_many(self, filters):
+        self.documents = [
+            doc for doc in self.documents if doc["chat_id"] != filters["chat_id"]
+        ]
+
+    def find(self, filters):
+        self.queries.append(filters)
+        after_id = filters.get("_id", {}).get("$gt")
+        return FakeCursor(
+            [
+                doc
+                for doc in self.documents
+                if doc["chat_id"] == filters["chat_id"]
+                and (after_id is None or doc["_id"] > after_id)
+            ]
+        )
+
+
+@pytest.mark.asyncio
+async def test_window_reads_only_messages_stored_since_the_last_turn():
+    collection = FakeDialogsCollection()
+    dialogs = Dialogs(
+        SimpleNamespace(dialogs=collection, dialog_buckets=None),
+        last_n_messages_to_remember=2,
+        last_n_messages_to_store=None,
+    )
+    context = Context(chat_id=1)
+
+    async def add(text: str):
+        return await dialogs.add_message_to_dialog(
+            context=context,
+            person=Person(telegram_id=1, user_handle="@ada"),
+            transcribed_message=TranscribedMessage(
+                message_text=text, timestamp=datetime(2026, 7, 24)
+            ),
+        )
+
+    first_id = await add("message 0")
+    await dialogs.get_message_records(context)
+    await add("message 1")
+    await add("message 2")
+    records = await dialogs.get_message_records(context)
+
+    assert [record.message.message_text for record in records] == [
+        "message 1",
+        "message 2",
+    ]
+    assert collection.queries == [
+        {"chat_id": 1},
+        {"chat_id": 1, "_id": {"$gt": first_id}},
+    ]
+
+    await dialogs.reset(context)
+
+    assert await dialogs.get_message_records(context) == []
+    assert collection.queries[-1] == {"chat_id": 1}
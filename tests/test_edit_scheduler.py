@@ -0,0 +1,63 @@
+import pytest
+
+from bot.telegram.edit_scheduler import EditScheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+def build_scheduler(clock: FakeClock) -> EditScheduler:
+    return EditScheduler(
+        private_chat_interval=1.0,
+        group_chat_interval=3.0,
+        global_edits_per_second=10.0,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+
+@pytest.mark.asyncio
+async def test_chat_slots_follow_the_chat_interval():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+
+    await scheduler.acquire(1, is_group_chat=True)
+    clock.now += 1.0
+    await scheduler.acquire(1, is_group_chat=True)
+
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+@pytest.mark.asyncio
+async def test_global_rate_is_shared_by_all_chats():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+
+    await scheduler.acquire(1, is_group_chat=False)
+    await scheduler.acquire(2, is_group_chat=False)
+    await scheduler.acquire(3, is_group_chat=False)
+
+    assert clock.sleeps == [pytest.approx(0.1), pytest.approx(0.1)]
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_slot_stretched_by_edit_latency():
+    clock = FakeClock()
+    scheduler = build_scheduler(clock)
+    scheduler.record_latency(2.5)
+
+    await scheduler.acquire(1, is_group_chat=False)
+    await scheduler.acquire(1, is_group_chat=False)
+
+    assert scheduler.edit_latency == pytest.approx(0.5)
+    assert clock.sleeps == [pytest.approx(1.5)]
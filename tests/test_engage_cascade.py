@@ -0,0 +1,76 @@
+import pytest
+
+from bot.models.config import EngageConfig
+from bot.models.handlers_input import Context
+from bot.rp_bot.engage_cascade import EngageCascade
+
+
+@pytest.mark.asyncio
+async def test_cascade_asks_llm_only_for_ambiguous_messages():
+    cascade = EngageCascade(EngageConfig(bot_names=["Marvin"]))
+    llm_questions = []
+
+    async def ask_llm(text):
+        llm_questions.append(text)
+        return True
+
+    async def decide(text, **context_fields):
+        return await cascade.should_engage(
+            context=Context(chat_id=1, **context_fields),
+            message_text=text,
+            ask_llm=lambda: ask_llm(text),
+        )
+
+    assert await decide("ok") is False
+    assert await decide("👍👍👍") is False
+    assert await decide("hey marvin, tell a joke") is True
+    assert await decide("hmm", is_bot_mentioned=True) is True
+    assert await decide("lol nice") is False
+    assert await decide("can anyone recommend a good book") is True
+    # Short questions are common between users, the LLM settles them
+    assert await decide("what do you think about this?") is True
+    assert await decide("you ok?") is True
+    long_question = (
+        "what do you think about the plan we discussed yesterday for the trip "
+        "to the mountains next month with all of the friends and the kids and "
+        "the dogs?"
+    )
+    assert await decide(long_question) is True
+
+    assert llm_questions == [
+        "can anyone recommend a good book",
+        "what do you think about this?",
+        "you ok?",
+    ]
+    stats = cascade.get_stats()
+    assert stats["rules_skip"] == 2
+    assert stats["rules_engage"] == 2
+    assert stats["scorer_engage"] == 1
+    assert stats["scorer_skip"] == 1
+    assert stats["llm_engage"] == 3
+    assert stats["llm_calls_avoided"] == 6
+
+
+@pytest.mark.asyncio
+async def test_questions_replying_to_other_users_are_skipped_without_llm():
+    cascade = EngageCascade(EngageConfig(bot_names=["Marvin"]))
+
+    async def ask_llm():
+        raise AssertionError("the LLM must not be asked")
+
+    for text in ["what do you think?", "you ok?", "why would you do that?"]:
+        assert (
+            await cascade.should_engage(
+                context=Context(chat_id=1, replied_to_user_handle="@bob"),
+                message_text=text,
+                ask_llm=ask_llm,
+            )
+            is False
+        )
+    # Naming the bot in such a reply still engages it
+    assert await cascade.should_engage(
+        context=Context(chat_id=1, replied_to_user_handle="@bob"),
+        message_text="marvin, what do you think?",
+        ask_llm=ask_llm,
+    )
+    assert cascade.get_stats()["rules_skip"] == 3
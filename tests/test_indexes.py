@@ -0,0 +1,299 @@
+import inspect
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from bot.models.config import DefaultChatModes
+from bot.models.config.default_chat_modes import ChatMode
+from bot.models.handlers_input import Context, Person, TranscribedMessage
+from bot.rp_bot.db_models.autofact_jobs import AutofactJobs
+from bot.rp_bot.db_models.chat_modes import ChatModes
+from bot.rp_bot.db_models.chats import Chats
+from bot.rp_bot.db_models.dialogs import Dialogs
+from bot.rp_bot.db_models.user_facts import UserFacts
+from bot.rp_bot.db_models.user_introductions import UserIntroductions
+from bot.rp_bot.db_models.user_usage import UserUsage
+from bot.rp_bot.db_models.users import Users
+
+
+FILTER_OPERATIONS = {
+    "find",
+    "find_one",
+    "find_one_and_update",
+    "update_one",
+    "update_many",
+    "delete_one",
+    "delete_many",
+    "count_documents",
+}
+
+
+def fake_document() -> dict:
+    return {
+        "_id": ObjectId(),
+        "chat_id": 1,
+        "handle": "@ada",
+        "user_handle": "@ada",
+        "mode_name": "mode",
+        "mode_description": "description",
+        "facts": ["likes tea"],
+        "messages": [],
+        "is_bot": False,
+        "message_text": "hello",
+        "timestamp": datetime(2026, 7, 24),
+        "created_at": datetime(2026, 7, 24),
+        "usage": 0,
+        "limit": 10,
+    }
+
+
+class RecordingCursor:
+    def __init__(self, query: list) -> None:
+        self.query = query
+        self.documents = [fake_document()]
+
+    def sort(self, key, direction=None):
+        self.query[2] = tuple([(key, direction)] if direction is not None else key)
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class RecordingCollection:
+    def __init__(self, name: str, queries: list) -> None:
+        self.name = name
+        self.queries = queries
+
+    def _record(self, filters: dict, sort=None) -> list:
+        # [collection, equality fields, sort keys], the sort is set by cursors;
+        # range, regex and $expr predicates only filter the scanned documents
+        fields = frozenset(
+            key
+            for key, value in filters.items()
+            if not key.startswith("$")
+            and not (isinstance(value, dict) and set(value) - {"$eq", "$in"})
+        )
+        query = [self.name, fields, tuple(sort or ())]
+        self.queries.append(query)
+        return query
+
+    def __getattr__(self, operation: str):
+        if operation in FILTER_OPERATIONS:
+
+            def call(filters, *args, sort=None, **kwargs):
+                query = self._record(filters, sort)
+                if operation == "find":
+                    return RecordingCursor(query)
+                return self._result(operation)
+
+            return call
+        if operation == "bulk_write":
+
+            async def bulk_write(requests, *args, **kwargs):
+                for request in requests:
+                    self._record(request._filter)
+
+            return bulk_write
+        if operation in {"insert_one", "create_index"}:
+
+            async def noop(*args, **kwargs):
+                return None
+
+            return noop
+        raise AttributeError(operation)
+
+    async def _result(self, operation: str):
+        if operation == "count_documents":
+            return 0
+        if operation in {"find_one", "find_one_and_update"}:
+            return fake_document()
+        return SimpleNamespace(matched_count=1, modified_count=1, deleted_count=1)
+
+
+class RecordingDatabase:
+    def __init__(self) -> None:
+        self.queries = []
+
+    def __getitem__(self, name: str) -> RecordingCollection:
+        return RecordingCollection(name, self.queries)
+
+    def __getattr__(self, name: str) -> RecordingCollection:
+        return RecordingCollection(name, self.queries)
+
+
+ARGUMENTS = {
+    "context": Context(chat_id=1, thread_id=2),
+    "person": Person(telegram_id=1, user_handle="@ada"),
+    "user_handle": "@ada",
+    "facts_user_handle": "@ada",
+    "fallback_user_handle": "@ada",
+    "added_by_handle": "@ada",
+    "participant_key": "telegram:1",
+    "fact": "likes tea",
+    "language": "english",
+    "mode_id": str(ObjectId()),
+    "mode_name": "mode",
+    "mode_description": "description",
+    "introduction": "hello",
+    "points": 1,
+    "reserved_points": 1,
+    "actual_points": 2,
+    "time_seconds": 60,
+    "transcribed_message": TranscribedMessage(
+        message_text="hello", timestamp=datetime(2026, 7, 24)
+    ),
+    "scope_key": "chat:1:thread:2:mode:mode",
+    "memory_scope": {},
+    "fields": {"summary": "summary"},
+    "query": "tea",
+    "limit": 5,
+    "after_id": ObjectId(),
+    "user_message": "hello",
+    "bot_response": "hi",
+    "max_jobs": 10,
+    "lease_seconds": 60,
+    "claim_id": "claim",
+    "max_attempts": 3,
+}
+
+
+def build_models(db: RecordingDatabase) -> list:
+    default_chat_modes = DefaultChatModes(
+        default_chat_modes={"mode": ChatMode(name="mode", description="description")}
+    )
+    return [
+        Users(db),
+        UserUsage(db, 10),
+        Chats(db, "english"),
+        UserFacts(db),
+        UserIntroductions(db),
+        ChatModes(db, default_chat_modes),
+        Dialogs(db, 2, 3),
+        Dialogs(db, 2, 3, storage_layout="buckets"),
+        AutofactJobs(db),
+    ]
+
+
+def get_public_coroutines(model) -> list:
+    return [
+        method
+        for name, method in inspect.getmembers(model, inspect.iscoroutinefunction)
+        if not name.startswith("_") and name != "ensure_indexes"
+    ]
+
+
+async def call_with_fake_arguments(method) -> None:
+    kwargs = {}
+    for name, parameter in inspect.signature(method).parameters.items():
+        if name in ARGUMENTS:
+            kwargs[name] = ARGUMENTS[name]
+        elif parameter.default is inspect.Parameter.empty:
+            raise AssertionError(
+                f"Add a fake value for '{name}' to exercise {method.__qualname__}"
+            )
+    await method(**kwargs)
+
+
+def is_covered(fields: frozenset, sort: tuple, collection_indexes: list) -> bool:
+    """Whether an index bounds the scan with its prefix and then serves the sort
+
+    Unsorted queries need an index whose prefix is exactly the equality
+    fields. Sorted ones need a prefix of equality fields followed by the sort
+    keys in the same (or all reversed) directions, the other equality fields
+    only filter the documents scanned in order.
+    """
+    if "_id" in fields and not sort:
+        # A point lookup on the unique _id index
+        return True
+    reversed_sort = [(key, -direction) for key, direction in sort]
+    # Every collection has the default _id index
+    for keys in [*collection_indexes, [("_id", 1)]]:
+        keys = [tuple(key) for key in keys]
+        if not sort:
+            if {key for key, _ in keys[: len(fields)]} == fields:
+                return True
+            continue
+        for prefix_length in range(1 if fields else 0, len(keys)):
+            prefix = {key for key, _ in keys[:prefix_length]}
+            rest = keys[prefix_length : prefix_length + len(sort)]
+            if prefix <= fields and rest in (list(sort), reversed_sort):
+                return True
+    return False
+
+
+@pytest.mark.asyncio
+async def test_every_store_query_shape_uses_a_declared_index():
+    db = RecordingDatabase()
+    models = build_models(db)
+
+    declared = {}
+    for model in models:
+        for collection_name, collection_indexes in [
+            *model.indexes.items(),
+            *model.unique_indexes.items(),
+        ]:
+            declared.setdefault(collection_name, []).extend(collection_indexes)
+        for method in get_public_coroutines(model):
+            await call_with_fake_arguments(method)
+
+    assert db.queries
+    uncovered = [
+        (collection_name, sorted(fields), sort)
+        for collection_name, fields, sort in {tuple(query) for query in db.queries}
+        if not is_covered(fields, sort, declared.get(collection_name, []))
+    ]
+    assert uncovered == []
+
+
+def test_is_covered_compares_the_prefix_and_the_sort_direction():
+    indexes = [[("chat_id", 1), ("thread_id", 1), ("_id", 1)]]
+
+    assert is_covered(frozenset({"chat_id"}), (), indexes)
+    assert is_covered(frozenset({"chat_id", "thread_id"}), (("_id", -1),), indexes)
+    assert is_covered(
+        frozenset({"chat_id", "thread_id", "participant_key"}), (("_id", 1),), indexes
+    )
+    # A field past the prefix, or a sort that skips a key, needs another index
+    assert not is_covered(frozenset({"thread_id"}), (), indexes)
+    assert not is_covered(frozenset({"chat_id", "participant_key"}), (), indexes)
+    assert not is_covered(frozenset({"chat_id"}), (("_id", 1),), indexes)
+    assert not is_covered(frozenset({"participant_key"}), (("_id", 1),), indexes)
+    assert not is_covered(
+        frozenset({"chat_id", "thread_id"}),
+        (("_id", 1), ("timestamp", -1)),
+        [[("chat_id", 1), ("thread_id", 1), ("_id", 1), ("timestamp", 1)]],
+    )
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_every_declared_index(index_recording_db):
+    model = UserFacts(index_recording_db)
+    await model.ensure_indexes()
+
+    assert index_recording_db.created == [
+        ("user_facts", keys_tuple, False)
+        for keys_tuple in map(tuple, UserFacts.indexes["user_facts"])
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dialog_buckets_are_unique_per_chat(index_recording_db):
+    model = Dialogs(index_recording_db, 10, None, storage_layout="buckets")
+    await model.ensure_indexes()
+
+    created = index_recording_db.created
+    assert ("dialog_buckets", (("chat_id", 1),), True) in created
+    assert ("dialog_buckets", (("chat_id", 1),), False) not in created
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from bot.telegram.latest_value_channel import LatestValueChannel
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_gets_only_the_freshest_values():
+    channel: LatestValueChannel[str] = LatestValueChannel()
+    received = []
+
+    async def produce():
+        for text in ("a", "ab", "abc", "abcd"):
+            channel.publish(text)
+            await asyncio.sleep(0)
+        channel.close()
+
+    async def consume():
+        async for value in channel:
+            received.append(value)
+            # Delivery is much slower than generation
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(produce(), consume())
+
+    assert received[0] == "a"
+    assert received[-1] == "abcd"
+    assert len(received) < 4
+
+
+@pytest.mark.asyncio
+async def test_take_latest_supersedes_the_received_value():
+    channel: LatestValueChannel[str] = LatestValueChannel()
+    channel.publish("a")
+    iterator = channel.__aiter__()
+
+    value = await iterator.__anext__()
+    channel.publish("ab")
+
+    assert channel.take_latest(value) == "ab"
+    assert channel.take_latest("ab") == "ab"
+
+
+@pytest.mark.asyncio
+async def test_producer_error_is_raised_after_the_last_value():
+    channel: LatestValueChannel[str] = LatestValueChannel()
+    channel.publish("partial")
+    channel.close(error=RuntimeError("boom"))
+    received = []
+
+    with pytest.raises(RuntimeError, match="boom"):
+        async for value in channel:
+            received.append(value)
+
+    assert received == ["partial"]
@@ -1,12 +1,16 @@
+import asyncio
 from datetime import datetime
 from logging import getLogger
 from types import SimpleNamespace
 
 import pytest
+from bson import ObjectId
 
+from bot.models.config import AgentConfig
 from bot.models.handlers_input import Context, Message, Person, TranscribedMessage
-from bot.rp_bot.ai_agent.agent_tools.agent import AIAgentStreamingResponse, ChatFact
+from bot.rp_bot.ai_agent.agent_tools.agent import AIAgentStreamingResponse
 from bot.rp_bot.messages.message_handler import MessageHandler
+from bot.rp_bot.storage import ChatSettings
 
 
 class FakeChats:
@@ -22,18 +26,17 @@ class FakeChats:
         self.conversation_tracker_enabled = conversation_tracker_enabled
         self.autoengage_enabled = autoengage_enabled
         self.autofact_enabled = autofact_enabled
-
-    async def get_conversation_tracker_state(self, context: Context) -> bool:
-        return self.conversation_tracker_enabled
-
-    async def chat_is_started(self, context: Context) -> bool:
-        return self.chat_started
-
-    async def get_autoengage_state(self, context: Context) -> bool:
-        return self.autoengage_enabled
-
-    async def get_auto_fact_state(self, context: Context) -> bool:
-        return self.autofact_enabled
+        self.settings_reads = 0
+
+    async def get_chat_settings(self, context: Context) -> ChatSettings:
+        self.settings_reads += 1
+        return ChatSettings(
+            language="english",
+            is_started=self.chat_started,
+            conversation_tracker=self.conversation_tracker_enabled,
+            auto_fact=self.autofact_enabled,
+            autoengage=self.autoengage_enabled,
+        )
 
 
 class FakeDialogs:
@@ -46,54 +49,73 @@ class FakeDialogs:
         context: Context,
         person: Person | str,
         transcribed_message: TranscribedMessage,
-    ) -> None:
+    ) -> ObjectId:
+        message_id = ObjectId()
         self.messages.append(
             {
+                "id": message_id,
                 "context": context,
                 "person": person,
                 "transcribed_message": transcribed_message,
             }
         )
+        return message_id
 
 
 class FakeUserUsage:
     def __init__(self, *, usage: float = 0, limit: float = 100) -> None:
         self.usage = usage
         self.limit = limit
-        self.added_points = []
-
-    async def get_user_usage(self, person: Person) -> float:
-        return self.usage
+        self.settlements = []
 
     async def get_user_usage_limit(self, person: Person) -> float:
         return self.limit
 
-    async def add_usage_points(self, person: Person, points: float) -> None:
-        self.added_points.append({"person": person, "points": points})
+    async def reserve_usage(self, person: Person, points: float) -> bool:
+        if self.usage + points >= self.limit:
+            return False
+        self.usage += points
+        return True
 
+    async def settle_usage(
+        self, person: Person, reserved_points: float, actual_points: float
+    ) -> None:
+        self.usage += actual_points - reserved_points
+        self.settlements.append(
+            {"person": person, "reserved": reserved_points, "actual": actual_points}
+        )
 
-class FakeUserFacts:
+
+class FakeAutofactJobs:
     def __init__(self) -> None:
-        self.facts = []
+        self.jobs = []
 
-    async def add_fact(
+    async def enqueue(
         self,
         *,
         context: Context,
-        facts_user_handle: str,
-        fact: str,
-        created_by: str,
+        person: Person,
+        user_message: str,
+        bot_response: str,
     ) -> None:
-        self.facts.append(
+        self.jobs.append(
             {
                 "context": context,
-                "facts_user_handle": facts_user_handle,
-                "fact": fact,
-                "created_by": created_by,
+                "person": person,
+                "user_message": user_message,
+                "bot_response": bot_response,
             }
         )
 
 
+class FakeMemoryManager:
+    def __init__(self) -> None:
+        self.summary_updates = []
+
+    def schedule_summary_update(self, context) -> None:
+        self.summary_updates.append(context.chat_id)
+
+
 class FakeModelsToolkit:
     def __init__(self, *, estimated_price: float = 1) -> None:
         self.estimated_price = estimated_price
@@ -128,17 +150,17 @@ def build_handler(
         ),
         dialogs=FakeDialogs(),
         user_usage=FakeUserUsage(usage=usage, limit=limit),
-        user_facts=FakeUserFacts(),
+        autofact_jobs=FakeAutofactJobs(),
     )
     return MessageHandler(
         db=db,
         models_toolkit=FakeModelsToolkit(estimated_price=estimated_price),
         localizer=None,
         prompt_manager=None,
-        memory_manager=None,
+        memory_manager=FakeMemoryManager(),
         auth=None,
         bot_config=SimpleNamespace(
-            message_storage=SimpleNamespace(mode=message_storage_mode)
+            message_storage=SimpleNamespace(mode=message_storage_mode),
         ),
         logger=getLogger("test-message-handler"),
     )
@@ -187,7 +209,7 @@ async def test_stream_get_response_saves_context_without_ai_when_not_mentioned(p
     saved_message = handler.db.dialogs.messages[0]
     assert saved_message["person"] == person
     assert saved_message["transcribed_message"].message_text == "hello"
-    assert handler.db.user_usage.added_points == []
+    assert handler.db.user_usage.settlements == []
 
 
 @pytest.mark.asyncio
@@ -201,7 +223,7 @@ async def test_stream_get_response_skips_context_persistence_in_ephemeral_mode(p
 
     assert responses == []
     assert handler.db.dialogs.messages == []
-    assert handler.db.user_usage.added_points == []
+    assert handler.db.user_usage.settlements == []
 
 
 @pytest.mark.asyncio
@@ -214,11 +236,11 @@ async def test_stream_get_response_blocks_when_usage_limit_would_be_exceeded(per
     assert responses[0].text == "usage_limit_exceeded"
     assert responses[0].kwargs == {"user_handle": "@ada", "usage_limit": 10}
     assert handler.db.dialogs.messages == []
-    assert handler.db.user_usage.added_points == []
+    assert handler.db.user_usage.settlements == []
 
 
 @pytest.mark.asyncio
-async def test_stream_get_response_records_dialog_usage_and_facts_after_agent_response(
+async def test_stream_get_response_records_dialog_usage_and_autofact_job_after_agent_response(
     monkeypatch,
     person,
 ):
@@ -236,9 +258,6 @@ async def test_stream_get_response_records_dialog_usage_and_facts_after_agent_re
                 ),
                 image_description="Generated image",
                 audio_description="Generated audio",
-                generated_facts=[
-                    ChatFact(user_handle="@ada", user_fact="Ada likes tests.")
-                ],
             )
 
     monkeypatch.setattr(
@@ -252,7 +271,11 @@ async def test_stream_get_response_records_dialog_usage_and_facts_after_agent_re
     assert len(responses) == 1
     assert responses[0].text == "streaming_message_response"
     assert responses[0].kwargs == {"response_text": "Bot reply"}
-    assert handler.db.user_usage.added_points == [{"person": person, "points": 3.5}]
+    assert handler.db.chats.settings_reads == 1
+    assert handler.db.user_usage.settlements == [
+        {"person": person, "reserved": 1, "actual": 3.5}
+    ]
+    assert handler.db.user_usage.usage == 3.5
     assert len(handler.db.dialogs.messages) == 2
     assert handler.db.dialogs.messages[0]["person"] == person
     assert (
@@ -264,18 +287,19 @@ async def test_stream_get_response_records_dialog_usage_and_facts_after_agent_re
         handler.db.dialogs.messages[1]["transcribed_message"].message_text
         == "Bot reply"
     )
-    assert handler.db.user_facts.facts == [
+    assert handler.memory_manager.summary_updates == [100]
+    assert handler.db.autofact_jobs.jobs == [
         {
             "context": context(is_bot_mentioned=True),
-            "facts_user_handle": "@ada",
-            "fact": "Ada likes tests.",
-            "created_by": "autofact",
+            "person": person,
+            "user_message": "User transcript",
+            "bot_response": "Bot reply",
         }
     ]
 
 
 @pytest.mark.asyncio
-async def test_stream_get_response_keeps_usage_and_facts_without_persisted_dialogs(
+async def test_stream_get_response_keeps_usage_and_autofact_job_without_persisted_dialogs(
     monkeypatch,
     person,
 ):
@@ -291,9 +315,6 @@ async def test_stream_get_response_keeps_usage_and_facts_without_persisted_dialo
                     message_text="User transcript",
                     timestamp=datetime(2026, 7, 24),
                 ),
-                generated_facts=[
-                    ChatFact(user_handle="@ada", user_fact="Ada likes tests.")
-                ],
             )
 
     monkeypatch.setattr(
@@ -310,12 +331,148 @@ async def test_stream_get_response_keeps_usage_and_facts_without_persisted_dialo
     assert len(responses) == 1
     assert responses[0].text == "streaming_message_response"
     assert handler.db.dialogs.messages == []
-    assert handler.db.user_usage.added_points == [{"person": person, "points": 3.5}]
-    assert handler.db.user_facts.facts == [
+    assert handler.db.user_usage.settlements == [
+        {"person": person, "reserved": 1, "actual": 3.5}
+    ]
+    assert handler.db.user_usage.usage == 3.5
+    assert handler.db.autofact_jobs.jobs == [
         {
             "context": context(is_bot_mentioned=True),
-            "facts_user_handle": "@ada",
-            "fact": "Ada likes tests.",
-            "created_by": "autofact",
+            "person": person,
+            "user_message": "User transcript",
+            "bot_response": "Bot reply",
         }
     ]
+
+
+@pytest.mark.asyncio
+async def test_stream_get_response_releases_reservation_when_agent_fails(
+    monkeypatch,
+    person,
+):
+    class FailingAIAgent:
+        def __init__(self, **kwargs) -> None:
+            pass
+
+        async def astream(self):
+            raise RuntimeError("model unavailable")
+            yield
+
+    monkeypatch.setattr(
+        "bot.rp_bot.messages.message_handler.AIAgent",
+        FailingAIAgent,
+    )
+    handler = build_handler(usage=5, limit=10, estimated_price=2)
+
+    with pytest.raises(RuntimeError):
+        await collect_stream(handler, person, context(is_bot_mentioned=True))
+
+    assert handler.db.user_usage.settlements == [
+        {"person": person, "reserved": 2, "actual": 0}
+    ]
+    assert handler.db.user_usage.usage == 5
+
+
+@pytest.mark.asyncio
+async def test_burst_gets_one_engage_decision_and_one_reply(monkeypatch, person):
+    agents = []
+
+    class FakeAIAgent:
+        def __init__(self, **kwargs) -> None:
+            agents.append(
+                (kwargs["message"].message_text, kwargs["exclude_message_ids"])
+            )
+
+        async def astream(self):
+            yield AIAgentStreamingResponse(total_text="Bot reply", total_price=1)
+
+    monkeypatch.setattr("bot.rp_bot.messages.message_handler.AIAgent", FakeAIAgent)
+    handler = build_handler(conversation_tracker_enabled=True, autoengage_enabled=True)
+    handler.engage_debouncer.quiet_seconds = 0.01
+    engage_questions = []
+
+    async def compose_engage_needed_prompt(**kwargs):
+        return kwargs["user_transcribed_message"].message_text
+
+    async def ask_yes_no_question(question):
+        engage_questions.append(question)
+        return True
+
+    handler.prompt_manager = SimpleNamespace(
+        compose_engage_needed_prompt=compose_engage_needed_prompt
+    )
+    handler.models_toolkit.text_model = SimpleNamespace(
+        async_ask_yes_no_question=ask_yes_no_question
+    )
+
+    async def send(text: str):
+        message = Message(message_text=text, timestamp=datetime(2026, 7, 24))
+        return [
+            response
+            async for response in handler.stream_get_response(
+                person=person,
+                context=context(is_bot_mentioned=False),
+                message=message,
+                args=[],
+            )
+        ]
+
+    results = await asyncio.gather(
+        send("hello everyone"),
+        send("so about the trip"),
+        send("what do you think about it?"),
+    )
+
+    assert [len(responses) for responses in results] == [0, 0, 1]
+    # The last message was persisted for the burst, so the agent reads it as
+    # the user input and not a second time as history
+    last_message_id = handler.db.dialogs.messages[2]["id"]
+    assert agents == [("what do you think about it?", [last_message_id])]
+    assert handler.engage_cascade.get_stats()["total"] == 1
+    assert engage_questions == [
+        "hello everyone\nso about the trip\nwhat do you think about it?"
+    ]
+    persisted = [
+        (message["person"], message["transcribed_message"].message_text)
+        for message in handler.db.dialogs.messages
+    ]
+    assert persisted == [
+        (person, "hello everyone"),
+        (person, "so about the trip"),
+        (person, "what do you think about it?"),
+        ("bot", "Bot reply"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_engage_question_covers_the_whole_burst(person):
+    prompts = []
+
+    class FakePromptManager:
+        async def compose_engage_needed_prompt(self, **kwargs):
+            prompts.append(kwargs)
+            return "prompt"
+
+    handler = build_handler()
+    handler.prompt_manager = FakePromptManager()
+    burst_ids = [ObjectId(), ObjectId()]
+
+    await handler.ask_engage_needed(
+        person,
+        context(is_bot_mentioned=False),
+        Message(message_text="so?", timestamp=datetime(2026, 7, 24)),
+        engage_text="about the trip\nso?",
+        exclude_message_ids=burst_ids,
+    )
+
+    (prompt_kwargs,) = prompts
+    assert (
+        prompt_kwargs["user_transcribed_message"].message_text == "about the trip\nso?"
+    )
+    assert prompt_kwargs["exclude_message_ids"] == burst_ids
+
+
+def test_agent_config_defaults_when_bot_config_has_none():
+    handler = build_handler()
+
+    assert handler.agent_config == AgentConfig()
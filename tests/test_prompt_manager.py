@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from bot.models.config.bot_config import MemoryConfig
+from bot.models.handlers_input import Context, Person, TranscribedMessage
+from bot.rp_bot.memory_manager import MemoryManager
+from bot.rp_bot.prompt_manager import PromptManager
+from bot.rp_bot.storage import DialogMessageRecord
+
+
+def build_record(text: str) -> DialogMessageRecord:
+    return DialogMessageRecord(
+        id=ObjectId(),
+        user_handle="@ada",
+        is_bot=False,
+        message=TranscribedMessage(
+            message_text=text, timestamp=datetime(2026, 7, 24, 12, 0, 0)
+        ),
+    )
+
+
+class FakeDialogs:
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.records = []
+
+    async def get_message_records(self, context):
+        return self.records[-self.window :]
+
+
+@pytest.mark.asyncio
+async def test_chat_history_renders_only_new_messages():
+    dialogs = FakeDialogs(window=3)
+    prompt_manager = PromptManager(SimpleNamespace(dialogs=dialogs))
+    rendered = []
+    compose_line = prompt_manager._compose_message_history_prompt
+
+    def counting_compose(message_tuple):
+        rendered.append(message_tuple[2].message_text)
+        return compose_line(message_tuple)
+
+    prompt_manager._compose_message_history_prompt = counting_compose
+    context = Context(chat_id=1)
+
+    for i in range(5):
+        dialogs.records.append(build_record(f"message {i}"))
+        prompt = await prompt_manager._compose_chat_history_prompt("", context)
+
+    assert rendered == ["message 0", "message 1", "message 2", "message 3"]
+    assert prompt == (
+        "The conversation so far:\n"
+        "@ada (2026-07-24 12:00:00 UTC): message 2\n"
+        "@ada (2026-07-24 12:00:00 UTC): message 3\n\n"
+    )
+    assert len(prompt_manager.rendered_history.get((1, None))) == 2
+
+
+@pytest.mark.asyncio
+async def test_turn_reads_leave_out_the_persisted_user_message():
+    dialogs = FakeDialogs(window=3)
+    dialogs.records = [build_record("earlier"), build_record("current")]
+    prompt_manager = PromptManager(SimpleNamespace(dialogs=dialogs))
+    reads = prompt_manager.new_turn_reads(
+        Context(chat_id=1), exclude_message_ids=[dialogs.records[-1].id]
+    )
+
+    records = await reads.get_message_records()
+
+    assert [record.message.message_text for record in records] == ["earlier"]
+
+
+class ReadTracker:
+    def __init__(self) -> None:
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def read(self, name: str, result):
+        self.calls.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return result
+
+
+def build_tracked_db(tracker: ReadTracker) -> SimpleNamespace:
+    chat_mode = SimpleNamespace(mode_name="mode", mode_description="description")
+    return SimpleNamespace(
+        chat_modes=SimpleNamespace(
+            get_chat_mode=lambda context: tracker.read("chat_mode", chat_mode)
+        ),
+        chats=SimpleNamespace(
+            get_language=lambda context: tracker.read("language", "english")
+        ),
+        dialogs=SimpleNamespace(
+            get_message_records=lambda context: tracker.read("dialogs", [])
+        ),
+        user_facts=SimpleNamespace(
+            get_chat_facts=lambda context: tracker.read("chat_facts", []),
+            get_user_facts=lambda context, person: tracker.read("user_facts", []),
+        ),
+        user_introductions=SimpleNamespace(
+            get_user_introduction=lambda context, person: tracker.read(
+                "introduction", "hi"
+            )
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_turn_prompts_share_reads_and_issue_them_concurrently():
+    tracker = ReadTracker()
+    db = build_tracked_db(tracker)
+    prompt_manager = PromptManager(db)
+    memory_manager = MemoryManager(
+        db,
+        prompt_manager,
+        MemoryConfig(enabled=True, strategy="expanded_prompt"),
+    )
+    person = Person(telegram_id=1, user_handle="@ada")
+    context = Context(chat_id=1)
+    reads = prompt_manager.new_turn_reads(context, person)
+
+    prepared, _ = await asyncio.gather(
+        memory_manager.prepare_context(
+            initiator=person,
+            context=context,
+            user_transcribed_message=TranscribedMessage(
+                message_text="hello", timestamp=datetime(2026, 7, 24)
+            ),
+            reads=reads,
+        ),
+        prompt_manager.get_reply_system_prompt(context, reads=reads),
+    )
+
+    assert prepared.scope_key
+    assert sorted(tracker.calls) == [
+        "chat_facts",
+        "chat_mode",
+        "dialogs",
+        "introduction",
+        "language",
+        "user_facts",
+    ]
+    assert tracker.max_in_flight == len(tracker.calls)
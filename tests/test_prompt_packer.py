@@ -0,0 +1,112 @@
+import math
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from bot.rp_bot import prompt_packer
+from bot.rp_bot.prompt_packer import (
+    PromptPacker,
+    PromptSection,
+    count_tokens,
+    warm_up_encoding,
+)
+
+
+def test_packer_keeps_required_sections_and_cuts_lowest_priority_first():
+    facts = [f"fact number {i}" for i in range(10)]
+    budget = count_tokens("current message") + sum(
+        count_tokens(fact) + 1 for fact in facts[:4]
+    )
+    packed = PromptPacker(budget).pack(
+        [
+            PromptSection(name="user_input", header="current message", required=True),
+            PromptSection(name="history", lines=facts, keep="last"),
+            PromptSection(name="introduction", lines=["hello there"]),
+        ]
+    )
+
+    assert packed["user_input"] == "current message"
+    assert packed["history"] == "\n".join(facts[-4:])
+    assert packed["introduction"] == ""
+
+
+def test_packer_drops_section_when_header_does_not_fit():
+    packed = PromptPacker(token_budget=1).pack(
+        [
+            PromptSection(
+                name="chat_facts",
+                header="The following facts are known:\n",
+                lines=["a"],
+                keep="first",
+            )
+        ]
+    )
+
+    assert packed == {"chat_facts": ""}
+
+
+def test_unordered_section_skips_a_line_too_long_for_the_budget():
+    lines = ["short one", "a much longer line " * 20, "short two"]
+    budget = sum(count_tokens(line) + 1 for line in [lines[0], lines[2]])
+
+    packed = PromptPacker(budget).pack(
+        [PromptSection(name="facts", lines=lines, keep="first", ordered=False)]
+    )
+
+    assert packed["facts"] == "short one\nshort two"
+
+
+def test_ordered_section_stops_at_the_first_line_that_does_not_fit():
+    lines = ["question", "a much longer line " * 20, "answer"]
+    budget = sum(count_tokens(line) + 1 for line in [lines[0], lines[2]])
+
+    packed = PromptPacker(budget).pack(
+        [PromptSection(name="history", lines=lines, keep="last")]
+    )
+
+    assert packed["history"] == "answer"
+
+
+def test_section_without_any_fitting_line_leaves_out_its_header():
+    packed = PromptPacker(token_budget=20).pack(
+        [
+            PromptSection(
+                name="history",
+                header="The conversation so far:\n",
+                lines=["a much longer line " * 20],
+            ),
+            PromptSection(name="introduction", lines=["hello"]),
+        ]
+    )
+
+    assert packed == {"history": "", "introduction": "hello"}
+
+
+@pytest.mark.asyncio
+async def test_encoding_is_loaded_off_the_event_loop_and_retried(monkeypatch):
+    loads_on_main_thread = []
+
+    class FakeTiktoken:
+        def get_encoding(self, name):
+            loads_on_main_thread.append(
+                threading.current_thread() is threading.main_thread()
+            )
+            if len(loads_on_main_thread) == 1:
+                raise OSError("offline")
+            return SimpleNamespace(encode=lambda text, **kwargs: text.split())
+
+    monkeypatch.setattr(prompt_packer, "tiktoken", FakeTiktoken())
+    monkeypatch.setattr(prompt_packer, "_encoding", None)
+    monkeypatch.setattr(prompt_packer, "_next_load_attempt", 0.0)
+    monkeypatch.setattr(prompt_packer, "_load_task", None)
+
+    assert not await warm_up_encoding()
+    # The failed load is not retried before the cooldown, counts are estimated
+    assert count_tokens("one two three") == math.ceil(len("one two three") / 4)
+    monkeypatch.setattr(prompt_packer, "_next_load_attempt", 0.0)
+    count_tokens("one two three")
+    await prompt_packer._load_task
+
+    assert count_tokens("one two three") == 3
+    assert loads_on_main_thread == [False, False]
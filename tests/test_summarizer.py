@@ -0,0 +1,169 @@
+from datetime import datetime
+from logging import getLogger
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from bot.models.config.bot_config import MemoryConfig
+from bot.models.handlers_input import Context, Person, TranscribedMessage
+from bot.rp_bot.prompt_manager import PromptManager
+from bot.rp_bot.storage import DialogMessageRecord
+from bot.rp_bot.summarizer import ConversationSummarizer, ConversationSummary
+
+
+class FakeChats:
+    def __init__(self) -> None:
+        self.scopes = {}
+
+    async def get_memory_scope(self, context, scope_key):
+        return dict(self.scopes.get(scope_key, {}))
+
+    async def update_memory_scope(self, context, scope_key, fields):
+        self.scopes.setdefault(scope_key, {}).update(fields)
+
+
+class FakeTextModel:
+    def __init__(self) -> None:
+        self.prompts = []
+
+    async def arun(self, system_prompt, pydantic_model, user_input):
+        self.prompts.append(user_input)
+        return ConversationSummary(summary=f"summary {len(self.prompts)}")
+
+
+def build_record(text: str, thread_id=None) -> DialogMessageRecord:
+    return DialogMessageRecord(
+        id=ObjectId(),
+        user_handle="@ada",
+        is_bot=False,
+        message=TranscribedMessage(
+            message_text=text, timestamp=datetime(2026, 7, 24, 12, 0, 0)
+        ),
+        thread_id=thread_id,
+    )
+
+
+def build_summarizer(records: list, window: int = 10) -> ConversationSummarizer:
+    async def get_message_records(context):
+        return list(records[-window:])
+
+    async def get_message_records_after(context, after_id, limit):
+        thread = [record for record in records if record.thread_id == context.thread_id]
+        if after_id is None:
+            return thread[-limit:]
+        return [record for record in thread if record.id > after_id][:limit]
+
+    async def get_chat_mode(context):
+        return SimpleNamespace(mode_name="mode.v2", mode_description="description")
+
+    async def get_facts(*args):
+        return []
+
+    async def get_user_introduction(context, person):
+        return "hi"
+
+    db = SimpleNamespace(
+        chats=FakeChats(),
+        chat_modes=SimpleNamespace(get_chat_mode=get_chat_mode),
+        dialogs=SimpleNamespace(
+            get_message_records=get_message_records,
+            get_message_records_after=get_message_records_after,
+        ),
+        user_facts=SimpleNamespace(
+            get_chat_facts=get_facts, get_user_facts=get_facts
+        ),
+        user_introductions=SimpleNamespace(
+            get_user_introduction=get_user_introduction
+        ),
+    )
+    memory_config = MemoryConfig(summary_enabled=True, fallback_last_n_messages=2)
+    return ConversationSummarizer(
+        db=db,
+        prompt_manager=PromptManager(db, memory_config=memory_config),
+        models_toolkit=SimpleNamespace(text_model=FakeTextModel()),
+        memory_config=memory_config,
+        logger=getLogger("test-summarizer"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_summary_folds_only_messages_that_left_the_tail():
+    records = [build_record(f"message {i}") for i in range(5)]
+    summarizer = build_summarizer(records)
+    context = Context(chat_id=1)
+    text_model = summarizer.models_toolkit.text_model
+
+    assert await summarizer.update_summary(context) is True
+    assert await summarizer.update_summary(context) is False
+    records.append(build_record("message 5"))
+    assert await summarizer.update_summary(context) is True
+
+    assert len(text_model.prompts) == 2
+    assert "message 2" in text_model.prompts[0]
+    assert "message 3" not in text_model.prompts[0]
+    assert "summary 1" in text_model.prompts[1]
+    assert "message 3" in text_model.prompts[1]
+    assert "message 2" not in text_model.prompts[1]
+    (scope,) = summarizer.db.chats.scopes.values()
+    assert scope["summary"] == "summary 2"
+    assert scope["summarized_until_id"] == records[3].id
+
+
+@pytest.mark.asyncio
+async def test_prompt_sends_summary_and_unsummarized_tail():
+    records = [build_record(f"message {i}") for i in range(5)]
+    summarizer = build_summarizer(records)
+    context = Context(chat_id=1)
+    await summarizer.update_summary(context)
+
+    prompt = await summarizer.prompt_manager.compose_prompt(
+        initiator=Person(telegram_id=1, user_handle="@ada"),
+        context=context,
+        user_transcribed_message=records[-1].message,
+    )
+
+    assert "Summary of the earlier conversation:\nsummary 1" in prompt
+    assert "): message 2" not in prompt
+    assert "): message 3" in prompt
+
+
+@pytest.mark.asyncio
+async def test_summary_covers_only_its_thread_and_is_stored_under_a_safe_key():
+    records = [build_record(f"message {i}", thread_id=7) for i in range(5)]
+    records.insert(1, build_record("other thread"))
+    summarizer = build_summarizer(records)
+    context = Context(chat_id=1, thread_id=7)
+    await summarizer.update_summary(context)
+
+    prompt = await summarizer.prompt_manager.compose_prompt(
+        initiator=Person(telegram_id=1, user_handle="@ada"),
+        context=context,
+        user_transcribed_message=records[-1].message,
+    )
+
+    (summary_prompt,) = summarizer.models_toolkit.text_model.prompts
+    assert "other thread" not in summary_prompt
+    assert "message 2" in summary_prompt
+    # A message of another thread is not in the summary, so it stays verbatim
+    assert "): other thread" in prompt
+    assert "): message 2" not in prompt
+    assert list(summarizer.db.chats.scopes) == ["chat:1:thread:7:mode:mode%2Ev2"]
+
+
+@pytest.mark.asyncio
+async def test_messages_that_left_the_window_between_updates_are_folded():
+    records = [build_record(f"message {i}") for i in range(5)]
+    summarizer = build_summarizer(records, window=4)
+    context = Context(chat_id=1)
+    text_model = summarizer.models_toolkit.text_model
+    await summarizer.update_summary(context)
+
+    # A busy chat moves well past the prompt window before the next update
+    records.extend(build_record(f"message {i}") for i in range(5, 15))
+    await summarizer.update_summary(context)
+
+    for i in range(3, 13):
+        assert f"message {i}" in text_model.prompts[1]
+    (scope,) = summarizer.db.chats.scopes.values()
+    assert scope["summarized_until_id"] == records[12].id
@@ -1,15 +1,128 @@
-from bot.telegram.utils import min_char_diff_for_buffering
+import io
+from datetime import datetime
+from types import SimpleNamespace
 
+import pytest
 
-def test_min_char_diff_for_buffering_private_chat_thresholds():
-    assert min_char_diff_for_buffering("x" * 10, is_group_chat=False) == 15
-    assert min_char_diff_for_buffering("x" * 51, is_group_chat=False) == 25
-    assert min_char_diff_for_buffering("x" * 201, is_group_chat=False) == 45
-    assert min_char_diff_for_buffering("x" * 1001, is_group_chat=False) == 90
+from bot.models.cache import TTLCache
+from bot.telegram.media import downscale_image, select_photo_size
+from bot.telegram.utils import (
+    get_message,
+    is_admin_change,
+    is_group_admin,
+)
 
 
-def test_min_char_diff_for_buffering_group_chat_thresholds():
-    assert min_char_diff_for_buffering("x" * 10, is_group_chat=True) == 50
-    assert min_char_diff_for_buffering("x" * 121, is_group_chat=True) == 90
-    assert min_char_diff_for_buffering("x" * 201, is_group_chat=True) == 120
-    assert min_char_diff_for_buffering("x" * 1001, is_group_chat=True) == 180
+class FakeTelegramBot:
+    def __init__(self, admin_ids):
+        self.admin_ids = admin_ids
+        self.admin_lookups = 0
+
+    async def get_chat_administrators(self, chat_id):
+        self.admin_lookups += 1
+        return [SimpleNamespace(user=SimpleNamespace(id=i)) for i in self.admin_ids]
+
+
+def group_update(user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=100, type="supergroup"),
+        effective_user=SimpleNamespace(id=user_id),
+    )
+
+
+@pytest.mark.asyncio
+async def test_is_group_admin_reuses_cached_administrators():
+    telegram_context = SimpleNamespace(bot=FakeTelegramBot(admin_ids=[1]))
+    admin_cache = TTLCache(max_size=10, ttl_seconds=60)
+
+    assert await is_group_admin(group_update(1), telegram_context, admin_cache)
+    assert not await is_group_admin(group_update(2), telegram_context, admin_cache)
+    assert telegram_context.bot.admin_lookups == 1
+
+
+def test_is_admin_change_detects_promotions_only():
+    def member_update(old_status: str, new_status: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            chat_member=SimpleNamespace(
+                old_chat_member=SimpleNamespace(status=old_status),
+                new_chat_member=SimpleNamespace(status=new_status),
+            ),
+            my_chat_member=None,
+        )
+
+    assert is_admin_change(member_update("member", "administrator"))
+    assert is_admin_change(member_update("creator", "left"))
+    assert not is_admin_change(member_update("member", "left"))
+
+
+class FakeTelegramFile:
+    async def download_as_bytearray(self):
+        return bytearray(b"voice")
+
+
+class FakeFileBot:
+    def __init__(self) -> None:
+        self.downloads = []
+
+    async def getFile(self, file_id):
+        self.downloads.append(file_id)
+        return FakeTelegramFile()
+
+
+@pytest.mark.asyncio
+async def test_get_message_downloads_media_only_when_loaded():
+    telegram_context = SimpleNamespace(bot=FakeFileBot())
+    telegram_context.bot.username = "rp_bot"
+    voice = SimpleNamespace(
+        file_id="voice-id", file_unique_id="voice-unique", file_size=5, duration=2
+    )
+    update = SimpleNamespace(
+        callback_query=None,
+        message=SimpleNamespace(
+            text=None,
+            date=datetime(2026, 7, 24),
+            chat=SimpleNamespace(type="private"),
+            reply_to_message=None,
+            photo=[],
+            voice=voice,
+        ),
+    )
+
+    message = await get_message(update, telegram_context)
+
+    assert telegram_context.bot.downloads == []
+    assert message.in_file_audio.file_unique_id == "voice-unique"
+    assert message.in_file_audio.duration == 2
+    content = await message.in_file_audio.load()
+    await message.in_file_audio.load()
+    assert content.read() == b"voice"
+    assert content.name == "audio.wav"
+    assert telegram_context.bot.downloads == ["voice-id"]
+
+
+def test_select_photo_size_picks_smallest_size_meeting_the_budget():
+    photo_sizes = [
+        SimpleNamespace(width=90, height=60),
+        SimpleNamespace(width=800, height=600),
+        SimpleNamespace(width=1280, height=960),
+        SimpleNamespace(width=2560, height=1920),
+    ]
+
+    assert select_photo_size(photo_sizes, 1024 * 1024).width == 1280
+    assert select_photo_size(photo_sizes, 400 * 300).width == 800
+    # The default budget skips the 1280px size Telegram sends for most photos
+    assert select_photo_size(photo_sizes, 512 * 512).width == 800
+    assert select_photo_size(photo_sizes, 4096 * 4096).width == 2560
+    assert select_photo_size(photo_sizes).width == 2560
+
+
+def test_downscale_image_fits_the_pixel_budget():
+    image_module = pytest.importorskip("PIL.Image")
+    content = io.BytesIO()
+    image_module.new("RGB", (1280, 960)).save(content, format="JPEG")
+
+    downscaled = downscale_image(content, pixel_budget=640 * 480, jpeg_quality=85)
+
+    with image_module.open(downscaled) as image:
+        assert image.size == (640, 480)
+    assert downscaled.name == "image.jpg"
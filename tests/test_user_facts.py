@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.models.handlers_input import Context, Person
+from bot.rp_bot.db_models.user_facts import UserFacts
+
+
+class FakeCursor:
+    def __init__(self, documents: list) -> None:
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return [dict(document) for document in self.documents]
+
+
+class FakeUserFactsCollection:
+    def __init__(self) -> None:
+        self.documents = []
+        self.find_calls = 0
+
+    def find(self, filters, projection=None):
+        self.find_calls += 1
+        return FakeCursor(
+            [doc for doc in self.documents if doc["chat_id"] == filters["chat_id"]]
+        )
+
+    async def update_one(self, filters, update, upsert=False):
+        for doc in self.documents:
+            if all(doc.get(key) == value for key, value in filters.items()):
+                break
+        else:
+            doc = dict(update["$setOnInsert"], facts=[])
+            self.documents.append(doc)
+        doc.update(update.get("$set", {}))
+        doc["facts"] = doc["facts"] + [update["$push"]["facts"]]
+
+    async def delete_many(self, filters):
+        self.documents = [
+            doc
+            for doc in self.documents
+            if doc["user_handle"] != filters["user_handle"]
+        ]
+
+
+def build_user_facts() -> UserFacts:
+    return UserFacts(SimpleNamespace(user_facts=FakeUserFactsCollection()))
+
+
+@pytest.mark.asyncio
+async def test_fact_reads_share_one_snapshot_per_chat():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    person = Person(telegram_id=1, user_handle="@ada")
+    await user_facts.add_fact(context, "@ada", "likes tea", person=person)
+
+    assert await user_facts.get_chat_facts(context) == [("@ada", "likes tea")]
+    assert await user_facts.get_user_facts(context, person) == ["likes tea"]
+    assert await user_facts.get_facts_for_user_handle(context, "@ada") == [
+        "likes tea"
+    ]
+    assert user_facts.user_facts.find_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_fact_writes_invalidate_snapshot():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    person = Person(telegram_id=1, user_handle="@ada")
+
+    assert await user_facts.get_chat_facts(context) == []
+    await user_facts.add_fact(context, "@ada", "likes tea", person=person)
+    assert await user_facts.get_chat_facts(context) == [("@ada", "likes tea")]
+    await user_facts.clear_user_data("@ada")
+    assert await user_facts.get_chat_facts(context) == []
+    assert user_facts.user_facts.find_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_read_and_get_copies():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    person = Person(telegram_id=1, user_handle="@ada")
+    await user_facts.add_fact(context, "@ada", "likes tea", person=person)
+
+    first, second = await asyncio.gather(
+        user_facts.get_user_facts(context, person),
+        user_facts.get_user_facts(context, person),
+    )
+    first.append("changed by a caller")
+
+    assert user_facts.user_facts.find_calls == 1
+    assert second == ["likes tea"]
+    assert await user_facts.get_user_facts(context, person) == ["likes tea"]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_read_during_write_is_not_cached():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    collection = user_facts.user_facts
+    original_find = collection.find
+
+    def find_racing_with_write(filters, projection=None):
+        cursor = original_find(filters, projection)
+        user_facts._bump_chat_facts_version(context.chat_id)
+        return cursor
+
+    collection.find = find_racing_with_write
+    await user_facts.get_chat_facts(context)
+    collection.find = original_find
+    await user_facts.get_chat_facts(context)
+
+    assert collection.find_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_search_chat_facts_ranks_and_limits_results():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    ada = Person(telegram_id=1, user_handle="@ada")
+    bob = Person(telegram_id=2, user_handle="@bob")
+    await user_facts.add_fact(context, "@ada", "likes green tea", person=ada)
+    await user_facts.add_fact(context, "@ada", "owns a cat (Tea)", person=ada)
+    await user_facts.add_fact(
+        context, "@bob", "drinks tea, tea and only tea", person=bob
+    )
+    await user_facts.add_fact(context, "@bob", "plays chess", person=bob)
+
+    results = await user_facts.search_chat_facts(context, query="tea (", limit=2)
+    assert results == ["@bob: drinks tea, tea and only tea", "@ada: likes green tea"]
+
+    results = await user_facts.search_chat_facts(
+        context, query="tea", participant_key="telegram:1", limit=5
+    )
+    assert results == ["@ada: likes green tea", "@ada: owns a cat (Tea)"]
+    assert await user_facts.search_chat_facts(context, query="[", limit=5) == []
+    assert user_facts.user_facts.find_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_search_chat_facts_without_query_respects_limit():
+    user_facts = build_user_facts()
+    context = Context(chat_id=1)
+    ada = Person(telegram_id=1, user_handle="@ada")
+    for fact in ["likes green tea", "owns a cat", "plays chess"]:
+        await user_facts.add_fact(context, "@ada", fact, person=ada)
+
+    assert await user_facts.search_chat_facts(context, limit=2) == [
+        "@ada: owns a cat",
+        "@ada: plays chess",
+    ]
+    assert await user_facts.search_chat_facts(context, limit=0) == []
+    assert await user_facts.search_chat_facts(context, limit=-1) == []
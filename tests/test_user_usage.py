@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from bot.models.handlers_input import Context, Person
+from bot.rp_bot.db_models.user_usage import UserUsage
+
+
+class FakeUserUsageCollection:
+    def __init__(self) -> None:
+        self.updates = []
+
+    async def update_one(self, filters, update, upsert=False):
+        self.updates.append(update)
+
+
+@pytest.mark.asyncio
+async def test_usage_resets_on_utc_day_boundaries():
+    user_usage = UserUsage(SimpleNamespace(user_usage=FakeUserUsageCollection()), 10)
+
+    await user_usage.update_if_needed(
+        Person(telegram_id=1, user_handle="@ada"), Context(chat_id=1)
+    )
+
+    ((stage,),) = user_usage.user_usage.updates
+    last_reset = stage["$set"]["last_reset"]
+    assert last_reset.tzinfo == timezone.utc
+    assert last_reset.date() == datetime.now(timezone.utc).date()
+    assert (last_reset.hour, last_reset.minute) == (0, 0)
@@ -0,0 +1,62 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from bot.rp_bot.db_models.users import Users
+
+
+class FakeUsersCollection:
+    def __init__(self, document: dict) -> None:
+        self.document = document
+        self.find_one_calls = 0
+
+    async def find_one(self, filters, projection=None):
+        self.find_one_calls += 1
+        return dict(self.document)
+
+    async def update_one(self, filters, update, upsert=False):
+        self.document.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            self.document.pop(field, None)
+
+
+def build_users(document: dict) -> Users:
+    return Users(SimpleNamespace(users=FakeUsersCollection(document)))
+
+
+@pytest.mark.asyncio
+async def test_access_checks_share_one_cached_read():
+    users = build_users({"handle": "@ada", "accepted_terms": True})
+
+    assert await users.is_user_banned("@ada") is False
+    assert await users.has_declined_terms("@ada") is False
+    assert await users.has_accepted_terms("@ada") is True
+    assert users.users.find_one_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_ban_and_terms_changes_invalidate_access_state():
+    users = build_users({"handle": "@ada"})
+
+    assert await users.is_user_banned("@ada") is False
+    await users.ban_user("@ada", time_seconds=3600)
+    assert await users.is_user_banned("@ada") is True
+    await users.unban_user("@ada")
+    assert await users.is_user_banned("@ada") is False
+    await users.accept_terms("@ada")
+    assert await users.has_accepted_terms("@ada") is True
+    assert users.users.find_one_calls == 4
+
+
+@pytest.mark.asyncio
+async def test_expired_ban_is_not_enforced():
+    users = build_users(
+        {
+            "handle": "@ada",
+            "banned": True,
+            "banned_until": datetime.now().timestamp() - 1,
+        }
+    )
+
+    assert await users.is_user_banned("@ada") is False
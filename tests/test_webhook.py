@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+
+from bot.telegram.webhook import TelegramWebhookApp
+
+
+UPDATE = {
+    "update_id": 7,
+    "message": {
+        "message_id": 1,
+        "date": 1753358400,
+        "chat": {"id": 100, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Ada"},
+        "text": "hello",
+    },
+}
+
+
+async def post(app: TelegramWebhookApp, path: str, body: bytes, headers=()):
+    messages = [
+        {"type": "http.request", "body": body[:10], "more_body": True},
+        {"type": "http.request", "body": body[10:], "more_body": False},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    await app(scope, receive, send)
+    return sent[0]["status"]
+
+
+def build_app() -> TelegramWebhookApp:
+    application = ApplicationBuilder().token("123:TEST").build()
+    return TelegramWebhookApp(application, url_path="telegram", secret_token="s3cret")
+
+
+@pytest.mark.asyncio
+async def test_webhook_puts_posted_updates_on_the_update_queue():
+    app = build_app()
+
+    status = await post(
+        app,
+        "/telegram",
+        json.dumps(UPDATE).encode(),
+        headers=[(b"x-telegram-bot-api-secret-token", b"s3cret")],
+    )
+
+    assert status == 200
+    update = app.application.update_queue.get_nowait()
+    assert isinstance(update, Update)
+    assert update.update_id == 7
+    assert update.message.text == "hello"
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_wrong_secret_path_and_body():
+    app = build_app()
+    body = json.dumps(UPDATE).encode()
+    secret = [(b"x-telegram-bot-api-secret-token", b"s3cret")]
+
+    assert await post(app, "/telegram", body) == 403
+    assert await post(app, "/other", body, headers=secret) == 404
+    assert await post(app, "/telegram", b"not json at all", headers=secret) == 400
+    for body in (b"null", b"1", b"[]"):
+        assert await post(app, "/telegram", body, headers=secret) == 400
+    assert app.application.update_queue.empty()
+
+
+def test_webhook_requires_a_secret_token():
+    application = ApplicationBuilder().token("123:TEST").build()
+
+    with pytest.raises(ValueError):
+        TelegramWebhookApp(application, url_path="telegram", secret_token="")